@@ -0,0 +1,24 @@
+-- Esta consulta devolverá todas las categorías (en inglés) ordenadas de mayor a
+-- menor ingreso, con el número de pedidos y sus ingresos totales. La primera
+-- columna será Category; la segunda será Num_order, con el total de pedidos de
+-- cada categoría; y la última será Revenue, con el ingreso total de cada categoría.
+-- Las 10 categorías con mayores y con menores ingresos son los extremos de este
+-- orden. Un pedido cae en una sola fila de daily_item_rollup por categoría, así
+-- que sumar order_count cuenta los pedidos distintos.
+-- PISTA: Todos los pedidos deben tener un estado 'delivered' y tanto la categoría
+-- como la fecha real de entrega no deben ser nulas.
+
+SELECT 
+    product_category_name_english as Category,
+    SUM(order_count) as Num_order,
+    ROUND(SUM(revenue), 2) as Revenue
+FROM 
+    daily_item_rollup
+WHERE 
+    order_status = 'delivered'
+    AND delivered
+    AND product_category_name_english IS NOT NULL
+GROUP BY 
+    product_category_name_english
+ORDER BY 
+    Revenue DESC;
@@ -11,8 +11,7 @@
 
 SELECT 
     c.customer_state AS State,
-    ROUND(AVG(JULIANDAY(STRFTIME('%Y-%m-%d', o.order_delivered_customer_date)) - 
-              JULIANDAY(STRFTIME('%Y-%m-%d', o.order_estimated_delivery_date))), 2) AS Delivery_Difference
+    ROUND(AVG(o.delivery_difference_days), 2) AS Delivery_Difference
 FROM 
     olist_orders o
 JOIN 
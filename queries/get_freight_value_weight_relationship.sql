@@ -6,14 +6,11 @@
 -- entrega no debe ser nula.
 
 SELECT 
-    ROUND(SUM(p.product_weight_g), 2) as total_weight,
-    ROUND(SUM(oi.freight_value), 2) as freight_value
+    ROUND(SUM(product_weight_g), 2) as total_weight,
+    ROUND(SUM(freight_value), 2) as freight_value
 FROM 
-    olist_orders o
-    JOIN olist_order_items oi ON o.order_id = oi.order_id
-    JOIN olist_products p ON oi.product_id = p.product_id
+    delivered_order_items
 WHERE 
-    o.order_status = 'delivered'
-    AND o.order_delivered_customer_date IS NOT NULL
+    product_id IS NOT NULL
 GROUP BY 
-    o.order_id;
+    order_id;
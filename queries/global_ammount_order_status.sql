@@ -4,9 +4,9 @@
 
 SELECT 
     order_status as order_status,
-    COUNT(*) as Ammount
+    SUM(order_count) as Ammount
 FROM 
-    olist_orders
+    daily_order_rollup
 GROUP BY 
     order_status
 ORDER BY 
@@ -0,0 +1,22 @@
+-- Esta consulta devolverá una tabla con tres columnas: date, order_count y holiday.
+-- La primera contendrá cada día con pedidos entre :start_year y :end_year como
+-- milisegundos desde la época unix, la segunda el número de pedidos de ese día y
+-- la tercera si ese día es feriado según la tabla public_holidays.
+
+WITH Holidays AS (
+  SELECT DISTINCT date(date) as holiday_date
+  FROM public_holidays
+)
+SELECT 
+    strftime('%s', o.purchase_date) * 1000 as date,
+    COUNT(*) as order_count,
+    h.holiday_date IS NOT NULL as holiday
+FROM 
+    olist_orders o
+    LEFT JOIN Holidays h ON h.holiday_date = o.purchase_date
+WHERE 
+    o.purchase_year BETWEEN :start_year AND :end_year
+GROUP BY 
+    o.purchase_date
+ORDER BY 
+    date;
@@ -1,73 +1,26 @@
--- TODO: Esta consulta devolverá una tabla con las diferencias entre los tiempos 
--- reales y estimados de entrega por mes y año. Tendrá varias columnas: 
--- month_no, con los números de mes del 01 al 12; month, con las primeras 3 letras 
--- de cada mes (ej. Ene, Feb); Year2016_real_time, con el tiempo promedio de 
--- entrega real por mes de 2016 (NaN si no existe); Year2017_real_time, con el 
--- tiempo promedio de entrega real por mes de 2017 (NaN si no existe); 
--- Year2018_real_time, con el tiempo promedio de entrega real por mes de 2018 
--- (NaN si no existe); Year2016_estimated_time, con el tiempo promedio estimado 
--- de entrega por mes de 2016 (NaN si no existe); Year2017_estimated_time, con 
--- el tiempo promedio estimado de entrega por mes de 2017 (NaN si no existe); y 
--- Year2018_estimated_time, con el tiempo promedio estimado de entrega por mes 
--- de 2018 (NaN si no existe).
+-- Esta consulta devolverá los tiempos promedio de entrega reales y estimados por
+-- año y mes de compra, entre los años :start_year y :end_year. Tendrá las
+-- columnas year; month, con el número de mes del 1 al 12; real_time, con el
+-- tiempo promedio de entrega real en días; y estimated_time, con el tiempo
+-- promedio de entrega estimado en días. transform.pivot_years() la pivota a las
+-- columnas YearNNNN_real_time y YearNNNN_estimated_time de cada año.
 -- PISTAS:
 -- 1. Puedes usar la función julianday para convertir una fecha a un número.
 -- 2. order_status == 'delivered' AND order_delivered_customer_date IS NOT NULL
 -- 3. Considera tomar order_id distintos.
 
-WITH RECURSIVE months(month_no) AS (
-  SELECT '01'
-  UNION ALL
-  SELECT printf('%02d', CAST(month_no AS INTEGER) + 1)
-  FROM months
-  WHERE CAST(month_no AS INTEGER) < 12
-),
-MonthNames AS (
-  SELECT 
-    month_no,
-    CASE month_no
-      WHEN '01' THEN 'Ene'
-      WHEN '02' THEN 'Feb'
-      WHEN '03' THEN 'Mar'
-      WHEN '04' THEN 'Abr'
-      WHEN '05' THEN 'May'
-      WHEN '06' THEN 'Jun'
-      WHEN '07' THEN 'Jul'
-      WHEN '08' THEN 'Ago'
-      WHEN '09' THEN 'Sep'
-      WHEN '10' THEN 'Oct'
-      WHEN '11' THEN 'Nov'
-      WHEN '12' THEN 'Dic'
-    END as month
-  FROM months
-),
-DeliveryTimes AS (
-  SELECT 
-    strftime('%m', order_purchase_timestamp) as month_no,
-    strftime('%Y', order_purchase_timestamp) as year,
-    ROUND(AVG(JULIANDAY(order_delivered_customer_date) - JULIANDAY(order_purchase_timestamp)), 2) as real_time,
-    ROUND(AVG(JULIANDAY(order_estimated_delivery_date) - JULIANDAY(order_purchase_timestamp)), 2) as estimated_time
-  FROM 
-    olist_orders
-  WHERE 
-    order_status = 'delivered'
-    AND order_delivered_customer_date IS NOT NULL
-  GROUP BY 
-    strftime('%Y-%m', order_purchase_timestamp)
-)
-SELECT 
-  m.month_no,
-  m.month,
-  COALESCE(SUM(CASE WHEN d.year = '2016' THEN d.real_time END), NULL) as Year2016_real_time,
-  COALESCE(SUM(CASE WHEN d.year = '2017' THEN d.real_time END), NULL) as Year2017_real_time,
-  COALESCE(SUM(CASE WHEN d.year = '2018' THEN d.real_time END), NULL) as Year2018_real_time,
-  COALESCE(SUM(CASE WHEN d.year = '2016' THEN d.estimated_time END), NULL) as Year2016_estimated_time,
-  COALESCE(SUM(CASE WHEN d.year = '2017' THEN d.estimated_time END), NULL) as Year2017_estimated_time,
-  COALESCE(SUM(CASE WHEN d.year = '2018' THEN d.estimated_time END), NULL) as Year2018_estimated_time
-FROM 
-  MonthNames m
-  LEFT JOIN DeliveryTimes d ON m.month_no = d.month_no
-GROUP BY 
-  m.month_no
-ORDER BY 
-  m.month_no;
+SELECT
+  purchase_year as year,
+  purchase_month as month,
+  ROUND(AVG(order_delivered_customer_epoch - order_purchase_epoch) / 86400.0, 2) as real_time,
+  ROUND(AVG(order_estimated_delivery_epoch - order_purchase_epoch) / 86400.0, 2) as estimated_time
+FROM
+  olist_orders
+WHERE
+  order_status = 'delivered'
+  AND order_delivered_customer_date IS NOT NULL
+  AND purchase_year BETWEEN :start_year AND :end_year
+GROUP BY
+  purchase_year, purchase_month
+ORDER BY
+  year, month;
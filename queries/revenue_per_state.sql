@@ -4,17 +4,16 @@
 -- PISTA: Todos los pedidos deben tener un estado "delivered" y la fecha real de entrega no debe ser nula.
 
 SELECT 
-    c.customer_state,
-    ROUND(SUM(oi.price + oi.freight_value), 2) as Revenue
+    customer_state,
+    ROUND(SUM(revenue), 2) as Revenue
 FROM 
-    olist_orders o
-    JOIN olist_order_items oi ON o.order_id = oi.order_id
-    JOIN olist_customers c ON o.customer_id = c.customer_id
+    daily_item_rollup
 WHERE 
-    o.order_status = 'delivered'
-    AND o.order_delivered_customer_date IS NOT NULL
+    order_status = 'delivered'
+    AND delivered
+    AND customer_state IS NOT NULL
 GROUP BY 
-    c.customer_state
+    customer_state
 ORDER BY 
     Revenue DESC
 LIMIT 10;
@@ -1,13 +1,37 @@
-from src.extract import extract
-from src.load import load
-from src.transform import run_queries, QueryEnum
+from src.cache import cache_key, evict, file_fingerprint
+from src.checkpoints import CheckpointStore
+from src.extract import memory_report, read_table, stream_extract
+from src.holidays import get_client
+from src.load import (
+    build_fact_tables,
+    create_indexes,
+    get_partitions_dir,
+    get_relation_names,
+    load,
+    partition_tables,
+    print_load_stats,
+    refresh_rollup_tables,
+    stream_load,
+)
+from src.transform import fetch_report, get_all_queries, index_report, run_query
+from src import transform_pandas
+from src.snapshot import create_memory_database, restore_snapshot, save_snapshot
+from src.query_cache import configure_query_cache, get_table_fingerprints
+from src.scheduler import Task, print_critical_path, run_tasks
 from src import config
-from sqlalchemy import create_engine
+import argparse
+import multiprocessing
+import threading
 import traceback
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import partial
+from pathlib import Path
 from datetime import datetime
 import pandas as pd
 from src.plots import (
+    render_plot,
     plot_freight_value_weight_relationship,
     plot_global_amount_order_status,
     plot_real_vs_predicted_delivered_time,
@@ -26,7 +50,384 @@ def setup_logging():
     sys.stderr = sys.stdout
     return log_file
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Olist e-commerce data pipeline")
+    parser.add_argument(
+        "--memory-report",
+        action="store_true",
+        help="Compare the memory of each table with and without its dtype schema",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=config.EXTRACT_MAX_WORKERS,
+        help="Number of pipeline stages run at the same time, e.g. csv files read "
+        "or queries (1 runs them sequentially)",
+    )
+    parser.add_argument(
+        "--pool",
+        choices=["thread", "process"],
+        default=config.EXTRACT_POOL,
+        help="Kind of worker pool used to read the csv files",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Parse every csv file instead of reading the extract cache",
+    )
+    parser.add_argument(
+        "--load-method",
+        choices=["bulk", "to_sql", "incremental"],
+        default="bulk",
+        help="Replace the tables with chunked executemany calls or with "
+        "DataFrame.to_sql, or merge the rows into them by primary key",
+    )
+    parser.add_argument(
+        "--only-new-orders",
+        action="store_true",
+        help="With --load-method incremental, load only the orders purchased after "
+        "the last loaded ones",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream the csv files into the database in bounded chunks instead of "
+        "extracting whole dataframes first",
+    )
+    parser.add_argument(
+        "--query-workers",
+        type=int,
+        default=config.QUERY_MAX_WORKERS,
+        help="Number of queries run at the same time (1 runs them sequentially)",
+    )
+    parser.add_argument(
+        "--index-report",
+        action="store_true",
+        help="Time every query without and with the table indexes after loading",
+    )
+    parser.add_argument(
+        "--fetch-report",
+        action="store_true",
+        help="Time the queries with a result schema read with read_sql and with "
+        "the NumPy column fetcher",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["sqlite", "pandas"],
+        default="sqlite",
+        help="Load the tables into SQLite and query them there, or compute the "
+        "query results straight from the extracted dataframes",
+    )
+    parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="Load and query an in-memory database, then persist it to the "
+        "database file with the SQLite backup API",
+    )
+    parser.add_argument(
+        "--restore",
+        action="store_true",
+        help="Skip extract and load, and query an in-memory copy of the database "
+        "file",
+    )
+    parser.add_argument(
+        "--partition",
+        action="store_true",
+        help="Partition the orders and order items by purchase year into one "
+        "database per year, freezing the older years",
+    )
+    parser.add_argument(
+        "--query-cache-spill",
+        action="store_true",
+        help="Spill the query results evicted from the in-memory cache to disk",
+    )
+    parser.add_argument(
+        "--plots-dir",
+        metavar="DIR",
+        help="Render the charts headless into DIR on a pool of processes instead "
+        "of showing them",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume the last run: skip the stages that finished and whose inputs "
+        "did not change since, reading back their outputs",
+    )
+    parser.add_argument(
+        "--force",
+        action="append",
+        default=[],
+        metavar="STAGE",
+        help="With --resume, run a stage even if it finished, e.g. load, "
+        "query:revenue_by_month_year or query for every query. Repeatable",
+    )
+    parser.add_argument(
+        "--skip",
+        action="append",
+        default=[],
+        metavar="STAGE",
+        help="Do not run a stage nor the stages that depend on it, e.g. plot or "
+        "query:orders_per_day_and_holidays_2017. Repeatable",
+    )
+    return parser.parse_args(argv)
+
+# The query each plot reads, by query name, with the extra plot arguments.
+PLOTS = [
+    ("revenue_by_month_year", plot_revenue_by_month_year, (2017,)),
+    ("top_10_revenue_categories", plot_top_10_revenue_categories, ()),
+    ("top_10_least_revenue_categories", plot_top_10_least_revenue_categories, ()),
+    ("revenue_per_state", plot_revenue_per_state, ()),
+    ("freight_value_weight_relationship", plot_freight_value_weight_relationship, ()),
+    ("global_ammount_order_status", plot_global_amount_order_status, ()),
+    ("delivery_date_difference", plot_delivery_date_difference, ()),
+    ("real_vs_estimated_delivered_time", plot_real_vs_predicted_delivered_time, (2017,)),
+   # ("orders_per_day_and_holidays_2017", plot_order_amount_per_day_with_holidays, ()),
+]
+
+def run_in_pool(pool, function):
+    return pool.submit(function).result()
+
+def plot_query_result(plot, plot_args, query_result):
+    plot(query_result.result, *plot_args)
+
+def render_query_result(plot_pool, plot, plot_args, output_dir, query_result):
+    output_path, seconds = plot_pool.submit(
+        render_plot, plot, query_result.result, plot_args, output_dir
+    ).result()
+    print(f"Chart {output_path} rendered in {seconds:.2f}s")
+    return output_path
+
+def table_fingerprints(database):
+    # The output of the load stages, checked again when they are resumed.
+    return get_table_fingerprints(database, sorted(get_relation_names(database)))
+
+def csv_keys():
+    # The checkpoint key of each csv file: its content and its table schema.
+    table_schemas = config.get_table_schemas()
+    return {
+        table_name: cache_key(
+            f"{config.DATASET_ROOT_PATH}/{csv_file}",
+            table_schemas.get(table_name, {}),
+            config.SCHEMA_VERSION,
+        )
+        for csv_file, table_name in config.get_csv_to_table_mapping().items()
+    }
+
+def queries_key():
+    # The queries run again whenever one of the sql files changed.
+    return sorted(
+        (sql_file.name, file_fingerprint(str(sql_file))["sha256"])
+        for sql_file in Path(config.QUERIES_ROOT_PATH).glob("*.sql")
+    )
+
+def extract_tasks(args, read_pool=None):
+    # One task per csv file and one for the public holidays, gathered by extract.
+    csv_table_mapping = config.get_csv_to_table_mapping()
+    table_schemas = config.get_table_schemas()
+    cache_dir = None if args.no_cache else config.EXTRACT_CACHE_PATH
+    keys = csv_keys()
+    tasks = []
+    for csv_file, table_name in csv_table_mapping.items():
+        read = partial(
+            read_table,
+            f"{config.DATASET_ROOT_PATH}/{csv_file}",
+            table_name,
+            table_schemas,
+            cache_dir,
+        )
+        if read_pool is not None:
+            read = partial(run_in_pool, read_pool, read)
+        tasks.append(Task(f"extract:{table_name}", read, key=keys[table_name]))
+    holidays_client = get_client(config.PUBLIC_HOLIDAYS_URL)
+    # The holidays of every year the queries read, or their days go unflagged.
+    holiday_years = (config.QUERY_START_YEAR, config.QUERY_END_YEAR)
+    tasks.append(
+        Task(
+            "extract:public_holidays",
+            partial(holidays_client.get_range, *holiday_years),
+            key=[config.PUBLIC_HOLIDAYS_URL, holiday_years],
+        )
+    )
+    table_names = [task.name.split(":", 1)[1] for task in tasks]
+
+    def gather(*dfs):
+        data_frames = dict(zip(table_names, dfs))
+        if cache_dir is not None:
+            evict(cache_dir, config.EXTRACT_CACHE_MAX_BYTES)
+        print("\n2. Data extraction completed successfully")
+        print(f"Number of dataframes: {len(data_frames)}")
+        for name, df in data_frames.items():
+            print(f"{name}: {df.shape} rows")
+        if args.memory_report:
+            print("\nMemory usage before/after applying the table schemas:")
+            print(
+                memory_report(config.DATASET_ROOT_PATH, csv_table_mapping).to_string(
+                    index=False
+                )
+            )
+        return data_frames
+
+    tasks.append(
+        Task("extract", gather, tuple(task.name for task in tasks), key="extract")
+    )
+    return tasks
+
+def build_tasks(args, database, partitions_dir=None, read_pool=None, plot_pool=None):
+    # In-memory databases have a single connection, their tasks run one at a time.
+    serial = args.in_memory or args.restore
+    restore_load = partial(table_fingerprints, database)
+    load_key = [str(database.url), partitions_dir]
+    tasks = []
+    if args.restore:
+        def restored():
+            print("\n2-3. Restored the database into memory")
+            return restore_load()
+
+        tasks.append(
+            Task("load", restored, key=["restore", *load_key], restore=restore_load)
+        )
+    elif args.stream:
+        def stream():
+            print("\n2-3. Streaming data into the database...")
+            # Read before stream_load() moves the partitioned tables back to main.
+            stream_partitions_dir = partitions_dir or get_partitions_dir(database)
+            stats = stream_load(
+                stream_extract(
+                    csv_folder=config.DATASET_ROOT_PATH,
+                    csv_table_mapping=config.get_csv_to_table_mapping(),
+                    public_holidays_url=config.PUBLIC_HOLIDAYS_URL,
+                ),
+                database=database,
+            )
+            create_indexes(database, stats.keys())
+            stats.update(build_fact_tables(database, stats.keys()))
+            stats.update(refresh_rollup_tables(database, stats.keys()))
+            if stream_partitions_dir:
+                stats.update(partition_tables(database, stream_partitions_dir))
+            print_load_stats(stats)
+            print("Data loading completed successfully")
+            return restore_load()
+
+        tasks.append(
+            Task(
+                "load",
+                stream,
+                main_thread=serial,
+                key=["stream", *load_key, csv_keys()],
+                restore=restore_load,
+            )
+        )
+    else:
+        tasks.extend(extract_tasks(args, read_pool))
+        if args.backend == "sqlite":
+            def load_data_frames(data_frames):
+                print("\n3. Loading data...")
+                load(
+                    data_frames=data_frames,
+                    database=database,
+                    method=args.load_method,
+                    only_after_watermark=args.only_new_orders,
+                    partitions_dir=partitions_dir,
+                )
+                print("Data loading completed successfully")
+                return restore_load()
+
+            tasks.append(
+                Task(
+                    "load",
+                    load_data_frames,
+                    ("extract",),
+                    serial,
+                    key=[args.load_method, args.only_new_orders, *load_key],
+                    restore=restore_load,
+                )
+            )
+
+    if args.backend == "pandas":
+        tasks.append(
+            Task("prepare", transform_pandas.prepare, ("extract",), key="prepare")
+        )
+        queries, query_inputs = transform_pandas.get_all_queries(), ("prepare",)
+        reader = None
+    else:
+        # The reports time the queries, so nothing else queries while they run.
+        query_inputs = ("load",)
+        if args.index_report:
+            def report_indexes(*_):
+                print("\nQuery timings without/with the table indexes:")
+                print(index_report(database).to_string(index=False))
+
+            tasks.append(Task("index_report", report_indexes, query_inputs, serial))
+            query_inputs = ("index_report",)
+        if args.fetch_report:
+            def report_fetch(*_):
+                print("\nQuery read times with read_sql/the NumPy column fetcher:")
+                print(fetch_report(database).to_string(index=False))
+
+            tasks.append(Task("fetch_report", report_fetch, query_inputs, serial))
+            query_inputs = ("fetch_report",)
+        # In-memory databases are only reachable through their own engine.
+        reader = (
+            database
+            if serial
+            else config.get_engine(config.SQLITE_BD_ABSOLUTE_PATH, read_only=True)
+        )
+        queries = get_all_queries()
+    query_slots = threading.BoundedSemaphore(max(args.query_workers, 1))
+
+    def run(query, *inputs):
+        # The pandas queries read the prepared dataframes, the others the database.
+        with query_slots:
+            return run_query(query, inputs[0] if reader is None else reader)
+
+    key = [args.backend, queries_key()]
+    query_tasks = [
+        Task(
+            f"query:{query.__name__.replace('query_', '')}",
+            partial(run, query),
+            query_inputs,
+            serial,
+            key=key,
+            persist=True,
+        )
+        for query in queries
+    ]
+    tasks.extend(query_tasks)
+
+    def gather_queries(*query_results):
+        print("Queries completed successfully")
+        print(f"Number of query results: {len(query_results)}")
+        if args.in_memory and not args.restore:
+            seconds = save_snapshot(database, config.SQLITE_BD_ABSOLUTE_PATH)
+            print(f"Database saved to {config.SQLITE_BD_ABSOLUTE_PATH} ({seconds:.2f}s)")
+        return {
+            query_result.query: query_result.result for query_result in query_results
+        }
+
+    query_names = tuple(task.name for task in query_tasks)
+    tasks.append(Task("queries", gather_queries, query_names, serial))
+    # Each plot starts once its query finished. Shown plots run on the main thread
+    # for matplotlib, rendered ones on the plot pool.
+    for query_name, plot, plot_args in PLOTS:
+        if plot_pool is None:
+            draw = partial(plot_query_result, plot, plot_args)
+        else:
+            draw = partial(
+                render_query_result, plot_pool, plot, plot_args, args.plots_dir
+            )
+        tasks.append(
+            Task(
+                f"plot:{plot.__name__.replace('plot_', '')}",
+                draw,
+                (f"query:{query_name}",),
+                main_thread=plot_pool is None,
+                key=[*plot_args, args.plots_dir],
+            )
+        )
+    return tasks
+
+def main(args=None):
+    args = parse_args([]) if args is None else args
     log_file = setup_logging()
     try:
         print("1. Testing CSV reading...")
@@ -37,41 +438,51 @@ def main():
         print("\nFirst few rows:")
         print(df.head())
         
-        print("\n2. Extracting all data...")
-        data_frames = extract(
-            csv_folder=config.DATASET_ROOT_PATH,
-            csv_table_mapping=config.get_csv_to_table_mapping(),
-            public_holidays_url=config.PUBLIC_HOLIDAYS_URL
-        )
-        print("Data extraction completed successfully")
-        print(f"Number of dataframes: {len(data_frames)}")
-        for name, df in data_frames.items():
-            print(f"{name}: {df.shape} rows")
-        
-        print("\n3. Loading data...")
-        database = create_engine(f"sqlite:///{config.SQLITE_BD_ABSOLUTE_PATH}")
-        load(data_frames=data_frames, database=database)
-        print("Data loading completed successfully")
-        
-        print("\n4. Running queries...")
-        query_results = run_queries(database=database)
-        print("Queries completed successfully")
-        print(f"Number of query results: {len(query_results)}")
-        
-        print("\n5. Generating plots...")
-        # Generate all plots
-        plot_revenue_by_month_year(query_results[QueryEnum.REVENUE_BY_MONTH_YEAR.value], 2017)
-        plot_top_10_revenue_categories(query_results[QueryEnum.TOP_10_REVENUE_CATEGORIES.value])
-        plot_top_10_least_revenue_categories(query_results[QueryEnum.TOP_10_LEAST_REVENUE_CATEGORIES.value])
-        plot_revenue_per_state(query_results[QueryEnum.REVENUE_PER_STATE.value])
-        plot_freight_value_weight_relationship(query_results[QueryEnum.GET_FREIGHT_VALUE_WEIGHT_RELATIONSHIP.value])
-        plot_global_amount_order_status(query_results[QueryEnum.GLOBAL_AMMOUNT_ORDER_STATUS.value])
-        plot_delivery_date_difference(query_results[QueryEnum.DELIVERY_DATE_DIFFERECE.value])
-        plot_real_vs_predicted_delivered_time(query_results[QueryEnum.REAL_VS_ESTIMATED_DELIVERED_TIME.value], 2017)
-       # plot_order_amount_per_day_with_holidays(query_results[QueryEnum.ORDERS_PER_DAY_AND_HOLIDAYS_2017.value])
+        if args.restore:
+            database = restore_snapshot(config.SQLITE_BD_ABSOLUTE_PATH)
+        elif args.in_memory:
+            database = create_memory_database()
+        else:
+            database = config.get_engine(config.SQLITE_BD_ABSOLUTE_PATH)
+        if args.query_cache_spill:
+            configure_query_cache(spill=True)
+        if (args.stream or args.restore) and args.backend == "pandas":
+            raise ValueError("--stream and --restore need the sqlite backend")
+        if args.partition and (args.in_memory or args.restore):
+            raise ValueError("--partition needs the database file")
+        partitions_dir = config.PARTITIONS_ROOT_PATH if args.partition else None
+
+        with ExitStack() as stack:
+            read_pool = (
+                stack.enter_context(ProcessPoolExecutor(max_workers=args.workers))
+                if args.pool == "process"
+                else None
+            )
+            # Spawned and not forked, the stage threads are running when it starts.
+            plot_pool = (
+                stack.enter_context(
+                    ProcessPoolExecutor(
+                        max_workers=args.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                )
+                if args.plots_dir
+                else None
+            )
+            tasks = build_tasks(args, database, partitions_dir, read_pool, plot_pool)
+            print("\n2-5. Running the pipeline stages...")
+            # Without --resume every stage runs, and stores its checkpoint.
+            _, timings = run_tasks(
+                tasks,
+                max_workers=args.workers,
+                checkpoints=CheckpointStore(),
+                force=args.force if args.resume else [task.name for task in tasks],
+                skip=args.skip,
+            )
         print("Plots generated successfully")
         
         print("\nPipeline completed successfully!")
+        print_critical_path(tasks, timings)
     except Exception as e:
         print("\nError in pipeline execution:")
         print(f"Error type: {type(e).__name__}")
@@ -86,4 +497,4 @@ def main():
         print(f"Log file created at: {log_file}")
 
 if __name__ == "__main__":
-    main()
+    main(parse_args())
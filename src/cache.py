@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+from pandas import Categorical, DataFrame
+
+META_FILE = "meta.json"
+HASH_SAMPLE_SIZE = 2**20
+
+
+def file_fingerprint(file_path: str) -> Dict[str, Any]:
+    """Get the size, modification time and a hash of the first and last MiB of a
+    file. Hashing the whole csv file would cost as much I/O as parsing it.
+
+    Args:
+        file_path (str): The path to the file.
+
+    Returns:
+        Dict[str, Any]: Dictionary with the keys size, mtime_ns and sha256.
+    """
+    stat = os.stat(file_path)
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        digest.update(f.read(HASH_SAMPLE_SIZE))
+        if stat.st_size > HASH_SAMPLE_SIZE:
+            f.seek(max(HASH_SAMPLE_SIZE, stat.st_size - HASH_SAMPLE_SIZE))
+            digest.update(f.read())
+    return dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=digest.hexdigest())
+
+
+def cache_key(
+    file_path: str, table_schema: Dict[str, Any], schema_version: int
+) -> str:
+    """Build the key of a cached table from its source file and its schema.
+
+    Args:
+        file_path (str): The path to the csv file the table is read from.
+        table_schema (Dict[str, Any]): The read_csv keyword arguments of the table.
+        schema_version (int): The version of the table schemas.
+
+    Returns:
+        str: The hex digest identifying the cache entry.
+    """
+    payload = dict(
+        source=file_fingerprint(file_path),
+        schema=repr(sorted(table_schema.items())),
+        schema_version=schema_version,
+    )
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def _entry_path(cache_dir: str, table_name: str, key: str) -> Path:
+    return Path(cache_dir) / f"{table_name}-{key[:16]}"
+
+
+def read_cached_table(cache_dir: str, table_name: str, key: str) -> Optional[DataFrame]:
+    """Read a table from the cache. Numeric, datetime and categorical columns are
+    memory-mapped copy-on-write and used by the dataframe without copying them,
+    other columns are unpickled.
+
+    Args:
+        cache_dir (str): The path to the cache folder.
+        table_name (str): The name of the table.
+        key (str): The key returned by cache_key().
+
+    Returns:
+        Optional[DataFrame]: The cached dataframe or None if there is no entry.
+    """
+    entry = _entry_path(cache_dir, table_name, key)
+    try:
+        with open(entry / META_FILE, "r") as f:
+            meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if meta["key"] != key:
+        return None
+
+    columns = {}
+    for i, column in enumerate(meta["columns"]):
+        if column["kind"] == "category":
+            codes = np.load(entry / f"{i}.codes.npy", mmap_mode="c")
+            categories = np.load(entry / f"{i}.categories.npy", allow_pickle=True)
+            columns[column["name"]] = Categorical.from_codes(
+                codes, categories=categories, ordered=column["ordered"]
+            )
+        elif column["kind"] == "numpy":
+            columns[column["name"]] = np.load(entry / f"{i}.npy", mmap_mode="c")
+        else:
+            values = np.load(entry / f"{i}.npy", allow_pickle=True)
+            columns[column["name"]] = values
+    df = DataFrame(
+        columns, columns=[column["name"] for column in meta["columns"]], copy=False
+    )
+    for column in meta["columns"]:
+        if column["kind"] == "object" and column["dtype"] != "object":
+            df[column["name"]] = df[column["name"]].astype(column["dtype"])
+
+    # Touch the entry so evict() keeps the most recently used tables.
+    os.utime(entry / META_FILE)
+    return df
+
+
+def write_cached_table(cache_dir: str, table_name: str, key: str, df: DataFrame):
+    """Write a table to the cache as one .npy file per column and remove the stale
+    entries of the same table.
+
+    Args:
+        cache_dir (str): The path to the cache folder.
+        table_name (str): The name of the table.
+        key (str): The key returned by cache_key().
+        df (DataFrame): The dataframe to cache.
+    """
+    entry = _entry_path(cache_dir, table_name, key)
+    tmp_entry = Path(cache_dir) / f".{entry.name}.{uuid.uuid4().hex}"
+    tmp_entry.mkdir(parents=True)
+
+    columns = []
+    for i, name in enumerate(df.columns):
+        series = df[name]
+        if series.dtype.name == "category":
+            np.save(tmp_entry / f"{i}.codes.npy", series.cat.codes.to_numpy())
+            np.save(
+                tmp_entry / f"{i}.categories.npy",
+                series.cat.categories.to_numpy(),
+                allow_pickle=True,
+            )
+            kind = "category"
+        elif isinstance(series.dtype, np.dtype) and series.dtype != object:
+            np.save(tmp_entry / f"{i}.npy", series.to_numpy())
+            kind = "numpy"
+        else:
+            np.save(
+                tmp_entry / f"{i}.npy",
+                series.to_numpy(dtype=object),
+                allow_pickle=True,
+            )
+            kind = "object"
+        columns.append(
+            dict(
+                name=name,
+                kind=kind,
+                dtype=str(series.dtype),
+                ordered=bool(kind == "category" and series.cat.ordered),
+            )
+        )
+    with open(tmp_entry / META_FILE, "w") as f:
+        json.dump(dict(key=key, table=table_name, columns=columns), f)
+
+    for stale in Path(cache_dir).glob(f"{table_name}-*"):
+        if stale != entry:
+            shutil.rmtree(stale, ignore_errors=True)
+    try:
+        os.replace(tmp_entry, entry)
+    except OSError:
+        # Another worker already stored the same entry.
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+
+
+def evict(cache_dir: str, max_bytes: int):
+    """Remove the least recently used cache entries until the cache folder is not
+    bigger than max_bytes.
+
+    Args:
+        cache_dir (str): The path to the cache folder.
+        max_bytes (int): The maximum size of the cache folder.
+    """
+    if not os.path.isdir(cache_dir):
+        return
+
+    entries = []
+    for entry in Path(cache_dir).iterdir():
+        if entry.name.startswith("."):
+            # Leftovers of an interrupted write older than an hour.
+            if time.time() - entry.stat().st_mtime > 3600:
+                shutil.rmtree(entry, ignore_errors=True)
+            continue
+        meta = entry / META_FILE
+        last_used = meta.stat().st_mtime if meta.exists() else 0
+        size = sum(f.stat().st_size for f in entry.iterdir())
+        entries.append((last_used, size, entry))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+import uuid
+from collections import namedtuple
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from pandas import DataFrame
+from pandas.util import hash_pandas_object
+
+from src.config import CHECKPOINTS_PATH
+
+CHECKPOINTS_FILE = "checkpoints.json"
+
+# The identity a task ran with, its key and the output fingerprints of its
+# inputs, and the fingerprint of its own output.
+Checkpoint = namedtuple("Checkpoint", ["identity", "output"])
+
+
+def _update_fingerprint(digest, value: Any):
+    if isinstance(value, DataFrame):
+        columns = [str(column) for column in value.columns]
+        digest.update(json.dumps([columns, list(map(str, value.dtypes))]).encode())
+        digest.update(hash_pandas_object(value, index=True).values.tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}[{len(value)}]".encode())
+        for item in value:
+            _update_fingerprint(digest, item)
+    elif isinstance(value, dict):
+        digest.update(f"dict[{len(value)}]".encode())
+        for key in sorted(value, key=repr):
+            _update_fingerprint(digest, key)
+            _update_fingerprint(digest, value[key])
+    else:
+        digest.update(repr(value).encode())
+
+
+def fingerprint(value: Any) -> str:
+    """Hash a task output: dataframes by their columns, dtypes and values, lists,
+    tuples and dicts by their items and anything else by its repr.
+
+    Args:
+        value (Any): The output.
+
+    Returns:
+        str: The hex digest of the output.
+    """
+    digest = hashlib.sha256()
+    _update_fingerprint(digest, value)
+    return digest.hexdigest()
+
+
+class CheckpointStore:
+    """Checkpoints of the tasks of src.scheduler that finished, kept in a folder
+    across runs: one json file with the Checkpoint of every task, and a pickle
+    with the output of the tasks whose output is persisted.
+    """
+
+    def __init__(self, checkpoint_dir: str = CHECKPOINTS_PATH):
+        """
+        Args:
+            checkpoint_dir (str, optional): The checkpoint folder. Defaults to
+            config.CHECKPOINTS_PATH.
+        """
+        self.checkpoint_dir = checkpoint_dir
+        self._lock = threading.Lock()
+        try:
+            with open(Path(checkpoint_dir) / CHECKPOINTS_FILE) as f:
+                self._checkpoints: Dict[str, Checkpoint] = {
+                    name: Checkpoint(*checkpoint)
+                    for name, checkpoint in json.load(f).items()
+                }
+        except (FileNotFoundError, ValueError):
+            self._checkpoints = {}
+
+    def _result_file(self, name: str) -> Path:
+        digest = hashlib.sha256(name.encode()).hexdigest()[:16]
+        return Path(self.checkpoint_dir) / f"{digest}.pkl"
+
+    def _write(self, file_path: Path, write):
+        tmp_file = file_path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp_file, "wb") as f:
+                write(f)
+            os.replace(tmp_file, file_path)
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)
+            raise
+
+    def get(self, name: str) -> Optional[Checkpoint]:
+        """Get the checkpoint of a task.
+
+        Args:
+            name (str): The name of the task.
+
+        Returns:
+            Optional[Checkpoint]: The checkpoint, or None if the task never
+            finished.
+        """
+        with self._lock:
+            return self._checkpoints.get(name)
+
+    def put(self, name: str, checkpoint: Checkpoint, *result: Any):
+        """Store the checkpoint of a task that finished, right away so it outlives
+        a run that fails afterwards.
+
+        Args:
+            name (str): The name of the task.
+            checkpoint (Checkpoint): Its checkpoint.
+            *result (Any): The output of the task, to persist it.
+        """
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        if result:
+            self._write(
+                self._result_file(name), lambda f: pickle.dump(result[0], f)
+            )
+        with self._lock:
+            self._checkpoints[name] = checkpoint
+            checkpoints = json.dumps(
+                {task: list(value) for task, value in self._checkpoints.items()},
+                indent=2,
+                sort_keys=True,
+            ).encode()
+            self._write(
+                Path(self.checkpoint_dir) / CHECKPOINTS_FILE,
+                lambda f: f.write(checkpoints),
+            )
+
+    def read_result(self, name: str) -> Any:
+        """Read the persisted output of a task.
+
+        Args:
+            name (str): The name of the task.
+
+        Raises:
+            FileNotFoundError: If the output of the task was not persisted.
+
+        Returns:
+            Any: The output.
+        """
+        with open(self._result_file(name), "rb") as f:
+            return pickle.load(f)
@@ -1,11 +1,69 @@
+import os
 from pathlib import Path
-from typing import Dict
+from typing import Any, Dict, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.pool import QueuePool, StaticPool
 
 DATASET_ROOT_PATH = str(Path(__file__).parent.parent / "dataset")
 QUERIES_ROOT_PATH = str(Path(__file__).parent.parent / "queries")
 QUERY_RESULTS_ROOT_PATH = str(Path(__file__).parent.parent / "tests/query_results")
 PUBLIC_HOLIDAYS_URL = "https://date.nager.at/api/v3/publicholidays"
 SQLITE_BD_ABSOLUTE_PATH = str(Path(__file__).parent.parent / "olist.db")
+# One database per purchase year holding the rows of the partitioned tables.
+PARTITIONS_ROOT_PATH = str(Path(__file__).parent.parent / "partitions")
+PARTITIONED_TABLES = ["olist_orders", "olist_order_items"]
+# Partitions of the latest years stay writable, the older ones are frozen.
+PARTITION_OPEN_YEARS = 1
+EXTRACT_MAX_WORKERS = min(8, os.cpu_count() or 1)
+EXTRACT_POOL = "thread"
+EXTRACT_CACHE_PATH = str(Path(__file__).parent.parent / ".cache" / "extract")
+EXTRACT_CACHE_MAX_BYTES = 2 * 2**30
+HOLIDAYS_CACHE_PATH = str(Path(__file__).parent.parent / ".cache" / "holidays")
+HOLIDAYS_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+HOLIDAYS_MAX_WORKERS = 4
+# (connect, read) seconds before a holidays request fails, and its retries.
+HOLIDAYS_TIMEOUT_SECONDS = (5, 30)
+HOLIDAYS_RETRIES = 3
+LOAD_CHUNKSIZE = 50_000
+# Pragmas set while load() writes the tables, the previous values are restored.
+LOAD_PRAGMAS = {"journal_mode": "MEMORY", "synchronous": "OFF", "cache_size": -262144}
+# Memory each chunk may use when the csv files are streamed into the database.
+STREAM_MEMORY_BUDGET_BYTES = 64 * 2**20
+QUERY_MAX_WORKERS = 4
+# Purchase years the by-month queries pivot into YearNNNN columns by default.
+QUERY_START_YEAR = 2016
+QUERY_END_YEAR = 2018
+# Years of public holidays extracted, the ones the queries above flag.
+HOLIDAY_YEARS = tuple(str(year) for year in range(QUERY_START_YEAR, QUERY_END_YEAR + 1))
+# Rows fetched per DB-API call when a query result is read into NumPy arrays.
+FETCH_ARRAYSIZE = 10_000
+# Query results kept in memory, and on disk when spilling is enabled.
+QUERY_CACHE_MAX_ENTRIES = 64
+QUERY_CACHE_PATH = str(Path(__file__).parent.parent / ".cache" / "queries")
+QUERY_CACHE_MAX_BYTES = 512 * 2**20
+# Checkpoints of the pipeline stages, so a failed run can be resumed.
+CHECKPOINTS_PATH = str(Path(__file__).parent.parent / ".cache" / "checkpoints")
+# Pragmas set on every new connection of get_engine(), for reading.
+SQLITE_PRAGMAS = {
+    "mmap_size": 256 * 2**20,
+    "cache_size": -64 * 2**10,
+    "temp_store": "MEMORY",
+}
+# Pragmas added on the connections that write, WAL lets the readers run while
+# a load writes.
+SQLITE_WRITER_PRAGMAS = {"journal_mode": "WAL", "synchronous": "NORMAL"}
+# Pragmas added on the read-only connections.
+SQLITE_READER_PRAGMAS = {"query_only": "ON"}
+# Connections kept open by each engine, one per concurrent query plus a spare.
+SQLITE_POOL_SIZE = QUERY_MAX_WORKERS + 1
+SQLITE_POOL_MAX_OVERFLOW = QUERY_MAX_WORKERS
+# Column whose greatest loaded value is kept as the high-water mark of a table
+# by the incremental load.
+INCREMENTAL_WATERMARKS = {"olist_orders": "order_purchase_timestamp"}
+# Bump this whenever get_table_schemas() changes so cached tables are rebuilt.
+SCHEMA_VERSION = 1
 
 
 def get_csv_to_table_mapping() -> Dict[str, str]:
@@ -31,3 +89,300 @@ def get_csv_to_table_mapping() -> Dict[str, str]:
             ),
         ]
     )
+
+
+def get_table_schemas() -> Dict[str, Dict[str, Any]]:
+    """This function declares how each csv file must be parsed.
+
+    Every entry holds the keyword arguments passed to pandas.read_csv() for the
+    table: the columns to read (usecols), their dtypes and the columns that must be
+    parsed as datetimes (parse_dates). Identifiers are kept as strings, low
+    cardinality columns are read as categoricals and coordinates as float32.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Dictionary with keys as the table names and
+        values as the read_csv keyword arguments for that table.
+    """
+    return {
+        "olist_customers": dict(
+            usecols=[
+                "customer_id",
+                "customer_unique_id",
+                "customer_zip_code_prefix",
+                "customer_city",
+                "customer_state",
+            ],
+            dtype={
+                "customer_id": "str",
+                "customer_unique_id": "str",
+                "customer_zip_code_prefix": "int32",
+                "customer_city": "category",
+                "customer_state": "category",
+            },
+            parse_dates=[],
+        ),
+        "olist_geolocation": dict(
+            usecols=[
+                "geolocation_zip_code_prefix",
+                "geolocation_lat",
+                "geolocation_lng",
+                "geolocation_city",
+                "geolocation_state",
+            ],
+            dtype={
+                "geolocation_zip_code_prefix": "int32",
+                "geolocation_lat": "float32",
+                "geolocation_lng": "float32",
+                "geolocation_city": "category",
+                "geolocation_state": "category",
+            },
+            parse_dates=[],
+        ),
+        "olist_order_items": dict(
+            usecols=[
+                "order_id",
+                "order_item_id",
+                "product_id",
+                "seller_id",
+                "shipping_limit_date",
+                "price",
+                "freight_value",
+            ],
+            dtype={
+                "order_id": "str",
+                "order_item_id": "int16",
+                "product_id": "str",
+                "seller_id": "str",
+                "price": "float64",
+                "freight_value": "float64",
+            },
+            parse_dates=["shipping_limit_date"],
+        ),
+        "olist_order_payments": dict(
+            usecols=[
+                "order_id",
+                "payment_sequential",
+                "payment_type",
+                "payment_installments",
+                "payment_value",
+            ],
+            dtype={
+                "order_id": "str",
+                "payment_sequential": "int16",
+                "payment_type": "category",
+                "payment_installments": "int16",
+                "payment_value": "float64",
+            },
+            parse_dates=[],
+        ),
+        "olist_order_reviews": dict(
+            usecols=[
+                "review_id",
+                "order_id",
+                "review_score",
+                "review_comment_title",
+                "review_comment_message",
+                "review_creation_date",
+                "review_answer_timestamp",
+            ],
+            dtype={
+                "review_id": "str",
+                "order_id": "str",
+                "review_score": "int8",
+                "review_comment_title": "str",
+                "review_comment_message": "str",
+            },
+            parse_dates=["review_creation_date", "review_answer_timestamp"],
+        ),
+        "olist_orders": dict(
+            usecols=[
+                "order_id",
+                "customer_id",
+                "order_status",
+                "order_purchase_timestamp",
+                "order_approved_at",
+                "order_delivered_carrier_date",
+                "order_delivered_customer_date",
+                "order_estimated_delivery_date",
+            ],
+            dtype={
+                "order_id": "str",
+                "customer_id": "str",
+                "order_status": "category",
+            },
+            parse_dates=[
+                "order_purchase_timestamp",
+                "order_approved_at",
+                "order_delivered_carrier_date",
+                "order_delivered_customer_date",
+                "order_estimated_delivery_date",
+            ],
+        ),
+        "olist_products": dict(
+            usecols=[
+                "product_id",
+                "product_category_name",
+                "product_name_lenght",
+                "product_description_lenght",
+                "product_photos_qty",
+                "product_weight_g",
+                "product_length_cm",
+                "product_height_cm",
+                "product_width_cm",
+            ],
+            dtype={
+                "product_id": "str",
+                "product_category_name": "category",
+                "product_name_lenght": "float32",
+                "product_description_lenght": "float32",
+                "product_photos_qty": "float32",
+                "product_weight_g": "float32",
+                "product_length_cm": "float32",
+                "product_height_cm": "float32",
+                "product_width_cm": "float32",
+            },
+            parse_dates=[],
+        ),
+        "olist_sellers": dict(
+            usecols=[
+                "seller_id",
+                "seller_zip_code_prefix",
+                "seller_city",
+                "seller_state",
+            ],
+            dtype={
+                "seller_id": "str",
+                "seller_zip_code_prefix": "int32",
+                "seller_city": "category",
+                "seller_state": "category",
+            },
+            parse_dates=[],
+        ),
+        "product_category_name_translation": dict(
+            usecols=["product_category_name", "product_category_name_english"],
+            dtype={
+                "product_category_name": "str",
+                "product_category_name_english": "str",
+            },
+            parse_dates=[],
+        ),
+    }
+
+
+def get_table_indexes() -> Dict[str, Dict[str, Any]]:
+    """This function declares the keys and indexes created on each table after it
+    is loaded.
+
+    Every entry may hold a primary_key, the list of columns that identify a row
+    (created as a unique index because SQLite cannot add a primary key to an
+    existing table), and indexes, a list with the columns of each secondary index.
+    They cover the joins and filters used by the files in the queries folder.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Dictionary with keys as the table names and
+        values as the keys and indexes of that table.
+    """
+    return {
+        "olist_customers": dict(primary_key=["customer_id"], indexes=[]),
+        "olist_geolocation": dict(indexes=[["geolocation_zip_code_prefix"]]),
+        "olist_order_items": dict(
+            primary_key=["order_id", "order_item_id"], indexes=[["product_id"]]
+        ),
+        "olist_order_payments": dict(
+            primary_key=["order_id", "payment_sequential"], indexes=[]
+        ),
+        "olist_order_reviews": dict(
+            primary_key=["review_id", "order_id"], indexes=[["order_id"]]
+        ),
+        "olist_orders": dict(
+            primary_key=["order_id"],
+            indexes=[
+                ["customer_id"],
+                ["order_status", "order_delivered_customer_date"],
+                ["purchase_year", "purchase_date"],
+            ],
+        ),
+        "olist_products": dict(
+            primary_key=["product_id"], indexes=[["product_category_name"]]
+        ),
+        "olist_sellers": dict(primary_key=["seller_id"], indexes=[]),
+        "product_category_name_translation": dict(
+            primary_key=["product_category_name"], indexes=[]
+        ),
+        # Covering index of the freight query, the only one over the fact table.
+        "delivered_order_items": dict(
+            indexes=[["order_id", "product_weight_g", "freight_value"]]
+        ),
+        # The purchase days recomputed when the rollups are refreshed.
+        "daily_order_rollup": dict(indexes=[["purchase_year", "purchase_date"]]),
+        "daily_item_rollup": dict(indexes=[["purchase_year", "purchase_date"]]),
+    }
+
+
+def get_engine(
+    path: Optional[str] = SQLITE_BD_ABSOLUTE_PATH,
+    read_only: bool = False,
+    pool_size: int = SQLITE_POOL_SIZE,
+) -> Engine:
+    """This function creates the SQLite engines every stage of the pipeline uses.
+
+    Every new connection gets SQLITE_PRAGMAS, plus SQLITE_READER_PRAGMAS when the
+    engine is read only or SQLITE_WRITER_PRAGMAS otherwise, and attaches the
+    partitions of the database, see src.partitions. Connections are kept in a
+    pool of pool_size, so concurrent queries reuse them instead of opening the
+    file and mapping it again.
+
+    Args:
+        path (str, optional): The database file, None for an in-memory database
+        whose connections all share one SQLite connection. Defaults to
+        SQLITE_BD_ABSOLUTE_PATH.
+        read_only (bool, optional): Open the connections with query_only.
+        Defaults to False.
+        pool_size (int, optional): The connections kept open. Defaults to
+        SQLITE_POOL_SIZE.
+
+    Raises:
+        ValueError: If an in-memory database is asked to be read only.
+
+    Returns:
+        Engine: The engine.
+    """
+    if path is None:
+        if read_only:
+            raise ValueError(
+                "Una base de datos en memoria no puede ser de solo lectura"
+            )
+        engine = create_engine(
+            "sqlite://",
+            poolclass=StaticPool,
+            connect_args={"check_same_thread": False},
+        )
+        pragmas = dict(SQLITE_PRAGMAS)
+        # mmap and WAL only apply to database files.
+        pragmas.pop("mmap_size", None)
+    else:
+        engine = create_engine(
+            f"sqlite:///{path}",
+            poolclass=QueuePool,
+            pool_size=pool_size,
+            max_overflow=SQLITE_POOL_MAX_OVERFLOW,
+            connect_args={"check_same_thread": False},
+        )
+        pragmas = dict(
+            SQLITE_PRAGMAS,
+            **(SQLITE_READER_PRAGMAS if read_only else SQLITE_WRITER_PRAGMAS),
+        )
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # Unqualified pragmas would also reach the read-only partitions attached.
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA main.{name} = {value}")
+        cursor.close()
+
+    # Imported here as src.partitions reads this module.
+    from src.partitions import register_partitions
+
+    register_partitions(engine)
+    return engine
@@ -1,7 +1,18 @@
-from typing import Dict
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, Optional
 
-import requests
-from pandas import DataFrame, read_csv, read_json, to_datetime
+from pandas import DataFrame, read_csv
+
+from src.cache import cache_key, evict, read_cached_table, write_cached_table
+from src.config import (
+    EXTRACT_CACHE_MAX_BYTES,
+    HOLIDAY_YEARS,
+    SCHEMA_VERSION,
+    STREAM_MEMORY_BUDGET_BYTES,
+    get_table_schemas,
+)
+from src.holidays import get_client
 
 def temp() -> DataFrame:
     """Get the temperature data.
@@ -20,27 +31,168 @@ def get_public_holidays(public_holidays_url: str, year: str) -> DataFrame:
     Returns:
         DataFrame: A dataframe with the public holidays.
     """
-    # TODO: Implementa esta función.
-    # Debes usar la biblioteca requests para obtener los días festivos públicos del año dado.
-    # La URL es public_holidays_url/{year}/BR.
-    # Debes eliminar las columnas "types" y "counties" del DataFrame.
-    # Debes convertir la columna "date" a datetime.
-    # Debes lanzar SystemExit si la solicitud falla. Investiga el método raise_for_status
-    # de la biblioteca requests.
-
-    response = requests.get(f"{public_holidays_url}/{year}/BR")
-    try:
-        response.raise_for_status()
-        df = read_json(response.text)
-        df["date"] = to_datetime(df["date"])
-        df = df.drop(columns=["types", "counties"])
-        return df
-    except requests.exceptions.HTTPError as err:
-        raise SystemExit(err)
+    return get_client(public_holidays_url).get(year)
+
+
+def read_table(
+    csv_path: str,
+    table_name: str,
+    table_schemas: Dict[str, Dict[str, Any]],
+    cache_dir: Optional[str] = None,
+) -> DataFrame:
+    """Read a csv file applying the schema declared for its table.
+    Args:
+        csv_path (str): The path to the csv file.
+        table_name (str): The name of the table the csv file is loaded into.
+        table_schemas (Dict[str, Dict[str, Any]]): The read_csv keyword arguments
+        for each table. Tables without a schema are read with the pandas defaults.
+        cache_dir (str, optional): The path to the extract cache folder. When given,
+        the table is read from the cache if the csv file and its schema did not
+        change, and written to it otherwise. Defaults to None (no cache).
+    Returns:
+        DataFrame: A dataframe with the csv file contents.
+    """
+    table_schema = table_schemas.get(table_name, {})
+    if cache_dir is None:
+        return read_csv(csv_path, **table_schema)
+
+    key = cache_key(csv_path, table_schema, SCHEMA_VERSION)
+    df = read_cached_table(cache_dir, table_name, key)
+    if df is None:
+        df = read_csv(csv_path, **table_schema)
+        write_cached_table(cache_dir, table_name, key, df)
+    return df
+
+
+def get_memory_usage(dataframes: Dict[str, DataFrame]) -> Dict[str, int]:
+    """Get the memory used by each dataframe, including the python objects.
+    Args:
+        dataframes (Dict[str, DataFrame]): A dictionary with keys as the table names
+        and values as the dataframes.
+    Returns:
+        Dict[str, int]: A dictionary with keys as the table names and values as the
+        bytes used by the dataframe.
+    """
+    return {
+        table_name: int(df.memory_usage(index=True, deep=True).sum())
+        for table_name, df in dataframes.items()
+    }
+
+
+def memory_report(
+    csv_folder: str,
+    csv_table_mapping: Dict[str, str],
+    table_schemas: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> DataFrame:
+    """Compare the memory used by each table read with the pandas defaults against
+    the memory used when its schema is applied.
+    Args:
+        csv_folder (str): The path to the csv's folder.
+        csv_table_mapping (Dict[str, str]): The mapping of the csv file names to the
+        table names.
+        table_schemas (Dict[str, Dict[str, Any]], optional): The read_csv keyword
+        arguments for each table. Defaults to config.get_table_schemas().
+    Returns:
+        DataFrame: A dataframe with one row per table and the columns table,
+        before_mb, after_mb and saving_pct, plus a final TOTAL row.
+    """
+    table_schemas = get_table_schemas() if table_schemas is None else table_schemas
+    rows = []
+    for csv_file, table_name in csv_table_mapping.items():
+        csv_path = f"{csv_folder}/{csv_file}"
+        before = get_memory_usage({table_name: read_csv(csv_path)})[table_name]
+        after = get_memory_usage(
+            {table_name: read_table(csv_path, table_name, table_schemas)}
+        )[table_name]
+        rows.append((table_name, before, after))
+
+    report = DataFrame(rows, columns=["table", "before_mb", "after_mb"])
+    report.loc[len(report)] = [
+        "TOTAL",
+        report["before_mb"].sum(),
+        report["after_mb"].sum(),
+    ]
+    report["saving_pct"] = (1 - report["after_mb"] / report["before_mb"]) * 100
+    report[["before_mb", "after_mb"]] = report[["before_mb", "after_mb"]] / 2**20
+
+    return report.round(2)
+
+
+def extract_concurrently(
+    csv_folder: str,
+    csv_table_mapping: Dict[str, str],
+    public_holidays_url: str,
+    table_schemas: Dict[str, Dict[str, Any]],
+    max_workers: int,
+    pool: str = "thread",
+    cache_dir: Optional[str] = None,
+    holiday_years: Iterable[str] = HOLIDAY_YEARS,
+) -> Dict[str, DataFrame]:
+    """Read the csv files on a pool of workers while the public holidays are
+    requested on a separate thread.
+    Args:
+        csv_folder (str): The path to the csv's folder.
+        csv_table_mapping (Dict[str, str]): The mapping of the csv file names to the
+        table names.
+        public_holidays_url (str): The url to the public holidays.
+        table_schemas (Dict[str, Dict[str, Any]]): The read_csv keyword arguments for
+        each table.
+        max_workers (int): The number of workers reading csv files.
+        pool (str): "thread" or "process", the kind of pool used to read the files.
+        cache_dir (str, optional): The path to the extract cache folder. Defaults to
+        None (no cache).
+        holiday_years (Iterable[str], optional): The years of public holidays to
+        fetch. Defaults to config.HOLIDAY_YEARS.
+    Raises:
+        ValueError: If the pool is not "thread" or "process".
+    Returns:
+        Dict[str, DataFrame]: A dictionary with keys as the table names and values as
+        the dataframes, in the same order as csv_table_mapping.
+    """
+    executors = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+    if pool not in executors:
+        raise ValueError(f"Unknown pool {pool!r}, expected 'thread' or 'process'")
+
+    # The biggest files are submitted first so they never wait behind small ones.
+    csv_files = sorted(
+        csv_table_mapping,
+        key=lambda csv_file: os.path.getsize(f"{csv_folder}/{csv_file}"),
+        reverse=True,
+    )
+    with ThreadPoolExecutor(max_workers=1) as holidays_executor, executors[pool](
+        max_workers=max_workers
+    ) as executor:
+        holidays = holidays_executor.submit(
+            get_client(public_holidays_url).get_years, holiday_years
+        )
+        futures = {
+            csv_table_mapping[csv_file]: executor.submit(
+                read_table,
+                f"{csv_folder}/{csv_file}",
+                csv_table_mapping[csv_file],
+                table_schemas,
+                cache_dir,
+            )
+            for csv_file in csv_files
+        }
+        dataframes = {
+            table_name: futures[table_name].result()
+            for table_name in csv_table_mapping.values()
+        }
+        dataframes["public_holidays"] = holidays.result()
+
+    return dataframes
 
 
 def extract(
-    csv_folder: str, csv_table_mapping: Dict[str, str], public_holidays_url: str
+    csv_folder: str,
+    csv_table_mapping: Dict[str, str],
+    public_holidays_url: str,
+    table_schemas: Optional[Dict[str, Dict[str, Any]]] = None,
+    max_workers: int = 1,
+    pool: str = "thread",
+    cache_dir: Optional[str] = None,
+    holiday_years: Iterable[str] = HOLIDAY_YEARS,
 ) -> Dict[str, DataFrame]:
     """Extract the data from the csv files and load them into the dataframes.
     Args:
@@ -48,17 +200,134 @@ def extract(
         csv_table_mapping (Dict[str, str]): The mapping of the csv file names to the
         table names.
         public_holidays_url (str): The url to the public holidays.
+        table_schemas (Dict[str, Dict[str, Any]], optional): The read_csv keyword
+        arguments for each table. Defaults to config.get_table_schemas().
+        max_workers (int, optional): The number of workers reading csv files. With
+        more than one worker the files and the public holidays are fetched
+        concurrently. Defaults to 1.
+        pool (str, optional): "thread" or "process", the kind of pool used when
+        max_workers is greater than one. Defaults to "thread".
+        cache_dir (str, optional): The path to the extract cache folder. Parsed
+        tables are stored there and reused while their csv file and schema do not
+        change. Defaults to None (no cache).
+        holiday_years (Iterable[str], optional): The years of public holidays loaded
+        into the public_holidays table. Defaults to config.HOLIDAY_YEARS.
     Returns:
         Dict[str, DataFrame]: A dictionary with keys as the table names and values as
         the dataframes.
     """
-    dataframes = {
-        table_name: read_csv(f"{csv_folder}/{csv_file}")
-        for csv_file, table_name in csv_table_mapping.items()
-    }
+    table_schemas = get_table_schemas() if table_schemas is None else table_schemas
+    if max_workers > 1:
+        dataframes = extract_concurrently(
+            csv_folder,
+            csv_table_mapping,
+            public_holidays_url,
+            table_schemas,
+            max_workers,
+            pool,
+            cache_dir,
+            holiday_years,
+        )
+    else:
+        dataframes = {
+            table_name: read_table(
+                f"{csv_folder}/{csv_file}", table_name, table_schemas, cache_dir
+            )
+            for csv_file, table_name in csv_table_mapping.items()
+        }
 
-    holidays = get_public_holidays(public_holidays_url, "2017")
+        holidays = get_client(public_holidays_url).get_years(holiday_years)
 
-    dataframes["public_holidays"] = holidays
+        dataframes["public_holidays"] = holidays
+
+    if cache_dir is not None:
+        evict(cache_dir, EXTRACT_CACHE_MAX_BYTES)
 
     return dataframes
+
+
+def estimate_chunksize(
+    csv_path: str, table_schema: Dict[str, Any], memory_budget_bytes: int
+) -> int:
+    """Estimate how many rows of a csv file fit in the memory budget, measuring the
+    memory used by a sample of its first rows.
+    Args:
+        csv_path (str): The path to the csv file.
+        table_schema (Dict[str, Any]): The read_csv keyword arguments of the table.
+        memory_budget_bytes (int): The memory a chunk and its conversion into SQL
+        rows may use.
+    Returns:
+        int: The number of rows per chunk, at least 1000.
+    """
+    sample = read_csv(csv_path, nrows=1000, **table_schema)
+    if sample.empty:
+        return 1000
+    bytes_per_row = sample.memory_usage(index=True, deep=True).sum() / len(sample)
+    # A chunk plus its conversion into python tuples for executemany takes about
+    # three times the memory of the chunk itself.
+    return max(1000, int(memory_budget_bytes // (3 * bytes_per_row)))
+
+
+def read_table_chunks(
+    csv_path: str,
+    table_name: str,
+    table_schemas: Dict[str, Dict[str, Any]],
+    chunksize: int,
+) -> Iterator[DataFrame]:
+    """Read a csv file in chunks applying the schema declared for its table.
+    Args:
+        csv_path (str): The path to the csv file.
+        table_name (str): The name of the table the csv file is loaded into.
+        table_schemas (Dict[str, Dict[str, Any]]): The read_csv keyword arguments
+        for each table.
+        chunksize (int): The number of rows of each chunk.
+    Returns:
+        Iterator[DataFrame]: The dataframes with the rows of each chunk.
+    """
+    with read_csv(
+        csv_path, chunksize=chunksize, **table_schemas.get(table_name, {})
+    ) as reader:
+        yield from reader
+
+
+def stream_extract(
+    csv_folder: str,
+    csv_table_mapping: Dict[str, str],
+    public_holidays_url: str,
+    table_schemas: Optional[Dict[str, Dict[str, Any]]] = None,
+    memory_budget_bytes: int = STREAM_MEMORY_BUDGET_BYTES,
+    holiday_years: Iterable[str] = HOLIDAY_YEARS,
+) -> Dict[str, Iterator[DataFrame]]:
+    """Extract the data from the csv files as lazy sequences of chunks, meant to be
+    written with src.load.stream_load() without holding whole tables in memory.
+    Args:
+        csv_folder (str): The path to the csv's folder.
+        csv_table_mapping (Dict[str, str]): The mapping of the csv file names to the
+        table names.
+        public_holidays_url (str): The url to the public holidays.
+        table_schemas (Dict[str, Dict[str, Any]], optional): The read_csv keyword
+        arguments for each table. Defaults to config.get_table_schemas().
+        memory_budget_bytes (int, optional): The memory each chunk may use. Defaults
+        to config.STREAM_MEMORY_BUDGET_BYTES.
+        holiday_years (Iterable[str], optional): The years of public holidays loaded
+        into the public_holidays table. Defaults to config.HOLIDAY_YEARS.
+    Returns:
+        Dict[str, Iterator[DataFrame]]: A dictionary with keys as the table names and
+        values as the iterators over the chunks of each table.
+    """
+    table_schemas = get_table_schemas() if table_schemas is None else table_schemas
+    table_chunks = {}
+    for csv_file, table_name in csv_table_mapping.items():
+        csv_path = f"{csv_folder}/{csv_file}"
+        chunksize = estimate_chunksize(
+            csv_path, table_schemas.get(table_name, {}), memory_budget_bytes
+        )
+        table_chunks[table_name] = read_table_chunks(
+            csv_path, table_name, table_schemas, chunksize
+        )
+
+    table_chunks["public_holidays"] = iter(
+        [get_client(public_holidays_url).get_years(holiday_years)]
+    )
+
+    return table_chunks
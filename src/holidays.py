@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+import requests
+from pandas import DataFrame, concat, read_json, to_datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.config import (
+    HOLIDAYS_CACHE_PATH,
+    HOLIDAYS_CACHE_TTL_SECONDS,
+    HOLIDAYS_MAX_WORKERS,
+    HOLIDAYS_RETRIES,
+    HOLIDAYS_TIMEOUT_SECONDS,
+)
+
+
+class PublicHolidaysClient:
+    """Client of the public holidays API.
+
+    Responses are memoized in process and kept on disk for ttl_seconds per
+    (country, year), and every request goes through one pooled HTTP session.
+    """
+
+    def __init__(
+        self,
+        public_holidays_url: str,
+        country: str = "BR",
+        cache_dir: Optional[str] = HOLIDAYS_CACHE_PATH,
+        ttl_seconds: int = HOLIDAYS_CACHE_TTL_SECONDS,
+        max_workers: int = HOLIDAYS_MAX_WORKERS,
+        timeout: Tuple[float, float] = HOLIDAYS_TIMEOUT_SECONDS,
+        retries: int = HOLIDAYS_RETRIES,
+    ):
+        """
+        Args:
+            public_holidays_url (str): url to the public holidays.
+            country (str): The country code. Defaults to "BR".
+            cache_dir (str, optional): The folder of the on-disk cache, None disables
+            it. Defaults to config.HOLIDAYS_CACHE_PATH.
+            ttl_seconds (int): How long a cached year stays valid. Defaults to
+            config.HOLIDAYS_CACHE_TTL_SECONDS.
+            max_workers (int): The number of years requested at the same time.
+            Defaults to config.HOLIDAYS_MAX_WORKERS.
+            timeout (Tuple[float, float]): The (connect, read) seconds before a
+            request fails, so a stalled API does not block the pipeline. Defaults
+            to config.HOLIDAYS_TIMEOUT_SECONDS.
+            retries (int): The retries of a request that failed to connect, timed
+            out or got a server error. Defaults to config.HOLIDAYS_RETRIES.
+        """
+        self.public_holidays_url = public_holidays_url
+        self.country = country
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=max_workers, max_retries=retry
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._memo: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+
+    def _cache_file(self, year: str) -> Path:
+        url_hash = hashlib.sha256(self.public_holidays_url.encode()).hexdigest()[:12]
+        return Path(self.cache_dir) / f"{self.country}-{year}-{url_hash}.json"
+
+    def _read_cache(self, year: str) -> Optional[str]:
+        if self.cache_dir is None:
+            return None
+        cache_file = self._cache_file(year)
+        try:
+            if time.time() - cache_file.stat().st_mtime > self.ttl_seconds:
+                return None
+            with open(cache_file, "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_cache(self, year: str, payload: str):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        cache_file = self._cache_file(year)
+        tmp_file = cache_file.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp_file, "w") as f:
+            f.write(payload)
+        os.replace(tmp_file, cache_file)
+
+    def _fetch(self, year: str) -> str:
+        try:
+            response = self.session.get(
+                f"{self.public_holidays_url}/{year}/{self.country}",
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as err:
+            raise SystemExit(err)
+        # Validate the payload before it reaches the memo or the disk cache.
+        json.loads(response.text)
+        return response.text
+
+    def get_payload(self, year: str) -> str:
+        """Get the raw json response for the given year, from the memo, the disk
+        cache or the API, in that order.
+
+        Args:
+            year (str): The year to get the public holidays for.
+
+        Raises:
+            SystemExit: If the request fails.
+
+        Returns:
+            str: The json response of the API.
+        """
+        key = (self.country, str(year))
+        with self._lock:
+            payload = self._memo.get(key)
+        if payload is not None:
+            return payload
+
+        payload = self._read_cache(str(year))
+        if payload is None:
+            payload = self._fetch(str(year))
+            self._write_cache(str(year), payload)
+
+        with self._lock:
+            self._memo[key] = payload
+        return payload
+
+    def get(self, year: str) -> DataFrame:
+        """Get the public holidays for the given year.
+
+        Args:
+            year (str): The year to get the public holidays for.
+
+        Raises:
+            SystemExit: If the request fails.
+
+        Returns:
+            DataFrame: A dataframe with the public holidays.
+        """
+        df = read_json(StringIO(self.get_payload(year)))
+        df["date"] = to_datetime(df["date"])
+        df = df.drop(columns=["types", "counties"])
+        return df
+
+    def get_years(self, years: Iterable[str]) -> DataFrame:
+        """Get the public holidays of several years, requested concurrently.
+
+        Args:
+            years (Iterable[str]): The years to get the public holidays for.
+
+        Raises:
+            SystemExit: If any request fails.
+
+        Returns:
+            DataFrame: A dataframe with the public holidays of every year, in the
+            order of years.
+        """
+        years = [str(year) for year in years]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            dataframes = list(executor.map(self.get, years))
+        return concat(dataframes, ignore_index=True)
+
+    def get_range(self, start_year: int, end_year: int) -> DataFrame:
+        """Get the public holidays from start_year to end_year, both included.
+
+        Args:
+            start_year (int): The first year.
+            end_year (int): The last year.
+
+        Raises:
+            SystemExit: If any request fails.
+
+        Returns:
+            DataFrame: A dataframe with the public holidays of every year.
+        """
+        return self.get_years(range(int(start_year), int(end_year) + 1))
+
+
+_clients: Dict[str, PublicHolidaysClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(public_holidays_url: str) -> PublicHolidaysClient:
+    """Get the shared client for the given url, creating it on first use.
+
+    Args:
+        public_holidays_url (str): url to the public holidays.
+
+    Returns:
+        PublicHolidaysClient: The client shared by the whole process.
+    """
+    with _clients_lock:
+        if public_holidays_url not in _clients:
+            _clients[public_holidays_url] = PublicHolidaysClient(public_holidays_url)
+        return _clients[public_holidays_url]
@@ -1,19 +1,1515 @@
-from typing import Dict
+import os
+import re
+import stat
+import threading
+import time
+from collections import namedtuple
+from functools import partial
+from pathlib import Path
+from weakref import WeakKeyDictionary
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-from pandas import DataFrame
+import numpy as np
+from pandas import DataFrame, Series, Timedelta, Timestamp, io, isna, to_datetime
+from sqlalchemy import inspect
 from sqlalchemy.engine.base import Engine
 
+from src.config import (
+    INCREMENTAL_WATERMARKS,
+    LOAD_CHUNKSIZE,
+    LOAD_PRAGMAS,
+    PARTITIONED_TABLES,
+    PARTITION_OPEN_YEARS,
+    PARTITIONS_ROOT_PATH,
+    get_table_indexes,
+)
+from src.partitions import (
+    PARTITIONS_TABLE,
+    Partition,
+    get_partitions,
+    partition_schema,
+    writable_schemas,
+)
 
-def load(data_frames: Dict[str, DataFrame], database: Engine):
-    """Load the dataframes into the sqlite database.
+# Same text format SQLAlchemy uses for datetimes in SQLite, so both load paths
+# store identical values.
+SQLITE_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+LoadStats = namedtuple("LoadStats", ["rows", "seconds", "rows_per_second"])
+
+EPOCH = Timestamp("1970-01-01")
+
+WATERMARKS_TABLE = "load_watermarks"
+GENERATIONS_TABLE = "load_generations"
+
+# Number of loads run on each database by this process, so the caches built on
+# top of it can tell when its tables changed. File databases are counted by path,
+# shared by every engine opened on the same file.
+_load_generations: "WeakKeyDictionary[Engine, int]" = WeakKeyDictionary()
+_file_load_generations: Dict[str, int] = {}
+_load_generations_lock = threading.Lock()
+
+
+def _generations_of(database: Engine) -> Tuple[Dict[Any, int], Any]:
+    engine = database.engine
+    if engine.dialect.name == "sqlite" and engine.url.database not in (
+        None,
+        "",
+        ":memory:",
+    ):
+        return _file_load_generations, os.path.abspath(engine.url.database)
+    return _load_generations, engine
+
+
+def get_load_generation(database: Engine) -> int:
+    """Get how many times this process loaded data into the database.
+
+    Args:
+        database (Engine): Database connection, or a connection of the engine.
+
+    Returns:
+        int: The load generation, 0 if nothing was loaded yet.
+    """
+    generations, key = _generations_of(database)
+    with _load_generations_lock:
+        return generations.get(key, 0)
+
+
+def bump_load_generation(database: Engine):
+    """Mark the tables of the database as changed.
+
+    Args:
+        database (Engine): Database connection, or a connection of the engine.
+    """
+    generations, key = _generations_of(database)
+    with _load_generations_lock:
+        generations[key] = generations.get(key, 0) + 1
+
+
+def to_epoch(timestamps: Series) -> Series:
+    """Convert timestamps into seconds since the unix epoch.
+
+    Args:
+        timestamps (Series): The timestamps, as datetimes or text.
+
+    Returns:
+        Series: The seconds since the epoch, missing timestamps stay missing.
+    """
+    seconds = (to_datetime(timestamps) - EPOCH) // Timedelta(seconds=1)
+    return seconds.astype("Int64")
+
+
+def add_order_calendar_columns(orders: DataFrame) -> DataFrame:
+    """Add the derived date columns the queries filter and group on to the orders.
+
+    The columns added are the epoch seconds of the purchase, delivery and
+    estimated delivery timestamps (order_purchase_epoch,
+    order_delivered_customer_epoch, order_estimated_delivery_epoch), the purchase
+    year, month and date (purchase_year, purchase_month, purchase_date as
+    YYYY-MM-DD text) and the days between the estimated and the real delivery
+    dates (delivery_difference_days).
+
+    Args:
+        orders (DataFrame): The olist_orders dataframe.
+
+    Returns:
+        DataFrame: A copy of the orders with the derived columns.
+    """
+    orders = orders.copy()
+    purchase = to_datetime(orders["order_purchase_timestamp"])
+    delivered = to_datetime(orders["order_delivered_customer_date"])
+    estimated = to_datetime(orders["order_estimated_delivery_date"])
+
+    orders["order_purchase_epoch"] = to_epoch(purchase)
+    orders["order_delivered_customer_epoch"] = to_epoch(delivered)
+    orders["order_estimated_delivery_epoch"] = to_epoch(estimated)
+    orders["purchase_year"] = purchase.dt.year.astype("Int16")
+    orders["purchase_month"] = purchase.dt.month.astype("Int8")
+    orders["purchase_date"] = purchase.dt.strftime("%Y-%m-%d")
+    orders["delivery_difference_days"] = (
+        (delivered.dt.normalize() - estimated.dt.normalize()) // Timedelta(days=1)
+    ).astype("Int32")
+    return orders
+
+
+# Columns computed once at load time, by table.
+DERIVED_COLUMNS: Dict[str, Callable[[DataFrame], DataFrame]] = {
+    "olist_orders": add_order_calendar_columns,
+}
+
+
+def add_derived_columns(
+    table_chunks: Dict[str, Iterable[DataFrame]]
+) -> Dict[str, Iterable[DataFrame]]:
+    """Add the DERIVED_COLUMNS of each table to its dataframes, lazily.
+
+    Args:
+        table_chunks (Dict[str, Iterable[DataFrame]]): A dictionary with keys as the
+        table names and values as the dataframes holding the table rows.
+
+    Returns:
+        Dict[str, Iterable[DataFrame]]: The same tables with the derived columns.
+    """
+    return {
+        table_name: (
+            map(DERIVED_COLUMNS[table_name], chunks)
+            if table_name in DERIVED_COLUMNS
+            else chunks
+        )
+        for table_name, chunks in table_chunks.items()
+    }
+
+
+# Tables materialized from the loaded ones, with the tables they are built from.
+# Lookups are LEFT JOINs so every delivered item is kept; the key taken from the
+# looked up table is NULL when it has no match.
+FACT_TABLES = {
+    "delivered_order_items": dict(
+        sources=[
+            "olist_orders",
+            "olist_order_items",
+            "olist_customers",
+            "olist_products",
+            "product_category_name_translation",
+        ],
+        query="""
+            SELECT
+                o.order_id,
+                oi.order_item_id,
+                c.customer_id,
+                c.customer_state,
+                p.product_id,
+                p.product_weight_g,
+                t.product_category_name_english,
+                oi.price,
+                oi.freight_value,
+                oi.price + oi.freight_value AS revenue
+            FROM
+                olist_orders o
+                JOIN olist_order_items oi ON o.order_id = oi.order_id
+                LEFT JOIN olist_customers c ON o.customer_id = c.customer_id
+                LEFT JOIN olist_products p ON oi.product_id = p.product_id
+                LEFT JOIN product_category_name_translation t
+                    ON p.product_category_name = t.product_category_name
+            WHERE
+                o.order_status = 'delivered'
+                AND o.order_delivered_customer_date IS NOT NULL
+        """,
+    ),
+}
+
+
+# Daily aggregates of the orders and of their items by purchase day, customer
+# state, category and status, kept up to date by load(). {where} is empty when a
+# table is rebuilt and selects one purchase day when only that day changed.
+ROLLUP_TABLES = {
+    "daily_order_rollup": dict(
+        sources=["olist_orders", "olist_customers"],
+        query="""
+            SELECT
+                o.purchase_year,
+                o.purchase_month,
+                o.purchase_date,
+                c.customer_state,
+                o.order_status,
+                o.order_delivered_customer_date IS NOT NULL AS delivered,
+                COUNT(*) AS order_count,
+                SUM(
+                    (o.order_delivered_customer_epoch - o.order_purchase_epoch)
+                    / 86400.0
+                ) AS delivery_days,
+                SUM(
+                    (o.order_estimated_delivery_epoch - o.order_purchase_epoch)
+                    / 86400.0
+                ) AS estimated_delivery_days
+            FROM
+                olist_orders o
+                LEFT JOIN olist_customers c ON o.customer_id = c.customer_id
+            {where}
+            GROUP BY
+                o.purchase_year, o.purchase_month, o.purchase_date,
+                c.customer_state, o.order_status, delivered
+        """,
+    ),
+    "daily_item_rollup": dict(
+        sources=[
+            "olist_orders",
+            "olist_order_items",
+            "olist_customers",
+            "olist_products",
+            "product_category_name_translation",
+        ],
+        query="""
+            SELECT
+                o.purchase_year,
+                o.purchase_month,
+                o.purchase_date,
+                c.customer_state,
+                t.product_category_name_english,
+                o.order_status,
+                o.order_delivered_customer_date IS NOT NULL AS delivered,
+                COUNT(DISTINCT o.order_id) AS order_count,
+                COUNT(*) AS item_count,
+                SUM(oi.price) AS price,
+                SUM(oi.freight_value) AS freight_value,
+                SUM(oi.price + oi.freight_value) AS revenue
+            FROM
+                olist_orders o
+                JOIN olist_order_items oi ON o.order_id = oi.order_id
+                LEFT JOIN olist_customers c ON o.customer_id = c.customer_id
+                LEFT JOIN olist_products p ON oi.product_id = p.product_id
+                LEFT JOIN product_category_name_translation t
+                    ON p.product_category_name = t.product_category_name
+            {where}
+            GROUP BY
+                o.purchase_year, o.purchase_month, o.purchase_date,
+                c.customer_state, t.product_category_name_english, o.order_status,
+                delivered
+        """,
+    ),
+}
+ROLLUP_DAY_FILTER = "WHERE o.purchase_year IS ? AND o.purchase_date IS ?"
+# Purchase days written to since the rollups were refreshed, filled by triggers
+# on the tables whose rows belong to a single purchase day.
+ROLLUP_DIRTY_DAYS_TABLE = "rollup_dirty_days"
+ROLLUP_TRIGGERS = {
+    "olist_orders": {
+        "INSERT": ["NEW"],
+        "UPDATE": ["OLD", "NEW"],
+        "DELETE": ["OLD"],
+    },
+    "olist_order_items": {
+        "INSERT": ["NEW"],
+        "UPDATE": ["OLD", "NEW"],
+        "DELETE": ["OLD"],
+    },
+}
+
+
+def to_sql_rows(df: DataFrame) -> Iterator[Tuple[Any, ...]]:
+    """Convert a dataframe into tuples of python values that sqlite3 can bind.
+
+    Datetimes become text, categoricals their values and missing values None.
+
+    Args:
+        df (DataFrame): The dataframe to convert.
+
+    Returns:
+        Iterator[Tuple[Any, ...]]: One tuple per row.
+    """
+    columns: List[List[Any]] = []
+    for _, series in df.items():
+        if series.dtype.kind == "M":
+            series = series.dt.strftime(SQLITE_DATETIME_FORMAT)
+        # Only numpy numeric columns turn into python scalars on tolist(), the
+        # nullable extension dtypes must go through object.
+        if (
+            series.hasnans
+            or not isinstance(series.dtype, np.dtype)
+            or series.dtype.kind not in "biuf"
+        ):
+            series = series.astype(object).where(series.notna(), None)
+        columns.append(series.tolist())
+    return zip(*columns)
+
+
+def set_pragmas(cursor, pragmas: Dict[str, Any]) -> Dict[str, Any]:
+    """Set SQLite pragmas of the main database and return their previous values.
+
+    Args:
+        cursor: A DB-API cursor of a SQLite connection.
+        pragmas (Dict[str, Any]): The pragma names and their new values.
+
+    Returns:
+        Dict[str, Any]: The pragma names and their values before the change.
+    """
+    previous = {}
+    for name, value in pragmas.items():
+        previous[name] = cursor.execute(f"PRAGMA main.{name}").fetchone()[0]
+        cursor.execute(f"PRAGMA main.{name} = {value}")
+    return previous
+
+
+def create_table(cursor, table_name: str, df: DataFrame):
+    """Drop the table if it exists and create it with the columns of the dataframe.
+
+    Args:
+        cursor: A DB-API cursor of a SQLite connection.
+        table_name (str): The name of the table.
+        df (DataFrame): A dataframe with the columns and dtypes of the table.
+    """
+    cursor.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+    cursor.execute(io.sql.get_schema(df, table_name, con=cursor.connection))
+
+
+def insert_rows(cursor, table_name: str, df: DataFrame, chunksize: int) -> int:
+    """Insert the dataframe rows using chunked executemany calls.
+
+    Args:
+        cursor: A DB-API cursor of a SQLite connection.
+        table_name (str): The name of the table.
+        df (DataFrame): The dataframe to write, its index is not stored.
+        chunksize (int): The number of rows sent on each executemany call.
+
+    Returns:
+        int: The number of rows written.
+    """
+    columns = ", ".join(f'"{column}"' for column in df.columns)
+    placeholders = ", ".join("?" * len(df.columns))
+    insert = f'INSERT INTO "{table_name}" ({columns}) VALUES ({placeholders})'
+    for start in range(0, len(df), chunksize):
+        cursor.executemany(insert, to_sql_rows(df.iloc[start : start + chunksize]))
+    return len(df)
+
+
+def bulk_load_table(
+    cursor, table_name: str, chunks: Iterable[DataFrame], chunksize: int
+) -> int:
+    """Replace a table with the rows of a sequence of dataframes. The table is
+    created from the columns of the first one.
+
+    The caller is responsible for the transaction around this function.
+
+    Args:
+        cursor: A DB-API cursor of a SQLite connection.
+        table_name (str): The name of the table.
+        chunks (Iterable[DataFrame]): The dataframes to write, consumed one at a
+        time so only one of them needs to be in memory.
+        chunksize (int): The number of rows sent on each executemany call.
+
+    Returns:
+        int: The number of rows written.
+    """
+    if table_name in INCREMENTAL_WATERMARKS:
+        reset_watermark(cursor, table_name)
+
+    rows = 0
+    for i, df in enumerate(chunks):
+        if i == 0:
+            create_table(cursor, table_name, df)
+        rows += insert_rows(cursor, table_name, df, chunksize)
+        if table_name in INCREMENTAL_WATERMARKS:
+            set_watermark(cursor, table_name, INCREMENTAL_WATERMARKS[table_name], df)
+    return rows
+
+
+def bulk_load(
+    data_frames: Dict[str, DataFrame],
+    database: Engine,
+    chunksize: int = LOAD_CHUNKSIZE,
+    pragmas: Dict[str, Any] = LOAD_PRAGMAS,
+) -> Dict[str, LoadStats]:
+    """Load the dataframes into a SQLite database with one transaction per table
+    and the load-time pragmas set. The previous pragmas are restored at the end.
 
     Args:
         data_frames (Dict[str, DataFrame]): A dictionary with keys as the table names
         and values as the dataframes.
+        database (Engine): Database connection, it must be a SQLite database.
+        chunksize (int): The number of rows sent on each executemany call.
+        pragmas (Dict[str, Any]): The pragmas set during the load.
+
+    Returns:
+        Dict[str, LoadStats]: The rows, seconds and rows per second of each table.
     """
-    # TODO: Implementa esta función. Por cada DataFrame en el diccionario, debes
-    # usar pandas.DataFrame.to_sql() para cargar el DataFrame en la base de datos
-    # como una tabla.
-    # Para el nombre de la tabla, utiliza las claves del diccionario `data_frames`.
+    return write_tables(
+        {table_name: [df] for table_name, df in data_frames.items()},
+        database,
+        chunksize,
+        pragmas,
+    )
+
+
+def stream_load(
+    table_chunks: Dict[str, Iterable[DataFrame]],
+    database: Engine,
+    chunksize: int = LOAD_CHUNKSIZE,
+    pragmas: Dict[str, Any] = LOAD_PRAGMAS,
+) -> Dict[str, LoadStats]:
+    """Load tables given as sequences of dataframes into a SQLite database, adding
+    the DERIVED_COLUMNS to each chunk. Each sequence is consumed lazily, so with
+    the chunked readers of src.extract.stream_extract() memory stays bounded by the
+    chunk size whatever the size of the csv files.
+
+    Args:
+        table_chunks (Dict[str, Iterable[DataFrame]]): A dictionary with keys as the
+        table names and values as the dataframes holding the table rows.
+        database (Engine): Database connection, it must be a SQLite database.
+        chunksize (int): The number of rows sent on each executemany call.
+        pragmas (Dict[str, Any]): The pragmas set during the load.
+
+    Returns:
+        Dict[str, LoadStats]: The rows, seconds and rows per second of each table.
+    """
+    if not set(table_chunks).isdisjoint(PARTITIONED_TABLES):
+        # The streamed tables are replaced, the other partitioned ones are kept.
+        unpartition_tables(database, replaced_tables=table_chunks)
+    return write_tables(
+        add_derived_columns(table_chunks), database, chunksize, pragmas
+    )
+
+
+def write_tables(
+    table_chunks: Dict[str, Iterable[DataFrame]],
+    database: Engine,
+    chunksize: int = LOAD_CHUNKSIZE,
+    pragmas: Dict[str, Any] = LOAD_PRAGMAS,
+    write_table: Callable[..., int] = bulk_load_table,
+) -> Dict[str, LoadStats]:
+    """Write tables given as sequences of dataframes into a SQLite database, with
+    one transaction per table and the load-time pragmas set. The previous pragmas
+    are restored at the end. Each sequence is consumed one dataframe at a time.
+
+    Args:
+        table_chunks (Dict[str, Iterable[DataFrame]]): A dictionary with keys as the
+        table names and values as the dataframes holding the table rows.
+        database (Engine): Database connection, it must be a SQLite database.
+        chunksize (int): The number of rows sent on each executemany call.
+        pragmas (Dict[str, Any]): The pragmas set during the load.
+        write_table (Callable[..., int]): The function writing one table, called
+        with the cursor, the table name, its dataframes and the chunksize. Defaults
+        to bulk_load_table(), which replaces the table.
+
+    Returns:
+        Dict[str, LoadStats]: The rows, seconds and rows per second of each table.
+    """
+    stats = {}
+    connection = database.raw_connection()
+    try:
+        cursor = connection.cursor()
+        previous_pragmas = set_pragmas(cursor, pragmas)
+        try:
+            for table_name, chunks in table_chunks.items():
+                start = time.perf_counter()
+                cursor.execute("BEGIN")
+                try:
+                    rows = write_table(cursor, table_name, chunks, chunksize)
+                    bump_table_generation(cursor, table_name)
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    raise
+                seconds = time.perf_counter() - start
+                stats[table_name] = LoadStats(
+                    rows=rows,
+                    seconds=seconds,
+                    rows_per_second=rows / seconds if seconds else float("inf"),
+                )
+        finally:
+            set_pragmas(cursor, previous_pragmas)
+            cursor.close()
+    finally:
+        connection.close()
+        bump_load_generation(database)
+    return stats
+
+
+def bump_table_generation(cursor, table_name: str):
+    """Count one more load of a table in the database, so readers in any process
+    can tell its rows changed.
+
+    Args:
+        cursor: A DB-API cursor of a SQLite connection.
+        table_name (str): The name of the table.
+    """
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {GENERATIONS_TABLE} "
+        "(table_name TEXT PRIMARY KEY, generation INTEGER NOT NULL)"
+    )
+    cursor.execute(
+        f"INSERT INTO {GENERATIONS_TABLE} VALUES (?, 1) ON CONFLICT (table_name) "
+        "DO UPDATE SET generation = generation + 1",
+        (table_name,),
+    )
+
+
+def table_exists(cursor, table_name: str) -> bool:
+    """Check if a table exists in a SQLite database.
+
+    Args:
+        cursor: A DB-API cursor of a SQLite connection.
+        table_name (str): The name of the table.
+
+    Returns:
+        bool: True if the table exists.
+    """
+    return (
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (table_name,),
+        ).fetchone()
+        is not None
+    )
+
+
+def upsert_rows(
+    cursor, table_name: str, df: DataFrame, key: List[str], chunksize: int
+) -> int:
+    """Insert the new rows of the dataframe and update the rows whose key already
+    exists, only when some of their values changed.
+
+    Args:
+        cursor: A DB-API cursor of a SQLite connection.
+        table_name (str): The name of the table, it needs a unique index on key.
+        df (DataFrame): The dataframe to write, its index is not stored.
+        key (List[str]): The columns identifying a row.
+        chunksize (int): The number of rows sent on each executemany call.
+
+    Returns:
+        int: The number of rows inserted or updated.
+    """
+    columns = ", ".join(f'"{column}"' for column in df.columns)
+    placeholders = ", ".join("?" * len(df.columns))
+    key_columns = ", ".join(f'"{column}"' for column in key)
+    values = [column for column in df.columns if column not in key]
+    if values:
+        assignments = ", ".join(f'"{column}" = excluded."{column}"' for column in values)
+        changed = " OR ".join(
+            f'"{table_name}"."{column}" IS NOT excluded."{column}"' for column in values
+        )
+        on_conflict = f"DO UPDATE SET {assignments} WHERE {changed}"
+    else:
+        on_conflict = "DO NOTHING"
+    upsert = (
+        f'INSERT INTO "{table_name}" ({columns}) VALUES ({placeholders}) '
+        f"ON CONFLICT ({key_columns}) {on_conflict}"
+    )
+
+    rows = 0
+    for start in range(0, len(df), chunksize):
+        cursor.executemany(upsert, to_sql_rows(df.iloc[start : start + chunksize]))
+        rows += cursor.rowcount
+    return rows
+
+
+def get_watermark(cursor, table_name: str) -> Optional[Timestamp]:
+    """Get the high-water mark stored for a table.
+
+    Args:
+        cursor: A DB-API cursor of a SQLite connection.
+        table_name (str): The name of the table.
+
+    Returns:
+        Optional[Timestamp]: The greatest value of the watermark column loaded so
+        far, or None if the table was never loaded incrementally.
+    """
+    if not table_exists(cursor, WATERMARKS_TABLE):
+        return None
+    row = cursor.execute(
+        f"SELECT value FROM {WATERMARKS_TABLE} WHERE table_name = ?", (table_name,)
+    ).fetchone()
+    return None if row is None else Timestamp(row[0])
+
+
+def reset_watermark(cursor, table_name: str):
+    """Forget the high-water mark of a table, before its rows are replaced.
+
+    Args:
+        cursor: A DB-API cursor of a SQLite connection.
+        table_name (str): The name of the table.
+    """
+    if table_exists(cursor, WATERMARKS_TABLE):
+        cursor.execute(
+            f"DELETE FROM {WATERMARKS_TABLE} WHERE table_name = ?", (table_name,)
+        )
+
+
+def set_watermark(cursor, table_name: str, column: str, df: DataFrame):
+    """Raise the high-water mark of a table to the greatest value of its watermark
+    column in the dataframe.
+
+    Args:
+        cursor: A DB-API cursor of a SQLite connection.
+        table_name (str): The name of the table.
+        column (str): The watermark column.
+        df (DataFrame): The rows just loaded.
+    """
+    latest = to_datetime(df[column]).max()
+    if isna(latest):
+        return
+    current = get_watermark(cursor, table_name)
+    if current is not None and current >= latest:
+        return
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {WATERMARKS_TABLE} "
+        "(table_name TEXT PRIMARY KEY, column_name TEXT, value TEXT)"
+    )
+    cursor.execute(
+        f"INSERT OR REPLACE INTO {WATERMARKS_TABLE} VALUES (?, ?, ?)",
+        (table_name, column, latest.strftime(SQLITE_DATETIME_FORMAT)),
+    )
+
+
+def upsert_table(
+    cursor,
+    table_name: str,
+    chunks: Iterable[DataFrame],
+    chunksize: int,
+    table_indexes: Dict[str, Dict[str, Any]],
+) -> int:
+    """Merge the rows of a sequence of dataframes into a table using its primary
+    key, and raise its high-water mark. Tables that do not exist yet or that have
+    no primary key are replaced as bulk_load_table() does.
+
+    The caller is responsible for the transaction around this function.
+
+    Args:
+        cursor: A DB-API cursor of a SQLite connection.
+        table_name (str): The name of the table.
+        chunks (Iterable[DataFrame]): The dataframes to write.
+        chunksize (int): The number of rows sent on each executemany call.
+        table_indexes (Dict[str, Dict[str, Any]]): The keys and indexes of each
+        table, as declared by config.get_table_indexes().
+
+    Returns:
+        int: The number of rows inserted or updated.
+    """
+    table_index = table_indexes.get(table_name, {})
+    key = table_index.get("primary_key")
+    index_statements = get_index_statements(table_name, table_index).values()
+    if not key or not table_exists(cursor, table_name):
+        rows = bulk_load_table(cursor, table_name, chunks, chunksize)
+        for statement in index_statements:
+            cursor.execute(statement)
+        return rows
+
+    # ON CONFLICT needs the unique index of the key.
+    for statement in index_statements:
+        cursor.execute(statement)
+    rows = 0
+    for df in chunks:
+        rows += upsert_rows(cursor, table_name, df, key, chunksize)
+        if table_name in INCREMENTAL_WATERMARKS:
+            set_watermark(cursor, table_name, INCREMENTAL_WATERMARKS[table_name], df)
+    return rows
+
+
+def incremental_load(
+    data_frames: Dict[str, DataFrame],
+    database: Engine,
+    only_after_watermark: bool = False,
+    chunksize: int = LOAD_CHUNKSIZE,
+    pragmas: Dict[str, Any] = LOAD_PRAGMAS,
+    table_indexes: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> Dict[str, LoadStats]:
+    """Merge the dataframes into a SQLite database keyed on the primary key of each
+    table, so the cost depends on the size of the new data and not on the size
+    of the history. Tables without a primary key are replaced.
+
+    Args:
+        data_frames (Dict[str, DataFrame]): A dictionary with keys as the table names
+        and values as the new or changed rows of each table.
+        database (Engine): Database connection, it must be a SQLite database.
+        only_after_watermark (bool): Keep only the orders purchased after the
+        high-water mark of olist_orders, and the rows of other tables that belong
+        to them, so a full extract can be loaded as a delta. Defaults to False.
+        chunksize (int): The number of rows sent on each executemany call.
+        pragmas (Dict[str, Any]): The pragmas set during the load.
+        table_indexes (Dict[str, Dict[str, Any]], optional): The keys and indexes of
+        each table. Defaults to config.get_table_indexes().
+
+    Returns:
+        Dict[str, LoadStats]: The rows inserted or updated, seconds and rows per
+        second of each table.
+    """
+    table_indexes = get_table_indexes() if table_indexes is None else table_indexes
+    if only_after_watermark:
+        connection = database.raw_connection()
+        try:
+            cursor = connection.cursor()
+            watermarks = {
+                table_name: get_watermark(cursor, table_name)
+                for table_name in INCREMENTAL_WATERMARKS
+            }
+            cursor.close()
+        finally:
+            connection.close()
+        data_frames = rows_after_watermarks(data_frames, watermarks)
+
+    return write_tables(
+        {table_name: [df] for table_name, df in data_frames.items()},
+        database,
+        chunksize,
+        pragmas,
+        write_table=partial(upsert_table, table_indexes=table_indexes),
+    )
+
+
+def rows_after_watermarks(
+    data_frames: Dict[str, DataFrame], watermarks: Dict[str, Optional[Timestamp]]
+) -> Dict[str, DataFrame]:
+    """Keep the orders newer than the olist_orders high-water mark and the rows of
+    the tables that reference them by order_id.
+
+    Args:
+        data_frames (Dict[str, DataFrame]): A dictionary with keys as the table names
+        and values as the dataframes.
+        watermarks (Dict[str, Optional[Timestamp]]): The high-water mark of each
+        table in INCREMENTAL_WATERMARKS, None when it has not been loaded yet.
+
+    Returns:
+        Dict[str, DataFrame]: The dataframes restricted to the new orders.
+    """
+    watermark = watermarks.get("olist_orders")
+    if watermark is None or "olist_orders" not in data_frames:
+        return data_frames
+
+    orders = data_frames["olist_orders"]
+    column = INCREMENTAL_WATERMARKS["olist_orders"]
+    orders = orders[to_datetime(orders[column]) > watermark]
+    filtered = dict(data_frames, olist_orders=orders)
     for table_name, df in data_frames.items():
-        df.to_sql(table_name, con=database, if_exists="replace")
+        if table_name != "olist_orders" and "order_id" in df.columns:
+            filtered[table_name] = df[df["order_id"].isin(orders["order_id"])]
+    return filtered
+
+
+def get_index_statements(
+    table_name: str, table_index: Dict[str, Any], schema: Optional[str] = None
+) -> Dict[str, str]:
+    """Build the CREATE INDEX statements of a table.
+
+    Args:
+        table_name (str): The name of the table.
+        table_index (Dict[str, Any]): The primary_key and indexes of the table, as
+        declared by config.get_table_indexes().
+        schema (str, optional): The attached database holding the table. Defaults
+        to None, the main database.
+
+    Returns:
+        Dict[str, str]: A dictionary with keys as the index names and values as
+        their CREATE INDEX statements.
+    """
+    prefix = f'"{schema}".' if schema else ""
+    statements = {}
+    if table_index.get("primary_key"):
+        name = f"pk_{table_name}"
+        columns = ", ".join(f'"{column}"' for column in table_index["primary_key"])
+        statements[name] = (
+            f'CREATE UNIQUE INDEX IF NOT EXISTS {prefix}"{name}" ON "{table_name}" '
+            f"({columns})"
+        )
+    for index_columns in table_index.get("indexes", []):
+        name = f"ix_{table_name}_{'_'.join(index_columns)}"
+        columns = ", ".join(f'"{column}"' for column in index_columns)
+        statements[name] = (
+            f'CREATE INDEX IF NOT EXISTS {prefix}"{name}" ON "{table_name}" ({columns})'
+        )
+    return statements
+
+
+def create_indexes(
+    database: Engine,
+    table_names: Iterable[str],
+    table_indexes: Optional[Dict[str, Dict[str, Any]]] = None,
+    analyze: bool = True,
+):
+    """Create the declared keys and indexes of the given tables and refresh the
+    query planner statistics.
+
+    Args:
+        database (Engine): Database connection.
+        table_names (Iterable[str]): The tables whose indexes are created.
+        table_indexes (Dict[str, Dict[str, Any]], optional): The keys and indexes of
+        each table. Defaults to config.get_table_indexes().
+        analyze (bool, optional): Run a full ANALYZE of main and the partitions
+        that are not frozen. When False, PRAGMA optimize only refreshes the
+        statistics SQLite considers stale. Defaults to True.
+
+    Raises:
+        ValueError: If an index uses a column the table does not have.
+    """
+    table_indexes = get_table_indexes() if table_indexes is None else table_indexes
+    with database.begin() as connection:
+        inspector = inspect(connection)
+        for table_name in table_names:
+            table_index = table_indexes.get(table_name, {})
+            # SQLite would silently index a missing "column" as a string literal.
+            columns = {column["name"] for column in inspector.get_columns(table_name)}
+            for index_columns in [table_index.get("primary_key", [])] + table_index.get(
+                "indexes", []
+            ):
+                for column in index_columns:
+                    if column not in columns:
+                        raise ValueError(
+                            f"La columna {column} no existe en la tabla {table_name}"
+                        )
+            statements = get_index_statements(table_name, table_index)
+            for statement in statements.values():
+                connection.exec_driver_sql(statement)
+        if connection.dialect.name != "sqlite":
+            connection.exec_driver_sql("ANALYZE")
+            return
+        # The frozen partitions are read only, they were analyzed when written.
+        partitions = connection.connection.info.get("partitions", [])
+        for schema in writable_schemas(partitions):
+            connection.exec_driver_sql(
+                f'ANALYZE "{schema}"' if analyze else f'PRAGMA "{schema}".optimize'
+            )
+
+
+def drop_indexes(
+    database: Engine,
+    table_names: Iterable[str],
+    table_indexes: Optional[Dict[str, Dict[str, Any]]] = None,
+):
+    """Drop the declared keys and indexes of the given tables and the query
+    planner statistics.
+
+    Args:
+        database (Engine): Database connection.
+        table_names (Iterable[str]): The tables whose indexes are dropped.
+        table_indexes (Dict[str, Dict[str, Any]], optional): The keys and indexes of
+        each table. Defaults to config.get_table_indexes().
+    """
+    table_indexes = get_table_indexes() if table_indexes is None else table_indexes
+    with database.begin() as connection:
+        for table_name in table_names:
+            statements = get_index_statements(
+                table_name, table_indexes.get(table_name, {})
+            )
+            for name in statements:
+                connection.exec_driver_sql(f'DROP INDEX IF EXISTS "{name}"')
+        # Unqualified, it would look for the table in the partitions attached.
+        connection.exec_driver_sql("DROP TABLE IF EXISTS main.sqlite_stat1")
+
+
+def load(
+    data_frames: Dict[str, DataFrame],
+    database: Engine,
+    method: str = "bulk",
+    only_after_watermark: bool = False,
+    partitions_dir: Optional[str] = None,
+) -> Dict[str, LoadStats]:
+    """Load the dataframes into the sqlite database.
+
+    The DERIVED_COLUMNS are added before writing, and the keys and indexes of
+    config.get_table_indexes() are created once the data is written, followed by
+    ANALYZE. The FACT_TABLES built from the tables that changed are rebuilt last,
+    and the ROLLUP_TABLES refreshed, see refresh_rollup_tables(). Partitioned tables are
+    partitioned again once written, see partition_tables().
+
+    Args:
+        data_frames (Dict[str, DataFrame]): A dictionary with keys as the table names
+        and values as the dataframes.
+        database (Engine): Database connection.
+        method (str, optional): "bulk" writes each table with chunked executemany
+        calls in a single transaction, "to_sql" uses pandas.DataFrame.to_sql().
+        "incremental" merges the rows into the existing tables by primary key (see
+        incremental_load()). Databases other than SQLite always use "to_sql".
+        Defaults to "bulk".
+        only_after_watermark (bool, optional): With the "incremental" method, keep
+        only the orders newer than the last loaded ones. Defaults to False.
+        partitions_dir (str, optional): Partition the PARTITIONED_TABLES by year
+        into this folder. Defaults to None, the folder they are already
+        partitioned in, if any.
+
+    Returns:
+        Dict[str, LoadStats]: The rows, seconds and rows per second of each table.
+    """
+    if method not in ("bulk", "to_sql", "incremental"):
+        raise ValueError(
+            f"Unknown load method {method!r}, expected 'bulk', 'to_sql' or "
+            "'incremental'"
+        )
+
+    data_frames = {
+        table_name: (
+            DERIVED_COLUMNS[table_name](df) if table_name in DERIVED_COLUMNS else df
+        )
+        for table_name, df in data_frames.items()
+    }
+
+    is_sqlite = database.dialect.name == "sqlite"
+    previous_partitions_dir = get_partitions_dir(database)
+    if previous_partitions_dir and not set(data_frames).isdisjoint(
+        PARTITIONED_TABLES
+    ):
+        # Merging rows by key needs the previous rows, replacing a table does not.
+        unpartition_tables(
+            database, replaced_tables=() if method == "incremental" else data_frames
+        )
+    if partitions_dir is None and not is_memory_database(database):
+        partitions_dir = previous_partitions_dir
+
+    if method == "bulk" and is_sqlite:
+        stats = bulk_load(data_frames, database)
+    elif method == "incremental" and is_sqlite:
+        stats = incremental_load(data_frames, database, only_after_watermark)
+    else:
+        stats = {}
+        for table_name, df in data_frames.items():
+            start = time.perf_counter()
+            df.to_sql(table_name, con=database, if_exists="replace")
+            seconds = time.perf_counter() - start
+            stats[table_name] = LoadStats(
+                rows=len(df),
+                seconds=seconds,
+                rows_per_second=len(df) / seconds if seconds else float("inf"),
+            )
+        if is_sqlite:
+            connection = database.raw_connection()
+            try:
+                cursor = connection.cursor()
+                for table_name in stats:
+                    bump_table_generation(cursor, table_name)
+                connection.commit()
+            finally:
+                connection.close()
+        bump_load_generation(database)
+
+    # A full ANALYZE would scan the whole history on every incremental load.
+    create_indexes(database, stats.keys(), analyze=method != "incremental")
+    # The tables an incremental load merged no row into did not change, e.g. the
+    # lookup tables of a full extract loaded again.
+    changed_tables = [
+        table_name
+        for table_name, table_stats in stats.items()
+        if table_stats.rows or method != "incremental"
+    ]
+    stats.update(build_fact_tables(database, changed_tables))
+    stats.update(refresh_rollup_tables(database, changed_tables))
+    if partitions_dir:
+        stats.update(partition_tables(database, partitions_dir))
+
+    print_load_stats(stats)
+    return stats
+
+
+def build_fact_tables(
+    database: Engine, table_names: Iterable[str]
+) -> Dict[str, LoadStats]:
+    """Rebuild the FACT_TABLES built from any of the given tables, with their
+    indexes. A fact table is skipped while some of its sources are not loaded.
+
+    Args:
+        database (Engine): Database connection.
+        table_names (Iterable[str]): The tables just loaded.
+
+    Returns:
+        Dict[str, LoadStats]: The rows, seconds and rows per second of each fact
+        table built.
+    """
+    table_names = set(table_names)
+    existing_tables = get_relation_names(database)
+    stats = {}
+    for fact_table, fact in FACT_TABLES.items():
+        sources = fact["sources"]
+        if table_names.isdisjoint(sources) or not existing_tables.issuperset(sources):
+            continue
+        start = time.perf_counter()
+        with database.begin() as connection:
+            connection.exec_driver_sql(f'DROP TABLE IF EXISTS "{fact_table}"')
+            connection.exec_driver_sql(
+                f'CREATE TABLE "{fact_table}" AS {fact["query"]}'
+            )
+            rows = connection.exec_driver_sql(
+                f'SELECT COUNT(*) FROM "{fact_table}"'
+            ).scalar()
+            if database.dialect.name == "sqlite":
+                cursor = connection.connection.cursor()
+                bump_table_generation(cursor, fact_table)
+                cursor.close()
+        create_indexes(database, [fact_table])
+        seconds = time.perf_counter() - start
+        stats[fact_table] = LoadStats(
+            rows=rows,
+            seconds=seconds,
+            rows_per_second=rows / seconds if seconds else float("inf"),
+        )
+    if stats:
+        bump_load_generation(database)
+    return stats
+
+
+def get_rollup_trigger_statements(table_name: str) -> Dict[str, str]:
+    """Get the CREATE TRIGGER statements that record the purchase day of every
+    row written to one of the ROLLUP_TRIGGERS tables, keyed by trigger name.
+
+    Args:
+        table_name (str): olist_orders or olist_order_items.
+
+    Returns:
+        Dict[str, str]: The statement of each trigger.
+    """
+    # INSERT OR IGNORE would take the conflict policy of the upsert firing the
+    # trigger, so the days already recorded are skipped explicitly.
+    record_day = (
+        f"INSERT INTO {ROLLUP_DIRTY_DAYS_TABLE} SELECT year, day FROM ({{days}}) "
+        f"WHERE NOT EXISTS (SELECT 1 FROM {ROLLUP_DIRTY_DAYS_TABLE} "
+        "WHERE purchase_year IS year AND purchase_date IS day);"
+    )
+    statements = {}
+    for event, rows in ROLLUP_TRIGGERS[table_name].items():
+        trigger = f"{table_name}_rollup_{event.lower()}"
+        if table_name == "olist_orders":
+            days = [
+                f"SELECT {row}.purchase_year AS year, {row}.purchase_date AS day"
+                for row in rows
+            ]
+        else:
+            days = [
+                "SELECT purchase_year AS year, purchase_date AS day "
+                f"FROM olist_orders WHERE order_id = {row}.order_id"
+                for row in rows
+            ]
+        inserts = " ".join(record_day.format(days=day) for day in days)
+        statements[trigger] = (
+            f'CREATE TRIGGER IF NOT EXISTS "{trigger}" AFTER {event} '
+            f'ON "{table_name}" BEGIN {inserts} END'
+        )
+    return statements
+
+
+def can_refresh_rollup_days(
+    cursor, rollup_table: str, table_names: Iterable[str]
+) -> bool:
+    """Check whether a rollup can be brought up to date by recomputing the dirty
+    days only: it exists, the tables that changed are all tracked by triggers and
+    none of its sources was replaced since its triggers were created.
+
+    Args:
+        cursor: A DB-API cursor of a SQLite connection.
+        rollup_table (str): The name of the rollup table.
+        table_names (Iterable[str]): The tables that changed.
+
+    Returns:
+        bool: True if recomputing the dirty days is enough.
+    """
+    sources = ROLLUP_TABLES[rollup_table]["sources"]
+    loaded = set(table_names) & set(sources)
+    if not loaded <= set(ROLLUP_TRIGGERS) or not table_exists(cursor, rollup_table):
+        return False
+    triggers = [
+        trigger
+        for table_name in ROLLUP_TRIGGERS
+        if table_name in sources
+        for trigger in get_rollup_trigger_statements(table_name)
+    ]
+    found = cursor.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name IN "
+        f"({', '.join('?' * len(triggers))})",
+        triggers,
+    ).fetchone()[0]
+    return found == len(triggers)
+
+
+def refresh_rollup_tables(
+    database: Engine, table_names: Iterable[str]
+) -> Dict[str, LoadStats]:
+    """Bring the ROLLUP_TABLES built from any of the given tables up to date. A
+    rollup is skipped while some of its sources are not loaded.
+
+    When only olist_orders and olist_order_items were written since the last
+    refresh, only the purchase days their triggers recorded are recomputed, so
+    the cost of an incremental load depends on the days it touched. Otherwise, or
+    on databases other than SQLite, the rollups are rebuilt from scratch.
+
+    Args:
+        database (Engine): Database connection.
+        table_names (Iterable[str]): The tables that changed.
+
+    Returns:
+        Dict[str, LoadStats]: The rows written, seconds and rows per second of each
+        rollup table refreshed.
+    """
+    table_names = set(table_names)
+    existing_tables = get_relation_names(database)
+    is_sqlite = database.dialect.name == "sqlite"
+    stats = {}
+    rebuilt = []
+    with database.begin() as connection:
+        cursor = connection.connection.cursor() if is_sqlite else None
+        dirty_days = None
+        if is_sqlite and ROLLUP_DIRTY_DAYS_TABLE in existing_tables:
+            dirty_days = cursor.execute(
+                "SELECT DISTINCT purchase_year, purchase_date "
+                f"FROM {ROLLUP_DIRTY_DAYS_TABLE}"
+            ).fetchall()
+
+        for rollup_table, rollup in ROLLUP_TABLES.items():
+            sources = rollup["sources"]
+            if table_names.isdisjoint(sources) or not existing_tables.issuperset(
+                sources
+            ):
+                continue
+            start = time.perf_counter()
+            if dirty_days is not None and can_refresh_rollup_days(
+                cursor, rollup_table, table_names
+            ):
+                if not dirty_days:
+                    continue
+                cursor.executemany(
+                    f'DELETE FROM "{rollup_table}" '
+                    "WHERE purchase_year IS ? AND purchase_date IS ?",
+                    dirty_days,
+                )
+                cursor.executemany(
+                    f'INSERT INTO "{rollup_table}" '
+                    f'{rollup["query"].format(where=ROLLUP_DAY_FILTER)}',
+                    dirty_days,
+                )
+                rows = cursor.rowcount
+            else:
+                query = rollup["query"].format(where="")
+                connection.exec_driver_sql(f'DROP TABLE IF EXISTS "{rollup_table}"')
+                connection.exec_driver_sql(f'CREATE TABLE "{rollup_table}" AS {query}')
+                rows = connection.exec_driver_sql(
+                    f'SELECT COUNT(*) FROM "{rollup_table}"'
+                ).scalar()
+                rebuilt.append(rollup_table)
+            if is_sqlite:
+                bump_table_generation(cursor, rollup_table)
+            seconds = time.perf_counter() - start
+            stats[rollup_table] = LoadStats(
+                rows=rows,
+                seconds=seconds,
+                rows_per_second=rows / seconds if seconds else float("inf"),
+            )
+
+        if is_sqlite and stats:
+            # Record the days written from now on, on the tables that exist.
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {ROLLUP_DIRTY_DAYS_TABLE} "
+                "(purchase_year INTEGER, purchase_date TEXT)"
+            )
+            for statement in get_index_statements(
+                ROLLUP_DIRTY_DAYS_TABLE,
+                dict(indexes=[["purchase_year", "purchase_date"]]),
+            ).values():
+                cursor.execute(statement)
+            for table_name in ROLLUP_TRIGGERS:
+                if table_name in existing_tables:
+                    for statement in get_rollup_trigger_statements(
+                        table_name
+                    ).values():
+                        cursor.execute(statement)
+            cursor.execute(f"DELETE FROM {ROLLUP_DIRTY_DAYS_TABLE}")
+        if cursor is not None:
+            cursor.close()
+    if rebuilt:
+        create_indexes(database, rebuilt)
+    if stats:
+        bump_load_generation(database)
+    return stats
+
+
+def is_memory_database(database: Engine) -> bool:
+    """Check if the engine points to a private in-memory SQLite database, which
+    every new connection would see empty.
+
+    Args:
+        database (Engine): Database connection.
+
+    Returns:
+        bool: True for in-memory SQLite databases.
+    """
+    return database.dialect.name == "sqlite" and database.url.database in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+def get_relation_names(database: Engine) -> Set[str]:
+    """Get the names of the tables of the database, and of the TEMP views standing
+    for the partitioned tables once they are partitioned.
+
+    Args:
+        database (Engine): Database connection, or a connection of the engine.
+
+    Returns:
+        Set[str]: The table and view names.
+    """
+    inspector = inspect(database)
+    names = set(inspector.get_table_names())
+    if database.dialect.name == "sqlite":
+        names.update(inspector.get_temp_view_names())
+    return names
+
+
+def get_partitions_dir(database: Engine) -> Optional[str]:
+    """Get the folder holding the partitions of the database.
+
+    Args:
+        database (Engine): Database connection.
+
+    Returns:
+        Optional[str]: The folder, or None if the tables are not partitioned.
+    """
+    if database.dialect.name != "sqlite":
+        return None
+    connection = database.raw_connection()
+    try:
+        cursor = connection.cursor()
+        partitions = get_partitions(cursor)
+        cursor.close()
+    finally:
+        connection.close()
+    return os.path.dirname(partitions[0].path) if partitions else None
+
+
+def copy_table_definition(cursor, table_name: str, source: str, target: str):
+    """Create an empty table in the target database with the declared columns of
+    the same table in the source database.
+
+    Args:
+        cursor: A DB-API cursor of a SQLite connection.
+        table_name (str): The name of the table.
+        source (str): The schema holding the table.
+        target (str): The schema the table is created in.
+    """
+    sql = cursor.execute(
+        f'SELECT sql FROM "{source}".sqlite_master '
+        "WHERE type = 'table' AND name = ?",
+        (table_name,),
+    ).fetchone()[0]
+    cursor.execute(f'DROP TABLE IF EXISTS "{target}"."{table_name}"')
+    cursor.execute(
+        re.sub(
+            r'^CREATE TABLE\s+(?:"[^"]+"|\S+)',
+            f'CREATE TABLE "{target}"."{table_name}"',
+            sql,
+            count=1,
+        )
+    )
+
+
+def get_partition_filters(year: Optional[int]) -> Dict[str, Tuple[str, tuple]]:
+    """Get the condition selecting the rows of each partitioned table that belong
+    to the partition of a year, with its parameters. The table is aliased t.
+
+    Args:
+        year (int, optional): The purchase year, None for the orders without one
+        and the items without an order.
+
+    Returns:
+        Dict[str, Tuple[str, tuple]]: The condition of each table.
+    """
+    if year is None:
+        items = (
+            'NOT EXISTS (SELECT 1 FROM main."olist_orders" o '
+            "WHERE o.order_id = t.order_id AND o.purchase_year IS NOT NULL)",
+            (),
+        )
+    else:
+        items = (
+            'EXISTS (SELECT 1 FROM main."olist_orders" o '
+            "WHERE o.order_id = t.order_id AND o.purchase_year = ?)",
+            (year,),
+        )
+    return {
+        "olist_orders": ("t.purchase_year IS ?", (year,)),
+        "olist_order_items": items,
+    }
+
+
+def partition_tables(
+    database: Engine,
+    partitions_dir: str = PARTITIONS_ROOT_PATH,
+    open_years: int = PARTITION_OPEN_YEARS,
+) -> Dict[str, LoadStats]:
+    """Move the PARTITIONED_TABLES of the database into one SQLite database per
+    purchase year in partitions_dir. Every connection opened afterwards attaches
+    them and reads the tables through TEMP views of the same name, see
+    src.partitions. Order items go to the partition of their order; the orders
+    without a purchase year and the items without an order go to p_other.
+
+    The partitions older than the open_years latest ones are frozen: their file is
+    made read only and they are attached read only. A frozen partition is never
+    written again, so the rows loaded for its year must be the ones it holds,
+    checked before the tables of the main database are dropped.
+
+    Args:
+        database (Engine): Database connection, it must be a SQLite database file.
+        partitions_dir (str, optional): The folder of the partitions. Defaults to
+        config.PARTITIONS_ROOT_PATH.
+        open_years (int, optional): The number of latest years left writable.
+        Defaults to config.PARTITION_OPEN_YEARS.
+
+    Raises:
+        ValueError: If the database is in memory, or the loaded rows of a frozen
+        partition differ from the ones it holds.
+
+    Returns:
+        Dict[str, LoadStats]: The rows, seconds and rows per second of each table
+        written, keyed as partition.table.
+    """
+    if is_memory_database(database):
+        raise ValueError("Solo una base de datos en archivo puede particionarse")
+    os.makedirs(partitions_dir, exist_ok=True)
+
+    stats = {}
+    connection = database.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if not all(
+            table_exists(cursor, table_name) for table_name in PARTITIONED_TABLES
+        ):
+            return {}
+        years = [
+            year
+            for (year,) in cursor.execute(
+                'SELECT DISTINCT purchase_year FROM main."olist_orders" '
+                "WHERE purchase_year IS NOT NULL ORDER BY purchase_year"
+            ).fetchall()
+        ]
+        frozen_years = set(years[: max(len(years) - open_years, 0)])
+        other_items, _ = get_partition_filters(None)["olist_order_items"]
+        has_other_rows = cursor.execute(
+            'SELECT EXISTS (SELECT 1 FROM main."olist_orders" '
+            "WHERE purchase_year IS NULL) OR EXISTS (SELECT 1 FROM "
+            f'main."olist_order_items" t WHERE {other_items})'
+        ).fetchone()[0]
+        if has_other_rows:
+            years.append(None)
+
+        partitions = []
+        for year in years:
+            schema = partition_schema(year)
+            file_name = f"olist_{'other' if year is None else year}.db"
+            path = os.path.abspath(os.path.join(partitions_dir, file_name))
+            frozen = os.path.exists(path) and not os.stat(path).st_mode & stat.S_IWUSR
+            cursor.execute(
+                f'ATTACH DATABASE ? AS "{schema}"',
+                (f"{Path(path).as_uri()}?mode={'ro' if frozen else 'rwc'}",),
+            )
+            try:
+                for table_name, (condition, params) in get_partition_filters(
+                    year
+                ).items():
+                    start = time.perf_counter()
+                    select = f'FROM main."{table_name}" t WHERE {condition}'
+                    if frozen:
+                        # Compared by content, an update keeps the row count.
+                        held = f'SELECT * FROM "{schema}"."{table_name}"'
+                        loaded_count, held_count, differs = cursor.execute(
+                            f"SELECT (SELECT COUNT(*) {select}), "
+                            f"(SELECT COUNT(*) FROM ({held})), "
+                            f"EXISTS (SELECT t.* {select} EXCEPT {held}) "
+                            f"OR EXISTS ({held} EXCEPT SELECT t.* {select})",
+                            params * 3,
+                        ).fetchone()
+                        if loaded_count != held_count or differs:
+                            raise ValueError(
+                                f"La partición congelada {path} no tiene las filas "
+                                f"de {table_name} que se cargaron"
+                            )
+                        continue
+                    cursor.execute("BEGIN")
+                    copy_table_definition(cursor, table_name, "main", schema)
+                    cursor.execute(
+                        f'INSERT INTO "{schema}"."{table_name}" SELECT t.* {select}',
+                        params,
+                    )
+                    rows = cursor.rowcount
+                    for statement in get_index_statements(
+                        table_name, get_table_indexes().get(table_name, {}), schema
+                    ).values():
+                        cursor.execute(statement)
+                    connection.commit()
+                    seconds = time.perf_counter() - start
+                    stats[f"{schema}.{table_name}"] = LoadStats(
+                        rows=rows,
+                        seconds=seconds,
+                        rows_per_second=rows / seconds if seconds else float("inf"),
+                    )
+                if not frozen:
+                    # Its statistics can't be gathered once it is frozen.
+                    cursor.execute(f'ANALYZE "{schema}"')
+            finally:
+                cursor.execute(f'DETACH DATABASE "{schema}"')
+            if not frozen and year in frozen_years:
+                mode = os.stat(path).st_mode
+                os.chmod(path, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+                frozen = True
+            partitions.append(Partition(year, path, frozen))
+
+        cursor.execute("BEGIN")
+        for table_name in PARTITIONED_TABLES:
+            cursor.execute(f'DROP TABLE main."{table_name}"')
+            bump_table_generation(cursor, table_name)
+        cursor.execute(f"DROP TABLE IF EXISTS main.{PARTITIONS_TABLE}")
+        cursor.execute(
+            f"CREATE TABLE main.{PARTITIONS_TABLE} "
+            "(year INTEGER, path TEXT, frozen INTEGER)"
+        )
+        cursor.executemany(
+            f"INSERT INTO main.{PARTITIONS_TABLE} VALUES (?, ?, ?)", partitions
+        )
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+    # Open connections would keep reading the dropped tables.
+    database.dispose()
+    bump_load_generation(database)
+    return stats
+
+
+def unpartition_tables(database: Engine, replaced_tables: Iterable[str] = ()):
+    """Move the rows of the partitioned tables back into tables of the main
+    database, so they can be written again, with their rollup triggers, and drop
+    the partition layout. The partition files are kept, frozen ones stay frozen.
+
+    Args:
+        database (Engine): Database connection.
+        replaced_tables (Iterable[str], optional): The tables about to be replaced,
+        which are dropped instead of copied back. Defaults to ().
+    """
+    replaced_tables = set(replaced_tables)
+    connection = database.raw_connection()
+    try:
+        cursor = connection.cursor()
+        partitions = get_partitions(cursor)
+        if not partitions:
+            return
+        cursor.execute("BEGIN")
+        for table_name in PARTITIONED_TABLES:
+            cursor.execute(f'DROP VIEW IF EXISTS temp."{table_name}"')
+            if table_name in replaced_tables:
+                continue
+            copy_table_definition(
+                cursor, table_name, partition_schema(partitions[0].year), "main"
+            )
+            for partition in partitions:
+                cursor.execute(
+                    f'INSERT INTO main."{table_name}" SELECT * FROM '
+                    f'"{partition_schema(partition.year)}"."{table_name}"'
+                )
+            for statement in get_index_statements(
+                table_name, get_table_indexes().get(table_name, {})
+            ).values():
+                cursor.execute(statement)
+            if table_name in ROLLUP_TRIGGERS and table_exists(
+                cursor, ROLLUP_DIRTY_DAYS_TABLE
+            ):
+                # Dropped with the table when it was partitioned, and created
+                # after the copy so it does not mark every day as changed.
+                for statement in get_rollup_trigger_statements(table_name).values():
+                    cursor.execute(statement)
+            bump_table_generation(cursor, table_name)
+        cursor.execute(f"DROP TABLE main.{PARTITIONS_TABLE}")
+        connection.commit()
+        for partition in partitions:
+            cursor.execute(f'DETACH DATABASE "{partition_schema(partition.year)}"')
+        connection.info["partitions"] = []
+        cursor.close()
+    finally:
+        connection.close()
+    if not is_memory_database(database):
+        database.dispose()
+    bump_load_generation(database)
+
+
+def print_load_stats(stats: Dict[str, LoadStats]):
+    """Print the rows and rows per second loaded on each table.
+
+    Args:
+        stats (Dict[str, LoadStats]): The load statistics of each table.
+    """
+    for table_name, table_stats in stats.items():
+        print(
+            f"Tabla {table_name} cargada: {table_stats.rows} filas en "
+            f"{table_stats.seconds:.2f}s ({table_stats.rows_per_second:,.0f} filas/s)"
+        )
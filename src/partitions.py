@@ -0,0 +1,179 @@
+import re
+import sqlite3
+from collections import namedtuple
+from pathlib import Path
+from typing import List, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.sql.elements import TextClause
+
+from src.config import PARTITIONED_TABLES
+
+# Layout of the partitioned tables, stored in the main database so every
+# connection opening it attaches the same partitions.
+PARTITIONS_TABLE = "order_partitions"
+
+Partition = namedtuple("Partition", ["year", "path", "frozen"])
+
+# A partitioned table named in a query, not qualified by a schema or quoted.
+_PARTITIONED_TABLE_PATTERN = re.compile(
+    r'(?<![\w."])(' + "|".join(map(re.escape, PARTITIONED_TABLES)) + r')(?![\w"])'
+)
+
+
+def partition_schema(year: Optional[int]) -> str:
+    """Get the schema name a partition is attached as.
+
+    Args:
+        year (int, optional): The purchase year of the partition, None for the
+        orders without a purchase year and the items without an order.
+
+    Returns:
+        str: The schema name.
+    """
+    return "p_other" if year is None else f"p{year}"
+
+
+def get_partitions(connection) -> List[Partition]:
+    """Read the partition layout of a database.
+
+    Args:
+        connection: A DB-API connection or cursor of a SQLite database.
+
+    Returns:
+        List[Partition]: The partitions by year, the one without a year last, or
+        an empty list if the tables are not partitioned.
+    """
+    exists = connection.execute(
+        "SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+        (PARTITIONS_TABLE,),
+    ).fetchone()
+    if exists is None:
+        return []
+    return [
+        Partition(year, path, bool(frozen))
+        for year, path, frozen in connection.execute(
+            f"SELECT year, path, frozen FROM main.{PARTITIONS_TABLE} "
+            "ORDER BY year IS NULL, year"
+        ).fetchall()
+    ]
+
+
+def writable_schemas(partitions: List[Partition]) -> List[str]:
+    """Get the schemas of a connection that can be written: main and the
+    partitions that are not frozen, which are attached read only.
+
+    Args:
+        partitions (List[Partition]): The partitions attached to the connection.
+
+    Returns:
+        List[str]: The schema names.
+    """
+    return ["main"] + [
+        partition_schema(partition.year)
+        for partition in partitions
+        if not partition.frozen
+    ]
+
+
+def union_query(table_name: str, partitions: List[Partition]) -> str:
+    """Build the union of a partitioned table over some of its partitions.
+
+    Args:
+        table_name (str): One of config.PARTITIONED_TABLES.
+        partitions (List[Partition]): The partitions to read.
+
+    Returns:
+        str: A SELECT over the partitions, or one returning no rows without them.
+    """
+    if not partitions:
+        return f'SELECT * FROM temp."{table_name}" WHERE 0'
+    return " UNION ALL ".join(
+        f'SELECT * FROM "{partition_schema(partition.year)}"."{table_name}"'
+        for partition in partitions
+    )
+
+
+def attach_partitions(dbapi_connection: sqlite3.Connection) -> List[Partition]:
+    """Attach the partitions of a database to one of its connections, frozen ones
+    read only, and create the TEMP views named after the partitioned tables that
+    union them. SQLite only lets TEMP views read attached databases.
+
+    Args:
+        dbapi_connection (sqlite3.Connection): A connection of the main database.
+
+    Returns:
+        List[Partition]: The partitions attached.
+    """
+    partitions = get_partitions(dbapi_connection)
+    if not partitions:
+        return partitions
+    query_only = dbapi_connection.execute("PRAGMA query_only").fetchone()[0]
+    dbapi_connection.execute("PRAGMA query_only = OFF")
+    try:
+        for partition in partitions:
+            mode = "ro" if partition.frozen else "rw"
+            dbapi_connection.execute(
+                f'ATTACH DATABASE ? AS "{partition_schema(partition.year)}"',
+                (f"{Path(partition.path).as_uri()}?mode={mode}",),
+            )
+        for table_name in PARTITIONED_TABLES:
+            dbapi_connection.execute(
+                f'CREATE TEMP VIEW IF NOT EXISTS "{table_name}" AS '
+                f"{union_query(table_name, partitions)}"
+            )
+    finally:
+        dbapi_connection.execute(f"PRAGMA query_only = {query_only}")
+    return partitions
+
+
+def register_partitions(engine: Engine):
+    """Attach the partitions of the database to every connection of an engine,
+    see attach_partitions(). config.get_engine() registers every engine it
+    creates.
+
+    Args:
+        engine (Engine): An engine of a SQLite database.
+    """
+
+    # Attached on the first checkout and not on connect, as setting the temp_store
+    # pragma in the connect listeners of the engine drops the TEMP views.
+    @event.listens_for(engine, "checkout")
+    def attach(dbapi_connection, connection_record, connection_proxy):
+        if "partitions" not in connection_record.info:
+            connection_record.info["partitions"] = attach_partitions(dbapi_connection)
+
+
+def prune_partitions(
+    database: Engine, query: TextClause, start_year: int, end_year: int
+) -> TextClause:
+    """Point the partitioned tables of a query filtered by purchase year to the
+    partitions of those years only, instead of the views over all of them.
+
+    Args:
+        database (Engine): Database connection, or a connection of the engine.
+        query (TextClause): The query.
+        start_year (int): The first year the query reads.
+        end_year (int): The last year the query reads, included.
+
+    Returns:
+        TextClause: The query, unchanged if the tables are not partitioned.
+    """
+    if isinstance(database, Engine):
+        with database.connect() as connection:
+            partitions = connection.connection.info.get("partitions", [])
+    else:
+        partitions = database.connection.info.get("partitions", [])
+    if not partitions:
+        return query
+    selected = [
+        partition
+        for partition in partitions
+        if partition.year is not None and start_year <= partition.year <= end_year
+    ]
+    return text(
+        _PARTITIONED_TABLE_PATTERN.sub(
+            lambda match: f"({union_query(match.group(1), selected)})", query.text
+        )
+    )
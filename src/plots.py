@@ -1,3 +1,7 @@
+import os
+import time
+from typing import Any, Callable, Optional, Sequence, Tuple
+
 import matplotlib
 import matplotlib.pyplot as plt
 
@@ -7,12 +11,84 @@ import seaborn as sns
 from pandas import DataFrame
 
 
-def plot_revenue_by_month_year(df: DataFrame, year: int):
+def save_or_show(file_name: str, output_dir: Optional[str]) -> Optional[str]:
+    """Save the current matplotlib figure and close it, or show it.
+
+    Args:
+        file_name (str): The file name of the chart.
+        output_dir (str, optional): The folder the chart is saved in, None shows
+        it instead.
+
+    Returns:
+        Optional[str]: The path of the chart saved, None if it was shown.
+    """
+    if output_dir is None:
+        plt.show()
+        return None
+    output_path = os.path.join(output_dir, file_name)
+    plt.savefig(output_path)
+    plt.close()
+    return output_path
+
+
+def write_or_show(fig, file_name: str, output_dir: Optional[str]) -> Optional[str]:
+    """Write a plotly figure as a standalone html file, or show it.
+
+    Args:
+        fig: The plotly figure.
+        file_name (str): The file name of the chart.
+        output_dir (str, optional): The folder the chart is written in, None shows
+        it instead.
+
+    Returns:
+        Optional[str]: The path of the chart written, None if it was shown.
+    """
+    if output_dir is None:
+        fig.show()
+        return None
+    output_path = os.path.join(output_dir, file_name)
+    fig.write_html(output_path)
+    return output_path
+
+
+def render_plot(
+    plot: Callable[..., Optional[str]],
+    df: DataFrame,
+    plot_args: Sequence[Any],
+    output_dir: str,
+) -> Tuple[str, float]:
+    """Render a chart into a file with the non-interactive Agg backend, e.g. in a
+    worker process of a pool, as matplotlib is not thread safe.
+
+    Args:
+        plot (Callable[..., Optional[str]]): One of the plot functions.
+        df (DataFrame): The query result it plots.
+        plot_args (Sequence[Any]): The other arguments of the plot function.
+        output_dir (str): The folder the chart is saved in.
+
+    Returns:
+        Tuple[str, float]: The path of the chart and the seconds it took.
+    """
+    matplotlib.use("Agg")
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+    output_path = plot(df, *plot_args, output_dir=output_dir)
+    return output_path, time.perf_counter() - start
+
+
+def plot_revenue_by_month_year(
+    df: DataFrame, year: int, output_dir: Optional[str] = None
+) -> Optional[str]:
     """Plot revenue by month in a given year
 
     Args:
         df (DataFrame): Dataframe with revenue by month and year query result
-        year (int): It could be 2016, 2017 or 2018
+        year (int): Any year of the range the query was run for
+        output_dir (str, optional): The folder the chart is saved in, None shows it.
+        Defaults to None.
+
+    Returns:
+        Optional[str]: The path of the chart saved, None if it was shown.
     """
     matplotlib.rc_file_defaults()
     sns.set_style(style=None, rc=None)
@@ -25,16 +101,23 @@ def plot_revenue_by_month_year(df: DataFrame, year: int):
     sns.barplot(data=df, x="month", y=f"Year{year}", alpha=0.5, ax=ax2)
     ax1.set_title(f"Revenue by month in {year}")
 
-    plt.show()
+    return save_or_show("revenue_by_month_year.png", output_dir)
 
 
-def plot_real_vs_predicted_delivered_time(df: DataFrame, year: int):
+def plot_real_vs_predicted_delivered_time(
+    df: DataFrame, year: int, output_dir: Optional[str] = None
+) -> Optional[str]:
     """Plot real vs predicted delivered time by month in a given year
 
     Args:
         df (DataFrame): Dataframe with real vs predicted delivered time by month and
                         year query result
-        year (int): It could be 2016, 2017 or 2018
+        year (int): Any year of the range the query was run for
+        output_dir (str, optional): The folder the chart is saved in, None shows it.
+        Defaults to None.
+
+    Returns:
+        Optional[str]: The path of the chart saved, None if it was shown.
     """
     matplotlib.rc_file_defaults()
     sns.set_style(style=None, rc=None)
@@ -52,20 +135,27 @@ def plot_real_vs_predicted_delivered_time(df: DataFrame, year: int):
     ax1.set_title(f"Average days delivery time by month in {year}")
     ax1.legend(["Real time", "Estimated time"])
 
-    plt.show()
+    return save_or_show("real_vs_predicted_delivered_time.png", output_dir)
 
 
-def plot_global_amount_order_status(df: DataFrame):
+def plot_global_amount_order_status(
+    df: DataFrame, output_dir: Optional[str] = None
+) -> Optional[str]:
     """Plot global amount of order status
 
     Args:
         df (DataFrame): Dataframe with global amount of order status query result
+        output_dir (str, optional): The folder the chart is saved in, None shows it.
+        Defaults to None.
+
+    Returns:
+        Optional[str]: The path of the chart saved, None if it was shown.
     """
     _, ax = plt.subplots(figsize=(6, 3), subplot_kw=dict(aspect="equal"))
 
-    elements = [x.split()[-1] for x in df["estado_pedido"]]
+    elements = [x.split()[-1] for x in df["order_status"]]
 
-    wedges, autotexts = ax.pie(df["Cantidad"], textprops=dict(color="w"))
+    wedges, autotexts = ax.pie(df["Ammount"], textprops=dict(color="w"))
 
     ax.legend(
         wedges,
@@ -84,28 +174,41 @@ def plot_global_amount_order_status(df: DataFrame):
     p.gca().add_artist(my_circle)
 
     # Guardar el gráfico
-    plt.savefig('global_amount_order_status.png')
-    plt.close()
+    return save_or_show("global_amount_order_status.png", output_dir)
 
 
-def plot_revenue_per_state(df: DataFrame):
+def plot_revenue_per_state(
+    df: DataFrame, output_dir: Optional[str] = None
+) -> Optional[str]:
     """Plot revenue per state
 
     Args:
         df (DataFrame): Dataframe with revenue per state query result
+        output_dir (str, optional): The folder the chart is saved in, None shows it.
+        Defaults to None.
+
+    Returns:
+        Optional[str]: The path of the chart saved, None if it was shown.
     """
     fig = px.treemap(
         df, path=["customer_state"], values="Revenue", width=800, height=400
     )
     fig.update_layout(margin=dict(t=50, l=25, r=25, b=25))
-    fig.show()
+    return write_or_show(fig, "revenue_per_state.html", output_dir)
 
 
-def plot_top_10_least_revenue_categories(df: DataFrame):
+def plot_top_10_least_revenue_categories(
+    df: DataFrame, output_dir: Optional[str] = None
+) -> Optional[str]:
     """Plot top 10 least revenue categories
 
     Args:
         df (DataFrame): Dataframe with top 10 least revenue categories query result
+        output_dir (str, optional): The folder the chart is saved in, None shows it.
+        Defaults to None.
+
+    Returns:
+        Optional[str]: The path of the chart saved, None if it was shown.
     """
     _, ax = plt.subplots(figsize=(6, 3), subplot_kw=dict(aspect="equal"))
 
@@ -129,14 +232,21 @@ def plot_top_10_least_revenue_categories(df: DataFrame):
 
     ax.set_title("Top 10 Least Revenue Categories ammount")
 
-    plt.show()
+    return save_or_show("top_10_least_revenue_categories.png", output_dir)
 
 
-def plot_top_10_revenue_categories_ammount(df: DataFrame):
+def plot_top_10_revenue_categories_ammount(
+    df: DataFrame, output_dir: Optional[str] = None
+) -> Optional[str]:
     """Plot top 10 revenue categories
 
     Args:
         df (DataFrame): Dataframe with top 10 revenue categories query result
+        output_dir (str, optional): The folder the chart is saved in, None shows it.
+        Defaults to None.
+
+    Returns:
+        Optional[str]: The path of the chart saved, None if it was shown.
     """
     # Plotting the top 10 revenue categories ammount
     _, ax = plt.subplots(figsize=(6, 3), subplot_kw=dict(aspect="equal"))
@@ -161,25 +271,39 @@ def plot_top_10_revenue_categories_ammount(df: DataFrame):
 
     ax.set_title("Top 10 Revenue Categories ammount")
 
-    plt.show()
+    return save_or_show("top_10_revenue_categories_ammount.png", output_dir)
 
 
-def plot_top_10_revenue_categories(df: DataFrame):
+def plot_top_10_revenue_categories(
+    df: DataFrame, output_dir: Optional[str] = None
+) -> Optional[str]:
     """Plot top 10 revenue categories
 
     Args:
         df (DataFrame): Dataframe with top 10 revenue categories query result
+        output_dir (str, optional): The folder the chart is saved in, None shows it.
+        Defaults to None.
+
+    Returns:
+        Optional[str]: The path of the chart saved, None if it was shown.
     """
     fig = px.treemap(df, path=["Category"], values="Num_order", width=800, height=400)
     fig.update_layout(margin=dict(t=50, l=25, r=25, b=25))
-    fig.show()
+    return write_or_show(fig, "top_10_revenue_categories.html", output_dir)
 
 
-def plot_freight_value_weight_relationship(df: DataFrame):
+def plot_freight_value_weight_relationship(
+    df: DataFrame, output_dir: Optional[str] = None
+) -> Optional[str]:
     """Plot freight value weight relationship
 
     Args:
         df (DataFrame): Dataframe with freight value weight relationship query result
+        output_dir (str, optional): The folder the chart is saved in, None shows it.
+        Defaults to None.
+
+    Returns:
+        Optional[str]: The path of the chart saved, None if it was shown.
     """
     plt.figure(figsize=(10, 6))
     
@@ -199,19 +323,25 @@ def plot_freight_value_weight_relationship(df: DataFrame):
     plt.tight_layout()
     
     # Guardar el gráfico
-    plt.savefig('freight_value_weight_relationship.png')
-    plt.close()
+    return save_or_show("freight_value_weight_relationship.png", output_dir)
 
 
-def plot_delivery_date_difference(df: DataFrame):
+def plot_delivery_date_difference(
+    df: DataFrame, output_dir: Optional[str] = None
+) -> Optional[str]:
     """Plot delivery date difference
 
     Args:
         df (DataFrame): Dataframe with delivery date difference query result
+        output_dir (str, optional): The folder the chart is saved in, None shows it.
+        Defaults to None.
+
+    Returns:
+        Optional[str]: The path of the chart saved, None if it was shown.
     """
     plt.figure(figsize=(10, 6))
     
-    sns.barplot(data=df, x="Diferencia_Entrega", y="Estado").set(
+    sns.barplot(data=df, x="Delivery_Difference", y="State").set(
         title="Diferencia Entre Fecha Estimada y Fecha Real de Entrega por Estado"
     )
     
@@ -222,15 +352,21 @@ def plot_delivery_date_difference(df: DataFrame):
     plt.tight_layout()
     
     # Guardar el gráfico
-    plt.savefig('delivery_date_difference.png')
-    plt.close()
+    return save_or_show("delivery_date_difference.png", output_dir)
 
 
-def plot_order_amount_per_day_with_holidays(df: DataFrame):
+def plot_order_amount_per_day_with_holidays(
+    df: DataFrame, output_dir: Optional[str] = None
+) -> Optional[str]:
     """Plot order amount per day with holidays
 
     Args:
         df (DataFrame): Dataframe with order amount per day with holidays query result
+        output_dir (str, optional): The folder the chart is saved in, None shows it.
+        Defaults to None.
+
+    Returns:
+        Optional[str]: The path of the chart saved, None if it was shown.
     """
     plt.figure(figsize=(15, 6))
     
@@ -254,5 +390,4 @@ def plot_order_amount_per_day_with_holidays(df: DataFrame):
     plt.tight_layout()
     
     # Guardar el gráfico
-    plt.savefig('orders_per_day_with_holidays.png')
-    plt.close()
+    return save_or_show("orders_per_day_with_holidays.png", output_dir)
@@ -0,0 +1,333 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from weakref import WeakKeyDictionary
+
+from pandas import DataFrame, read_pickle
+from sqlalchemy.engine.base import Engine
+
+from src.config import (
+    QUERY_CACHE_MAX_BYTES,
+    QUERY_CACHE_MAX_ENTRIES,
+    QUERY_CACHE_PATH,
+)
+from src.load import GENERATIONS_TABLE, get_load_generation
+
+Fingerprint = Tuple[Optional[int], int, Optional[int]]
+
+# Fingerprints of the tables of each engine, with the load generations they were
+# taken at, so they are only read again after load() changed the tables.
+_fingerprints: "WeakKeyDictionary[Engine, Tuple[Any, Dict[str, Fingerprint]]]" = (
+    WeakKeyDictionary()
+)
+_engine_tokens: "WeakKeyDictionary[Engine, str]" = WeakKeyDictionary()
+_fingerprints_lock = threading.Lock()
+_bypass = threading.local()
+
+
+def _read_generations(connection) -> Dict[str, int]:
+    if connection.dialect.name != "sqlite" or not connection.dialect.has_table(
+        connection, GENERATIONS_TABLE
+    ):
+        return {}
+    return dict(
+        connection.exec_driver_sql(
+            f"SELECT table_name, generation FROM {GENERATIONS_TABLE}"
+        ).fetchall()
+    )
+
+
+def _read_fingerprints(
+    connection, table_names: Iterable[str], generations: Dict[str, int]
+) -> Dict[str, Fingerprint]:
+    if connection.dialect.name != "sqlite":
+        # Only SQLite tables have a rowid and a load generation.
+        return {
+            table_name: (
+                None,
+                connection.exec_driver_sql(
+                    f'SELECT COUNT(*) FROM "{table_name}"'
+                ).scalar(),
+                None,
+            )
+            for table_name in table_names
+        }
+
+    # The views over partitioned tables have no rowid.
+    views = {
+        name
+        for (name,) in connection.exec_driver_sql(
+            "SELECT name FROM sqlite_temp_master WHERE type = 'view'"
+        ).fetchall()
+    }
+    fingerprints = {}
+    for table_name in table_names:
+        max_rowid = "NULL" if table_name in views else "MAX(rowid)"
+        rows, max_rowid = connection.exec_driver_sql(
+            f'SELECT COUNT(*), {max_rowid} FROM "{table_name}"'
+        ).fetchone()
+        fingerprints[table_name] = (generations.get(table_name), rows, max_rowid)
+    return fingerprints
+
+
+def get_table_fingerprints(
+    database: Engine, table_names: Iterable[str]
+) -> Dict[str, Fingerprint]:
+    """Get a cheap fingerprint of each table: the load generation stored in the
+    database by load(), the row count and the greatest rowid. Fingerprints are
+    read again after each load of the engine in this process and, for database
+    files, after the load generations stored in the file changed, e.g. when
+    another process loaded it.
+
+    Args:
+        database (Engine): Database connection, or a connection of the engine.
+        table_names (Iterable[str]): The tables to fingerprint.
+
+    Returns:
+        Dict[str, Fingerprint]: The fingerprint of each table.
+    """
+    table_names = list(table_names)
+    with _fingerprints_lock:
+        if isinstance(database, Engine):
+            with database.connect() as connection:
+                return _get_fingerprints(connection, table_names)
+        return _get_fingerprints(database, table_names)
+
+
+def _get_fingerprints(connection, table_names: List[str]) -> Dict[str, Fingerprint]:
+    engine = connection.engine
+    # One small read per call, the tables are only read again when it changed.
+    generations = _read_generations(connection)
+    stamp = (get_load_generation(engine), generations)
+    cached = _fingerprints.get(engine)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, {})
+        _fingerprints[engine] = cached
+    fingerprints = cached[1]
+    missing = [name for name in table_names if name not in fingerprints]
+    if missing:
+        fingerprints.update(_read_fingerprints(connection, missing, generations))
+    return {table_name: fingerprints[table_name] for table_name in table_names}
+
+
+def invalidate_fingerprints(database: Engine):
+    """Forget the fingerprints of the database, for tables changed outside of
+    load(), in this process or another.
+
+    Args:
+        database (Engine): Database connection, or a connection of the engine.
+    """
+    with _fingerprints_lock:
+        _fingerprints.pop(database.engine, None)
+
+
+def _engine_identity(database: Engine) -> str:
+    engine = database.engine
+    if engine.url.database in (None, "", ":memory:"):
+        # Every in-memory database has the same url, tell them apart by engine.
+        with _fingerprints_lock:
+            if engine not in _engine_tokens:
+                _engine_tokens[engine] = uuid.uuid4().hex
+            return _engine_tokens[engine]
+    return str(engine.url)
+
+
+def query_cache_key(
+    database: Engine,
+    query_name: str,
+    sql_file: str,
+    table_names: Iterable[str],
+    params: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Build the cache key of a query result from the hash of its sql file, its
+    bound parameters and the fingerprints of the tables it reads.
+
+    Args:
+        database (Engine): Database connection.
+        query_name (str): The name of the query.
+        sql_file (str): The path to the sql file of the query.
+        table_names (Iterable[str]): The tables the query reads.
+        params (Dict[str, Any], optional): The parameters bound to the query.
+        Defaults to None.
+
+    Returns:
+        str: The hex digest identifying the result.
+    """
+    with open(sql_file, "rb") as f:
+        sql_hash = hashlib.sha256(f.read()).hexdigest()
+    payload = dict(
+        query=query_name,
+        sql=sql_hash,
+        params=params or {},
+        database=_engine_identity(database),
+        tables=get_table_fingerprints(database, table_names),
+    )
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class QueryCache:
+    """LRU cache of query results.
+
+    Entries evicted from memory are spilled to spill_dir as pickles, when given,
+    and promoted back to memory on their next hit.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = QUERY_CACHE_MAX_ENTRIES,
+        spill_dir: Optional[str] = None,
+        max_spill_bytes: int = QUERY_CACHE_MAX_BYTES,
+    ):
+        """
+        Args:
+            max_entries (int): The number of results kept in memory. Defaults to
+            config.QUERY_CACHE_MAX_ENTRIES.
+            spill_dir (str, optional): The folder evicted results are written to,
+            None disables spilling. Defaults to None.
+            max_spill_bytes (int): The maximum size of the spill folder. Defaults
+            to config.QUERY_CACHE_MAX_BYTES.
+        """
+        self.max_entries = max_entries
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, DataFrame]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _spill_file(self, key: str) -> Path:
+        return Path(self.spill_dir) / f"{key}.pkl"
+
+    def _spill(self, key: str, df: DataFrame):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        spill_file = self._spill_file(key)
+        tmp_file = spill_file.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        df.to_pickle(tmp_file)
+        os.replace(tmp_file, spill_file)
+
+        spilled = sorted(
+            (entry.stat().st_mtime, entry.stat().st_size, entry)
+            for entry in Path(self.spill_dir).glob("*.pkl")
+        )
+        total = sum(size for _, size, _ in spilled)
+        for _, size, entry in spilled:
+            if total <= self.max_spill_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
+
+    def _unspill(self, key: str) -> Optional[DataFrame]:
+        if self.spill_dir is None:
+            return None
+        spill_file = self._spill_file(key)
+        try:
+            df = read_pickle(spill_file)
+        except (FileNotFoundError, EOFError):
+            return None
+        spill_file.unlink(missing_ok=True)
+        return df
+
+    def get(self, key: str) -> Optional[DataFrame]:
+        """Get a copy of the cached result.
+
+        Args:
+            key (str): The key returned by query_cache_key().
+
+        Returns:
+            Optional[DataFrame]: The result or None if it is not cached.
+        """
+        if getattr(_bypass, "active", False):
+            return None
+        with self._lock:
+            df = self._entries.get(key)
+            if df is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return df.copy()
+        df = self._unspill(key)
+        with self._lock:
+            if df is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self.put(key, df)
+        return df.copy()
+
+    def put(self, key: str, df: DataFrame):
+        """Store a copy of a result, evicting the least recently used ones.
+
+        Args:
+            key (str): The key returned by query_cache_key().
+            df (DataFrame): The result of the query.
+        """
+        if getattr(_bypass, "active", False):
+            return
+        with self._lock:
+            self._entries[key] = df.copy()
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False))
+        if self.spill_dir is not None:
+            for evicted_key, evicted_df in evicted:
+                self._spill(evicted_key, evicted_df)
+
+    def clear(self):
+        """Remove every result from memory and from the spill folder."""
+        with self._lock:
+            self._entries.clear()
+        if self.spill_dir is not None and os.path.isdir(self.spill_dir):
+            for entry in Path(self.spill_dir).glob("*.pkl"):
+                entry.unlink(missing_ok=True)
+
+
+_query_cache = QueryCache()
+
+
+def get_query_cache() -> QueryCache:
+    """Get the query cache shared by the whole process.
+
+    Returns:
+        QueryCache: The shared cache.
+    """
+    return _query_cache
+
+
+def configure_query_cache(
+    max_entries: int = QUERY_CACHE_MAX_ENTRIES,
+    spill: bool = False,
+    spill_dir: str = QUERY_CACHE_PATH,
+) -> QueryCache:
+    """Replace the shared query cache.
+
+    Args:
+        max_entries (int): The number of results kept in memory. Defaults to
+        config.QUERY_CACHE_MAX_ENTRIES.
+        spill (bool): Spill evicted results to disk. Defaults to False.
+        spill_dir (str): The spill folder. Defaults to config.QUERY_CACHE_PATH.
+
+    Returns:
+        QueryCache: The new shared cache.
+    """
+    global _query_cache
+    _query_cache = QueryCache(max_entries, spill_dir if spill else None)
+    return _query_cache
+
+
+@contextmanager
+def bypass_query_cache() -> Iterator[None]:
+    """Run the queries of the current thread without reading or filling the query
+    cache, e.g. to time them.
+    """
+    previous = getattr(_bypass, "active", False)
+    _bypass.active = True
+    try:
+        yield
+    finally:
+        _bypass.active = previous
@@ -0,0 +1,281 @@
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from src.checkpoints import Checkpoint, CheckpointStore, fingerprint
+
+# A stage of the pipeline. function is called with the results of the inputs, in
+# order, once they all finished. Tasks with main_thread set run on the thread of
+# run_tasks(), one at a time, e.g. the matplotlib plots.
+#
+# With checkpoints, tasks with a key are resumed from the last run when their key
+# and the output fingerprints of their inputs did not change. Their output is
+# read back from the checkpoint when persist is set, or by restore() from where
+# the task left it, e.g. the database. The output of the other tasks is
+# fingerprinted by their identity and only computed again if a task that runs
+# needs it, so they must give the same output for the same identity.
+Task = namedtuple(
+    "Task",
+    ["name", "function", "inputs", "main_thread", "key", "persist", "restore"],
+    defaults=((), False, None, False, None),
+)
+# Seconds since the start of run_tasks() at which a task started and ended.
+TaskTiming = namedtuple("TaskTiming", ["start", "end"])
+
+# Keeps the reports of concurrent tasks on separate lines.
+_print_lock = threading.Lock()
+
+
+def sort_tasks(tasks: Iterable[Task]) -> Dict[str, Task]:
+    """Index the tasks by name in dependency order.
+
+    Args:
+        tasks (Iterable[Task]): The tasks.
+
+    Raises:
+        ValueError: If two tasks share a name, an input is not a task or the
+        inputs form a cycle.
+
+    Returns:
+        Dict[str, Task]: The tasks by name, every task after its inputs.
+    """
+    by_name: Dict[str, Task] = {}
+    for task in tasks:
+        if task.name in by_name:
+            raise ValueError(f"La tarea {task.name} está repetida")
+        by_name[task.name] = task
+    for task in by_name.values():
+        for input_name in task.inputs:
+            if input_name not in by_name:
+                raise ValueError(
+                    f"La tarea {task.name} depende de {input_name}, que no existe"
+                )
+
+    waiting = {name: set(task.inputs) for name, task in by_name.items()}
+    ordered: Dict[str, Task] = {}
+    ready = [name for name, inputs in waiting.items() if not inputs]
+    while ready:
+        name = ready.pop(0)
+        ordered[name] = by_name[name]
+        for other, inputs in waiting.items():
+            if name in inputs:
+                inputs.discard(name)
+                if not inputs:
+                    ready.append(other)
+    if len(ordered) < len(by_name):
+        cycle = sorted(set(by_name) - set(ordered))
+        raise ValueError(f"Las tareas {cycle} forman un ciclo")
+    return ordered
+
+
+def select_tasks(tasks: Iterable[Task], patterns: Iterable[str]) -> Set[str]:
+    """Get the tasks named by some patterns, each a task name or the prefix of
+    the names before ":", e.g. "query" for every "query:..." task.
+
+    Args:
+        tasks (Iterable[Task]): The tasks.
+        patterns (Iterable[str]): The patterns.
+
+    Raises:
+        ValueError: If a pattern names no task.
+
+    Returns:
+        Set[str]: The names of the tasks selected.
+    """
+    names = [task.name for task in tasks]
+    selected = set()
+    for pattern in patterns:
+        matches = {
+            name for name in names if pattern in (name, name.split(":", 1)[0])
+        }
+        if not matches:
+            raise ValueError(f"No hay ninguna tarea {pattern}")
+        selected |= matches
+    return selected
+
+
+def run_tasks(
+    tasks: Iterable[Task],
+    max_workers: int = 1,
+    checkpoints: Optional[CheckpointStore] = None,
+    force: Iterable[str] = (),
+    skip: Iterable[str] = (),
+) -> Tuple[Dict[str, Any], Dict[str, TaskTiming]]:
+    """Run every task as soon as its inputs finished, on a pool of worker
+    threads. The first error stops the scheduling of new tasks and is raised once
+    the running ones finished.
+
+    With checkpoints, the tasks whose identity matches their checkpoint are
+    resumed instead of run, see Task, and every task run stores its checkpoint.
+
+    Args:
+        tasks (Iterable[Task]): The tasks.
+        max_workers (int, optional): The number of tasks run at the same time on
+        the pool. Defaults to 1.
+        checkpoints (CheckpointStore, optional): The checkpoints of the last runs.
+        Defaults to None (every task runs).
+        force (Iterable[str], optional): Patterns of the tasks run even if they
+        could be resumed, see select_tasks(). Defaults to ().
+        skip (Iterable[str], optional): Patterns of the tasks not run, nor the tasks
+        that depend on them. Defaults to ().
+
+    Raises:
+        ValueError: If the tasks do not form a DAG, see sort_tasks(), or a pattern
+        names no task.
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, TaskTiming]]: The result and the timing of
+        each task, by name. Skipped tasks have a None result, resumed tasks whose
+        output was not needed have none.
+    """
+    tasks = sort_tasks(tasks)
+    forced = select_tasks(tasks.values(), force)
+    skipped = select_tasks(tasks.values(), skip)
+    for task in tasks.values():
+        if skipped.intersection(task.inputs):
+            skipped.add(task.name)
+    waiting = {name: set(task.inputs) for name, task in tasks.items()}
+    dependents: Dict[str, List[str]] = {name: [] for name in tasks}
+    for task in tasks.values():
+        for input_name in set(task.inputs):
+            dependents[input_name].append(task.name)
+    results: Dict[str, Any] = {}
+    outputs: Dict[str, Optional[str]] = {}
+    locks = {name: threading.Lock() for name in tasks}
+    start = time.perf_counter()
+
+    def materialize(name: str) -> Any:
+        # The output of a resumed task that was not read back is computed again.
+        with locks[name]:
+            if name not in results:
+                task = tasks[name]
+                results[name] = task.function(*map(materialize, task.inputs))
+            return results[name]
+
+    def resume(task: Task, checkpoint: Checkpoint) -> bool:
+        if not task.persist and task.restore is None:
+            return True
+        try:
+            if task.persist:
+                result = checkpoints.read_result(task.name)
+            else:
+                result = task.restore()
+        except Exception:
+            # What the task left behind is gone, it runs again.
+            return False
+        if fingerprint(result) != checkpoint.output:
+            return False
+        results[task.name] = result
+        return True
+
+    def run(task: Task) -> TaskTiming:
+        task_start = time.perf_counter() - start
+        if task.name in skipped:
+            results[task.name] = outputs[task.name] = None
+            return TaskTiming(task_start, task_start)
+        identity = fingerprint(
+            [task.name, task.key, [outputs[name] for name in task.inputs]]
+        )
+        checkpoint = None
+        if checkpoints is not None and task.key is not None:
+            checkpoint = checkpoints.get(task.name)
+        if (
+            checkpoint is not None
+            and checkpoint.identity == identity
+            and task.name not in forced
+            and resume(task, checkpoint)
+        ):
+            outputs[task.name] = checkpoint.output
+            with _print_lock:
+                print(f"Tarea {task.name} reanudada desde su checkpoint")
+            return TaskTiming(task_start, task_start)
+
+        result = task.function(*map(materialize, task.inputs))
+        with locks[task.name]:
+            results[task.name] = result
+        if task.persist or task.restore is not None:
+            outputs[task.name] = fingerprint(result)
+        else:
+            outputs[task.name] = identity
+        if checkpoints is not None and task.key is not None:
+            checkpoint = Checkpoint(identity, outputs[task.name])
+            checkpoints.put(task.name, checkpoint, *([result] if task.persist else []))
+        return TaskTiming(task_start, time.perf_counter() - start)
+
+    timings: Dict[str, TaskTiming] = {}
+    ready = [name for name, inputs in waiting.items() if not inputs]
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            while ready or running:
+                for name in ready:
+                    if not tasks[name].main_thread:
+                        running[executor.submit(run, tasks[name])] = name
+                ready = [name for name in ready if tasks[name].main_thread]
+                if ready:
+                    name = ready.pop(0)
+                    finished = [(name, run(tasks[name]))]
+                    done, _ = wait(running, timeout=0)
+                else:
+                    finished = []
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                finished += [(running.pop(future), future.result()) for future in done]
+                for name, timing in finished:
+                    timings[name] = timing
+                    for dependent in dependents[name]:
+                        waiting[dependent].discard(name)
+                        if not waiting[dependent]:
+                            ready.append(dependent)
+        except BaseException:
+            for future in running:
+                future.cancel()
+            raise
+    return results, timings
+
+
+def critical_path(
+    tasks: Iterable[Task], timings: Dict[str, TaskTiming]
+) -> List[str]:
+    """Get the chain of dependent tasks with the longest total time, which bounds
+    the wall time of the run however many workers it gets.
+
+    Args:
+        tasks (Iterable[Task]): The tasks.
+        timings (Dict[str, TaskTiming]): The timings returned by run_tasks().
+
+    Returns:
+        List[str]: The names of the tasks of the path, in run order.
+    """
+    finish: Dict[str, float] = {}
+    previous: Dict[str, Any] = {}
+    for name, task in sort_tasks(tasks).items():
+        gate = max(task.inputs, key=finish.get, default=None)
+        finish[name] = timings[name].end - timings[name].start + finish.get(gate, 0)
+        previous[name] = gate
+    path = []
+    name = max(finish, key=finish.get, default=None)
+    while name is not None:
+        path.append(name)
+        name = previous[name]
+    return path[::-1]
+
+
+def print_critical_path(tasks: Iterable[Task], timings: Dict[str, TaskTiming]):
+    """Print the critical path of a run and the time of each of its tasks.
+
+    Args:
+        tasks (Iterable[Task]): The tasks.
+        timings (Dict[str, TaskTiming]): The timings returned by run_tasks().
+    """
+    path = critical_path(tasks, timings)
+    path_seconds = sum(timings[name].end - timings[name].start for name in path)
+    wall_seconds = max((timing.end for timing in timings.values()), default=0)
+    print(f"Ruta crítica: {path_seconds:.2f}s de {wall_seconds:.2f}s en total")
+    for name in path:
+        timing = timings[name]
+        print(
+            f"  {name}: {timing.end - timing.start:.2f}s "
+            f"({timing.start:.2f}s - {timing.end:.2f}s)"
+        )
@@ -0,0 +1,78 @@
+import os
+import sqlite3
+import time
+
+from sqlalchemy.engine.base import Engine
+
+from src.config import SQLITE_BD_ABSOLUTE_PATH, get_engine
+from src.partitions import attach_partitions
+
+
+def create_memory_database() -> Engine:
+    """Create an in-memory SQLite database to load and query the tables in.
+
+    Every connection of the engine shares one SQLite connection, so the tables
+    loaded through one of them are seen by all the others.
+
+    Returns:
+        Engine: The in-memory database.
+    """
+    return get_engine(None)
+
+
+def save_snapshot(database: Engine, path: str = SQLITE_BD_ABSOLUTE_PATH) -> float:
+    """Persist a database to a file with the SQLite online backup API.
+
+    The pages are copied into a connection on path in one write transaction,
+    journaled by SQLite like any other write. Readers of path see either the old
+    or the new database, and a crash during the copy leaves the old one.
+
+    Args:
+        database (Engine): The SQLite database to persist.
+        path (str, optional): The database file. Defaults to
+        config.SQLITE_BD_ABSOLUTE_PATH.
+
+    Returns:
+        float: The seconds the backup took.
+    """
+    start = time.perf_counter()
+    source = database.raw_connection()
+    try:
+        target = sqlite3.connect(path)
+        try:
+            source.connection.backup(target)
+        finally:
+            target.close()
+    finally:
+        source.close()
+    return time.perf_counter() - start
+
+
+def restore_snapshot(path: str = SQLITE_BD_ABSOLUTE_PATH) -> Engine:
+    """Copy a database file into a new in-memory database, so the queries start
+    with every page in memory. Partitioned tables stay in their partition files,
+    which are attached to the copy.
+
+    Args:
+        path (str, optional): The database file. Defaults to
+        config.SQLITE_BD_ABSOLUTE_PATH.
+
+    Raises:
+        FileNotFoundError: If the database file does not exist.
+
+    Returns:
+        Engine: The in-memory database holding a copy of the file.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"La base de datos {path} no existe")
+    database = create_memory_database()
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    target = database.raw_connection()
+    try:
+        source.backup(target.connection)
+        # The connection was opened before the partition layout was copied in.
+        target.info["partitions"] = attach_partitions(target.connection)
+    finally:
+        target.close()
+        source.close()
+    return database
@@ -1,18 +1,40 @@
+import queue
+import threading
+import time
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from typing import Callable, Dict, List
+from functools import wraps
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+from weakref import WeakKeyDictionary
 
 import numpy as np
-import pandas as pd
 from pandas import DataFrame, read_sql
 from sqlalchemy import text, inspect
+from sqlalchemy.sql.elements import TextClause
 from sqlalchemy.engine.base import Engine
 
-from src.config import QUERIES_ROOT_PATH, PUBLIC_HOLIDAYS_URL
-from src.extract import get_public_holidays
+from src.config import (
+    FETCH_ARRAYSIZE,
+    QUERIES_ROOT_PATH,
+    QUERY_END_YEAR,
+    QUERY_START_YEAR,
+)
+from src.load import (
+    create_indexes,
+    drop_indexes,
+    get_load_generation,
+    get_relation_names,
+    is_memory_database,
+)
+from src.partitions import prune_partitions
+from src.query_cache import bypass_query_cache, get_query_cache, query_cache_key
 
 QueryResult = namedtuple("QueryResult", ["query", "result"])
 
+# Keeps the reports of concurrent queries on separate lines.
+_print_lock = threading.Lock()
+
 
 class QueryEnum(Enum):
     """This class enumerates all the queries that are available"""
@@ -27,6 +49,200 @@ class QueryEnum(Enum):
     ORDERS_PER_DAY_AND_HOLIDAYS_2017 = "orders_per_day_and_holidays_2017"
     GET_FREIGHT_VALUE_WEIGHT_RELATIONSHIP = "get_freight_value_weight_relationship"
 
+    @property
+    def required_tables(self) -> Tuple[str, ...]:
+        """The tables the query reads."""
+        return QUERY_REQUIRED_TABLES[self]
+
+
+QUERY_REQUIRED_TABLES: Dict[QueryEnum, Tuple[str, ...]] = {
+    QueryEnum.DELIVERY_DATE_DIFFERECE: ("olist_orders", "olist_customers"),
+    QueryEnum.GLOBAL_AMMOUNT_ORDER_STATUS: ("daily_order_rollup",),
+    QueryEnum.REVENUE_BY_MONTH_YEAR: ("daily_item_rollup",),
+    QueryEnum.REVENUE_PER_STATE: ("daily_item_rollup",),
+    QueryEnum.TOP_10_LEAST_REVENUE_CATEGORIES: ("daily_item_rollup",),
+    QueryEnum.TOP_10_REVENUE_CATEGORIES: ("daily_item_rollup",),
+    QueryEnum.REAL_VS_ESTIMATED_DELIVERED_TIME: ("olist_orders",),
+    QueryEnum.ORDERS_PER_DAY_AND_HOLIDAYS_2017: ("olist_orders", "public_holidays"),
+    QueryEnum.GET_FREIGHT_VALUE_WEIGHT_RELATIONSHIP: ("delivered_order_items",),
+}
+
+# Column names and dtypes of the results read with fetch_columns().
+QUERY_RESULT_SCHEMAS: Dict[QueryEnum, Dict[str, str]] = {
+    QueryEnum.DELIVERY_DATE_DIFFERECE: {
+        "State": "object",
+        "Delivery_Difference": "float64",
+    },
+    QueryEnum.GLOBAL_AMMOUNT_ORDER_STATUS: {
+        "order_status": "object",
+        "Ammount": "int64",
+    },
+    QueryEnum.REVENUE_PER_STATE: {"customer_state": "object", "Revenue": "float64"},
+    QueryEnum.GET_FREIGHT_VALUE_WEIGHT_RELATIONSHIP: {
+        "total_weight": "float64",
+        "freight_value": "float64",
+    },
+}
+REVENUE_BY_MONTH_YEAR_SCHEMA = {
+    "year": "int64",
+    "month": "int64",
+    "revenue": "float64",
+}
+REAL_VS_ESTIMATED_SCHEMA = {
+    "year": "int64",
+    "month": "int64",
+    "real_time": "float64",
+    "estimated_time": "float64",
+}
+ORDERS_PER_DAY_SCHEMA = {"date": "int64", "order_count": "int64", "holiday": "bool"}
+CATEGORY_RANKING_SCHEMA = {
+    "Category": "object",
+    "Num_order": "int64",
+    "Revenue": "float64",
+}
+
+MONTH_NAMES = [
+    "Jan", "Feb", "Mar", "Apr", "May", "Jun",
+    "Jul", "Aug", "Sep", "Oct", "Nov", "Dec",
+]  # fmt: skip
+MONTH_NAMES_ES = [
+    "Ene", "Feb", "Mar", "Abr", "May", "Jun",
+    "Jul", "Ago", "Sep", "Oct", "Nov", "Dic",
+]  # fmt: skip
+
+# Table names of each engine, with the load generation they were read at.
+_schema_catalog: "WeakKeyDictionary[Engine, Tuple[int, FrozenSet[str]]]" = (
+    WeakKeyDictionary()
+)
+_schema_catalog_lock = threading.Lock()
+
+
+def get_table_names(database: Engine, refresh: bool = False) -> FrozenSet[str]:
+    """Get the table names of the database from the schema catalog. The catalog
+    is read once per engine and again only after load() changed the tables.
+
+    Args:
+        database (Engine): Database connection, or a connection of the engine.
+        refresh (bool, optional): Read the names from the database even if they
+        are cached. Defaults to False.
+
+    Returns:
+        FrozenSet[str]: The names of the tables in the database, partitioned
+        tables included.
+    """
+    engine = database.engine
+    generation = get_load_generation(engine)
+    with _schema_catalog_lock:
+        cached = _schema_catalog.get(engine)
+        if not refresh and cached is not None and cached[0] == generation:
+            return cached[1]
+        table_names = frozenset(get_relation_names(database))
+        _schema_catalog[engine] = (generation, table_names)
+        return table_names
+
+
+def invalidate_schema_catalog(database: Engine):
+    """Forget the cached table names of the database, for tables created or
+    dropped outside of load().
+
+    Args:
+        database (Engine): Database connection, or a connection of the engine.
+    """
+    with _schema_catalog_lock:
+        _schema_catalog.pop(database.engine, None)
+
+
+def check_required_tables(database: Engine, *queries: QueryEnum):
+    """Check that the tables every given query reads exist, in a single pass over
+    the schema catalog. A miss is checked once more against the database before
+    failing, in case the tables were created outside of load().
+
+    Args:
+        database (Engine): Database connection.
+        *queries (QueryEnum): The queries to check.
+
+    Raises:
+        ValueError: If a required table does not exist.
+    """
+    required_tables = dict.fromkeys(
+        table for query in queries for table in query.required_tables
+    )
+    table_names = get_table_names(database)
+    if not table_names.issuperset(required_tables):
+        table_names = get_table_names(database, refresh=True)
+    for table in required_tables:
+        if table not in table_names:
+            raise ValueError(f"La tabla {table} no existe en la base de datos")
+
+
+def cached_result(
+    database: Engine,
+    query_name: str,
+    table_names: Tuple[str, ...],
+    compute: Callable[[], DataFrame],
+    params: Optional[Dict[str, Any]] = None,
+) -> DataFrame:
+    """Get the result of a sql file from the shared query cache, computing it on a
+    miss. The result is keyed on the hash of the sql file and the fingerprints of
+    the tables it reads, so repeated calls run no SQL until load() changes those
+    tables.
+
+    Args:
+        database (Engine): Database connection.
+        query_name (str): The name of the sql file in the queries folder.
+        table_names (Tuple[str, ...]): The tables the sql file reads.
+        compute (Callable[[], DataFrame]): Computes the result on a miss.
+        params (Dict[str, Any], optional): The parameters bound to the sql file.
+        Defaults to None.
+
+    Returns:
+        DataFrame: The result.
+    """
+    key = query_cache_key(
+        database,
+        query_name,
+        f"{QUERIES_ROOT_PATH}/{query_name}.sql",
+        table_names,
+        params,
+    )
+    query_cache = get_query_cache()
+    result = query_cache.get(key)
+    if result is None:
+        result = compute()
+        query_cache.put(key, result)
+    return result
+
+
+def cached_query(
+    query: QueryEnum,
+) -> Callable[[Callable[[Engine], QueryResult]], Callable[[Engine], QueryResult]]:
+    """Memoize a query function in the shared query cache, see cached_result().
+
+    Args:
+        query (QueryEnum): The query computed by the function.
+
+    Returns:
+        Callable: The decorator.
+    """
+
+    def decorator(
+        function: Callable[[Engine], QueryResult]
+    ) -> Callable[[Engine], QueryResult]:
+        @wraps(function)
+        def wrapper(database: Engine) -> QueryResult:
+            check_required_tables(database, query)
+            result = cached_result(
+                database,
+                query.value,
+                query.required_tables,
+                lambda: function(database).result,
+            )
+            return QueryResult(query=query.value, result=result)
+
+        return wrapper
+
+    return decorator
+
 
 def read_query(query_name: str) -> str:
     """Read the query from the file.
@@ -43,6 +259,105 @@ def read_query(query_name: str) -> str:
     return sql
 
 
+def fetch_columns(
+    database: Engine,
+    query: TextClause,
+    schema: Dict[str, str],
+    arraysize: int = FETCH_ARRAYSIZE,
+    params: Optional[Dict[str, Any]] = None,
+) -> DataFrame:
+    """Run a query on the raw DB-API cursor and build one typed NumPy array per
+    column, skipping the row objects and dtype inference of read_sql. Rows are
+    fetched arraysize at a time. NULLs become NaN in float columns and None in
+    object columns.
+
+    Args:
+        database (Engine): Database connection.
+        query (TextClause): The query.
+        schema (Dict[str, str]): The name and dtype of each result column, in
+        order.
+        arraysize (int, optional): The rows fetched per call. Defaults to
+        config.FETCH_ARRAYSIZE.
+        params (Dict[str, Any], optional): The values of the :name parameters of
+        the query. Defaults to None.
+
+    Raises:
+        ValueError: If the query returns other columns than the schema.
+
+    Returns:
+        DataFrame: The result of the query.
+    """
+    if isinstance(database, Engine):
+        connection = database.raw_connection()
+    else:
+        connection = database.connection
+    try:
+        cursor = connection.cursor()
+        cursor.arraysize = arraysize
+        cursor.execute(query.text, params or {})
+        names = [column[0] for column in cursor.description]
+        if names != list(schema):
+            raise ValueError(
+                f"Las columnas {names} no coinciden con el esquema {list(schema)}"
+            )
+        dtypes = [np.dtype(schema[name]) for name in names]
+        batches: List[List[np.ndarray]] = [[] for _ in names]
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            for batch, values, dtype in zip(batches, zip(*rows), dtypes):
+                batch.append(np.array(values, dtype=dtype))
+        cursor.close()
+    finally:
+        if isinstance(database, Engine):
+            connection.close()
+
+    return DataFrame(
+        {
+            name: np.concatenate(batch) if batch else np.empty(0, dtype=dtype)
+            for name, batch, dtype in zip(names, batches, dtypes)
+        },
+        columns=names,
+    )
+
+
+def pivot_years(
+    values: DataFrame,
+    month_names: List[str],
+    start_year: int,
+    end_year: int,
+    suffixes: Dict[str, str],
+) -> DataFrame:
+    """Pivot values by year and month into one row per month and one YearNNNN
+    column per year of the range and value column, e.g. Year2017_real_time.
+
+    Args:
+        values (DataFrame): The columns year, month (1 to 12) and the value
+        columns, with one row per year and month at most.
+        month_names (List[str]): The name of each month.
+        start_year (int): The first year.
+        end_year (int): The last year, included.
+        suffixes (Dict[str, str]): The suffix of the pivoted columns of each
+        value column, in output order.
+
+    Returns:
+        DataFrame: The columns month_no (01 to 12), month and the YearNNNN
+        columns, NaN for the months without values.
+    """
+    years = range(int(start_year), int(end_year) + 1)
+    result = DataFrame(
+        {"month_no": [f"{month:02d}" for month in range(1, 13)], "month": month_names}
+    )
+    for column, suffix in suffixes.items():
+        by_month = values.pivot(index="month", columns="year", values=column)
+        by_month = by_month.reindex(index=range(1, 13), columns=years)
+        for year in years:
+            result[f"Year{year}{suffix}"] = by_month[year].astype("float64").to_numpy()
+    return result
+
+
+@cached_query(QueryEnum.DELIVERY_DATE_DIFFERECE)
 def query_delivery_date_difference(database: Engine) -> QueryResult:
     """Get the query for delivery date difference.
 
@@ -54,9 +369,13 @@ def query_delivery_date_difference(database: Engine) -> QueryResult:
     """
     query_name = QueryEnum.DELIVERY_DATE_DIFFERECE.value
     query = read_query(QueryEnum.DELIVERY_DATE_DIFFERECE.value)
-    return QueryResult(query=query_name, result=read_sql(query, database))
+    result = fetch_columns(
+        database, query, QUERY_RESULT_SCHEMAS[QueryEnum.DELIVERY_DATE_DIFFERECE]
+    )
+    return QueryResult(query=query_name, result=result)
 
 
+@cached_query(QueryEnum.GLOBAL_AMMOUNT_ORDER_STATUS)
 def query_global_ammount_order_status(database: Engine) -> QueryResult:
     """Get the query for global amount of order status.
 
@@ -68,23 +387,58 @@ def query_global_ammount_order_status(database: Engine) -> QueryResult:
     """
     query_name = QueryEnum.GLOBAL_AMMOUNT_ORDER_STATUS.value
     query = read_query(QueryEnum.GLOBAL_AMMOUNT_ORDER_STATUS.value)
-    return QueryResult(query=query_name, result=read_sql(query, database))
+    result = fetch_columns(
+        database, query, QUERY_RESULT_SCHEMAS[QueryEnum.GLOBAL_AMMOUNT_ORDER_STATUS]
+    )
+    return QueryResult(query=query_name, result=result)
 
 
-def query_revenue_by_month_year(database: Engine) -> QueryResult:
-    """Get the query for revenue by month year.
+def query_revenue_by_month_year(
+    database: Engine,
+    start_year: int = QUERY_START_YEAR,
+    end_year: int = QUERY_END_YEAR,
+) -> QueryResult:
+    """Get the revenue of the orders not cancelled by purchase month, with one
+    YearNNNN column per year of the range. The years are bound parameters of a
+    single grouped scan, the columns are pivoted from its rows.
 
     Args:
         database (Engine): Database connection.
+        start_year (int, optional): The first year. Defaults to
+        config.QUERY_START_YEAR.
+        end_year (int, optional): The last year, included. Defaults to
+        config.QUERY_END_YEAR.
 
     Returns:
-        Query: The query for revenue by month year.
+        QueryResult: Query result with the columns month_no, month and
+        YearNNNN, 0.0 for the months without revenue.
     """
     query_name = QueryEnum.REVENUE_BY_MONTH_YEAR.value
-    query = read_query(QueryEnum.REVENUE_BY_MONTH_YEAR.value)
-    return QueryResult(query=query_name, result=read_sql(query, database))
+    check_required_tables(database, QueryEnum.REVENUE_BY_MONTH_YEAR)
+    params = dict(start_year=int(start_year), end_year=int(end_year))
+
+    def compute() -> DataFrame:
+        revenue = fetch_columns(
+            database,
+            read_query(query_name),
+            REVENUE_BY_MONTH_YEAR_SCHEMA,
+            params=params,
+        )
+        return pivot_years(
+            revenue, MONTH_NAMES, start_year, end_year, {"revenue": ""}
+        ).fillna(0.0)
+
+    result = cached_result(
+        database,
+        query_name,
+        QueryEnum.REVENUE_BY_MONTH_YEAR.required_tables,
+        compute,
+        params,
+    )
+    return QueryResult(query=query_name, result=result)
 
 
+@cached_query(QueryEnum.REVENUE_PER_STATE)
 def query_revenue_per_state(database: Engine) -> QueryResult:
     """Query revenue per state.
 
@@ -96,22 +450,68 @@ def query_revenue_per_state(database: Engine) -> QueryResult:
     """
     query_name = "revenue_per_state"
     query = read_query(query_name)
-    
-    # Verificar que las tablas necesarias existan
-    inspector = inspect(database)
-    required_tables = ['olist_orders', 'olist_order_items', 'olist_customers']
-    existing_tables = inspector.get_table_names()
-    
-    for table in required_tables:
-        if table not in existing_tables:
-            raise ValueError(f"La tabla {table} no existe en la base de datos")
-            
-    # Ejecutar la consulta
-    result = read_sql(query, database)
-    
+    check_required_tables(database, QueryEnum.REVENUE_PER_STATE)
+    result = fetch_columns(
+        database, query, QUERY_RESULT_SCHEMAS[QueryEnum.REVENUE_PER_STATE]
+    )
+
     return QueryResult(query=query_name, result=result)
 
 
+def get_category_revenue_ranking(database: Engine) -> DataFrame:
+    """Rank every category by revenue, from the highest to the lowest. The ranking
+    is aggregated once and kept in the query cache, the top and bottom category
+    queries are slices of it.
+
+    Args:
+        database (Engine): Database connection.
+
+    Returns:
+        DataFrame: A dataframe with the columns Category, Num_order and Revenue.
+    """
+    query_name = "category_revenue_ranking"
+    # Both category queries read the same tables as the ranking.
+    check_required_tables(database, QueryEnum.TOP_10_REVENUE_CATEGORIES)
+    return cached_result(
+        database,
+        query_name,
+        QueryEnum.TOP_10_REVENUE_CATEGORIES.required_tables,
+        lambda: fetch_columns(
+            database, read_query(query_name), CATEGORY_RANKING_SCHEMA
+        ),
+    )
+
+
+def query_top_k_revenue_categories(
+    database: Engine, k: int, least: bool = False
+) -> QueryResult:
+    """Query the k categories with the highest or the lowest revenue.
+
+    Args:
+        database (Engine): Database connection.
+        k (int): The number of categories.
+        least (bool, optional): Get the categories with the lowest revenue, from
+        the lowest up. Defaults to False.
+
+    Raises:
+        ValueError: If k is negative.
+
+    Returns:
+        QueryResult: Query result named top_{k}_revenue_categories, or
+        top_{k}_least_revenue_categories when least is True.
+    """
+    if k < 0:
+        raise ValueError(f"k debe ser mayor o igual a 0, se recibió {k}")
+    ranking = get_category_revenue_ranking(database)
+    if least:
+        query_name = f"top_{k}_least_revenue_categories"
+        result = ranking.iloc[max(len(ranking) - k, 0) :].iloc[::-1]
+    else:
+        query_name = f"top_{k}_revenue_categories"
+        result = ranking.iloc[:k]
+    return QueryResult(query=query_name, result=result.reset_index(drop=True))
+
+
 def query_top_10_least_revenue_categories(database: Engine) -> QueryResult:
     """Query top 10 least revenue categories.
 
@@ -121,27 +521,7 @@ def query_top_10_least_revenue_categories(database: Engine) -> QueryResult:
     Returns:
         QueryResult: Query result with top 10 least revenue categories.
     """
-    query_name = "top_10_least_revenue_categories"
-    query = read_query(query_name)
-    
-    # Verificar que las tablas necesarias existan
-    inspector = inspect(database)
-    required_tables = [
-        'olist_orders', 
-        'olist_order_items', 
-        'olist_products',
-        'product_category_name_translation'
-    ]
-    existing_tables = inspector.get_table_names()
-    
-    for table in required_tables:
-        if table not in existing_tables:
-            raise ValueError(f"La tabla {table} no existe en la base de datos")
-    
-    # Ejecutar la consulta
-    result = read_sql(query, database)
-    
-    return QueryResult(query=query_name, result=result)
+    return query_top_k_revenue_categories(database, 10, least=True)
 
 
 def query_top_10_revenue_categories(database: Engine) -> QueryResult:
@@ -153,65 +533,68 @@ def query_top_10_revenue_categories(database: Engine) -> QueryResult:
     Returns:
         QueryResult: Query result with top 10 revenue categories.
     """
-    query_name = "top_10_revenue_categories"
-    query = read_query(query_name)
-    
-    # Verificar que las tablas necesarias existan
-    inspector = inspect(database)
-    required_tables = [
-        'olist_orders', 
-        'olist_order_items', 
-        'olist_products',
-        'product_category_name_translation'
-    ]
-    existing_tables = inspector.get_table_names()
-    
-    for table in required_tables:
-        if table not in existing_tables:
-            raise ValueError(f"La tabla {table} no existe en la base de datos")
-    
-    # Ejecutar la consulta
-    result = read_sql(query, database)
-    
-    return QueryResult(query=query_name, result=result)
+    return query_top_k_revenue_categories(database, 10)
 
 
-def query_real_vs_estimated_delivered_time(database: Engine) -> QueryResult:
-    """Query real vs estimated delivered time.
+def query_real_vs_estimated_delivered_time(
+    database: Engine,
+    start_year: int = QUERY_START_YEAR,
+    end_year: int = QUERY_END_YEAR,
+) -> QueryResult:
+    """Query real vs estimated delivered time by purchase month, with the
+    YearNNNN_real_time and YearNNNN_estimated_time columns of each year of the
+    range, pivoted from a single grouped scan bound to the years. Partitioned
+    orders are only read from the partitions of those years.
 
     Args:
         database (Engine): Database connection.
+        start_year (int, optional): The first year. Defaults to
+        config.QUERY_START_YEAR.
+        end_year (int, optional): The last year, included. Defaults to
+        config.QUERY_END_YEAR.
 
     Returns:
-        QueryResult: Query result with real vs estimated delivered time.
+        QueryResult: Query result with real vs estimated delivered time, NaN for
+        the months without delivered orders.
     """
-    query_name = "real_vs_estimated_delivered_time"
-    query = read_query(query_name)
-    
-    # Verificar que las tablas necesarias existan
-    inspector = inspect(database)
-    required_tables = ['olist_orders']
-    existing_tables = inspector.get_table_names()
-    
-    for table in required_tables:
-        if table not in existing_tables:
-            raise ValueError(f"La tabla {table} no existe en la base de datos")
-    
-    # Ejecutar la consulta
-    result = read_sql(query, database)
-    
+    query_name = QueryEnum.REAL_VS_ESTIMATED_DELIVERED_TIME.value
+    check_required_tables(database, QueryEnum.REAL_VS_ESTIMATED_DELIVERED_TIME)
+    params = dict(start_year=int(start_year), end_year=int(end_year))
+
+    def compute() -> DataFrame:
+        query = prune_partitions(
+            database, read_query(query_name), start_year, end_year
+        )
+        times = fetch_columns(database, query, REAL_VS_ESTIMATED_SCHEMA, params=params)
+        return pivot_years(
+            times,
+            MONTH_NAMES_ES,
+            start_year,
+            end_year,
+            {"real_time": "_real_time", "estimated_time": "_estimated_time"},
+        )
+
+    result = cached_result(
+        database,
+        query_name,
+        QueryEnum.REAL_VS_ESTIMATED_DELIVERED_TIME.required_tables,
+        compute,
+        params,
+    )
     return QueryResult(query=query_name, result=result)
 
 
+@cached_query(QueryEnum.GET_FREIGHT_VALUE_WEIGHT_RELATIONSHIP)
 def query_freight_value_weight_relationship(database: Engine) -> QueryResult:
     """Get the freight_value weight relation for delivered orders.
 
     In this particular query, we want to evaluate if exists a correlation between
     the weight of the product and the value paid for delivery.
 
-    We will use olist_orders, olist_order_items, and olist_products tables alongside
-    some Pandas magic to produce the desired output: A table that allows us to
-    compare the order total weight and total freight value.
+    We will use the delivered_order_items fact table, built at load time from
+    olist_orders, olist_order_items, and olist_products, alongside some Pandas
+    magic to produce the desired output: A table that allows us to compare the
+    order total weight and total freight value.
 
     Of course, you could also do this with pure SQL statements but we would like
     to see if you've learned correctly the pandas' concepts seen so far.
@@ -224,23 +607,47 @@ def query_freight_value_weight_relationship(database: Engine) -> QueryResult:
     """
     query_name = "get_freight_value_weight_relationship"
     query = read_query(query_name)
-    
-    # Verificar que las tablas necesarias existan
-    inspector = inspect(database)
-    required_tables = [
-        'olist_orders', 
-        'olist_order_items', 
-        'olist_products'
-    ]
-    existing_tables = inspector.get_table_names()
-    
-    for table in required_tables:
-        if table not in existing_tables:
-            raise ValueError(f"La tabla {table} no existe en la base de datos")
-    
-    # Ejecutar la consulta
-    result = read_sql(query, database)
-    
+    check_required_tables(database, QueryEnum.GET_FREIGHT_VALUE_WEIGHT_RELATIONSHIP)
+    result = fetch_columns(
+        database,
+        query,
+        QUERY_RESULT_SCHEMAS[QueryEnum.GET_FREIGHT_VALUE_WEIGHT_RELATIONSHIP],
+    )
+
+    return QueryResult(query=query_name, result=result)
+
+
+def query_orders_per_day_and_holidays(
+    database: Engine, start_year: int, end_year: int
+) -> QueryResult:
+    """Get the number of orders per purchase day between two years, flagging the
+    days found in the public_holidays table loaded by extract(), in SQL.
+    Partitioned orders are only read from the partitions of those years.
+
+    Args:
+        database (Engine): Database connection.
+        start_year (int): The first year.
+        end_year (int): The last year, included.
+
+    Returns:
+        QueryResult: Query result with the columns date (epoch milliseconds),
+        order_count and holiday.
+    """
+    query_name = "orders_per_day_and_holidays"
+    check_required_tables(database, QueryEnum.ORDERS_PER_DAY_AND_HOLIDAYS_2017)
+    params = dict(start_year=int(start_year), end_year=int(end_year))
+    result = cached_result(
+        database,
+        query_name,
+        QueryEnum.ORDERS_PER_DAY_AND_HOLIDAYS_2017.required_tables,
+        lambda: fetch_columns(
+            database,
+            prune_partitions(database, read_query(query_name), start_year, end_year),
+            ORDERS_PER_DAY_SCHEMA,
+            params=params,
+        ),
+        params,
+    )
     return QueryResult(query=query_name, result=result)
 
 
@@ -252,28 +659,10 @@ def query_orders_per_day_and_holidays_2017(database: Engine) -> QueryResult:
     Returns:
         QueryResult: The query result.
     """
-    query_name = "orders_per_day_and_holidays_2017"
-    query = read_query(query_name)
-    
-    try:
-        # Execute query to get orders per day
-        result_df = pd.read_sql_query(query, database)
-        
-        # Get holidays for 2017
-        holidays_2017 = get_public_holidays(PUBLIC_HOLIDAYS_URL, "2017")
-        
-        # Convert date strings to datetime and then to timestamp in milliseconds
-        result_df['date'] = pd.to_datetime(result_df['date']).astype(np.int64) // 10**6
-        holidays_2017['date'] = pd.to_datetime(holidays_2017['date'])
-        
-        # Add holiday column
-        result_df['holiday'] = result_df['date'].isin([h.timestamp() * 1000 for h in holidays_2017['date']])
-        
-        return QueryResult(query=query_name, result=result_df)
-        
-    except Exception as e:
-        print(f"Error executing query {query_name}: {str(e)}")
-        raise
+    result = query_orders_per_day_and_holidays(database, 2017, 2017).result
+    return QueryResult(
+        query=QueryEnum.ORDERS_PER_DAY_AND_HOLIDAYS_2017.value, result=result
+    )
 
 
 def get_all_queries() -> List[Callable[[Engine], QueryResult]]:
@@ -295,17 +684,122 @@ def get_all_queries() -> List[Callable[[Engine], QueryResult]]:
     ]
 
 
-def run_queries(database: Engine) -> Dict[str, DataFrame]:
+def report_query_result(query_name: str, query_result: QueryResult, seconds: float):
+    """Print a summary of a query result and the time it took.
+
+    Args:
+        query_name (str): The name of the query.
+        query_result (QueryResult): The result of the query.
+        seconds (float): The wall time of the query.
+    """
+    if isinstance(query_result.result, DataFrame):
+        if query_result.result.empty:
+            message = (
+                f"Advertencia: La consulta {query_name} devolvió un resultado vacío "
+                f"({seconds:.3f}s)"
+            )
+        else:
+            message = (
+                f"Consulta {query_name} completada. Filas: {len(query_result.result)} "
+                f"({seconds:.3f}s)"
+            )
+    else:
+        message = f"Advertencia: La consulta {query_name} no devolvió un DataFrame"
+    with _print_lock:
+        print(message)
+
+
+def run_query(query: Callable[[Any], QueryResult], source: Any) -> QueryResult:
+    """Run one query and report its result and the time it took.
+
+    Args:
+        query (Callable[[Any], QueryResult]): A query of get_all_queries(), or of
+        src.transform_pandas.get_all_queries().
+        source (Any): What the query reads, a database connection or the
+        dataframes.
+
+    Returns:
+        QueryResult: The result of the query.
+    """
+    query_name = query.__name__.replace("query_", "")
+    try:
+        start = time.perf_counter()
+        query_result = query(source)
+        seconds = time.perf_counter() - start
+    except Exception as e:
+        print(f"Error ejecutando consulta {query_name}: {str(e)}")
+        raise
+    report_query_result(query_name, query_result, seconds)
+    return query_result
+
+
+def run_queries_concurrently(
+    database: Engine, max_workers: int
+) -> Dict[str, DataFrame]:
+    """Run the queries on a pool of worker threads. Each worker takes one pooled
+    connection for its lifetime and keeps pulling queries until none are left,
+    so a slow query only holds up its own worker.
+
+    Args:
+        database (Engine): Database connection.
+        max_workers (int): The number of workers, each with its own connection.
+
+    Returns:
+        Dict[str, DataFrame]: A dictionary with keys as the query file names and
+        values the result of the query as a dataframe, in get_all_queries() order.
+    """
+    check_required_tables(database, *QueryEnum)
+
+    pending: "queue.SimpleQueue[Callable[[Engine], QueryResult]]" = queue.SimpleQueue()
+    for query in get_all_queries():
+        pending.put(query)
+
+    def worker() -> List[QueryResult]:
+        completed = []
+        with database.connect() as connection:
+            while True:
+                try:
+                    query = pending.get_nowait()
+                except queue.Empty:
+                    return completed
+                completed.append(run_query(query, connection))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(worker) for _ in range(max_workers)]
+        completed = {
+            query_result.query: query_result.result
+            for future in futures
+            for query_result in future.result()
+        }
+
+    return {
+        query_name: completed[query_name]
+        for query_name in [query.value for query in QueryEnum]
+        if query_name in completed
+    }
+
+
+def run_queries(database: Engine, max_workers: int = 1) -> Dict[str, DataFrame]:
     """Transform data based on the queries. For each query, the query is executed and
     the result is stored in the dataframe.
 
     Args:
         database (Engine): Database connection.
+        max_workers (int, optional): The number of queries run at the same time,
+        each on its own connection. In-memory SQLite databases are always queried
+        sequentially because a new connection would not see their tables.
+        Defaults to 1.
 
     Returns:
         Dict[str, DataFrame]: A dictionary with keys as the query file names and
         values the result of the query as a dataframe.
     """
+    if max_workers > 1 and not is_memory_database(database):
+        return run_queries_concurrently(database, max_workers)
+
+    check_required_tables(database, *QueryEnum)
+    print(f"Tablas disponibles: {sorted(get_table_names(database))}")
+
     results = {}
     queries = get_all_queries()
 
@@ -314,25 +808,101 @@ def run_queries(database: Engine) -> Dict[str, DataFrame]:
             # Obtener el nombre de la consulta de la función
             query_name = query.__name__.replace('query_', '')
             print(f"\nEjecutando consulta: {query_name}")
-            
-            # Verificar que las tablas necesarias existan
-            inspector = inspect(database)
-            tables = inspector.get_table_names()
-            print(f"Tablas disponibles: {tables}")
-            
+
             # Ejecutar la consulta
+            start = time.perf_counter()
             query_result = query(database)
-            
-            if isinstance(query_result.result, DataFrame):
-                if query_result.result.empty:
-                    print(f"Advertencia: La consulta {query_name} devolvió un resultado vacío")
-                else:
-                    print(f"Consulta {query_name} completada. Filas: {len(query_result.result)}")
-            else:
-                print(f"Advertencia: La consulta {query_name} no devolvió un DataFrame")
+            report_query_result(query_name, query_result, time.perf_counter() - start)
             
             results[query_result.query] = query_result.result
             
         except Exception as e:
             print(f"Error ejecutando consulta {query_name}: {str(e)}")
             raise
+
+    return results
+
+
+def time_queries(database: Engine) -> Dict[str, float]:
+    """Time each query.
+
+    Args:
+        database (Engine): Database connection.
+
+    Returns:
+        Dict[str, float]: A dictionary with keys as the query file names and values
+        the seconds each query took.
+    """
+    timings = {}
+    # Time the queries themselves, not the query cache.
+    with bypass_query_cache():
+        for query in get_all_queries():
+            start = time.perf_counter()
+            query_result = query(database)
+            timings[query_result.query] = time.perf_counter() - start
+    return timings
+
+
+def index_report(database: Engine) -> DataFrame:
+    """Time each query without and with the keys and indexes declared in
+    config.get_table_indexes(). The indexes are left in place.
+
+    Args:
+        database (Engine): Database connection.
+
+    Returns:
+        DataFrame: A dataframe with the columns query, before_s, after_s and
+        speedup.
+    """
+    # The indexes of the partitions are not dropped, they are built with them.
+    table_names = sorted(inspect(database).get_table_names())
+    drop_indexes(database, table_names)
+    before = time_queries(database)
+    create_indexes(database, table_names)
+    after = time_queries(database)
+
+    report = DataFrame(
+        {
+            "query": list(before.keys()),
+            "before_s": list(before.values()),
+            "after_s": [after[query_name] for query_name in before],
+        }
+    )
+    report["speedup"] = report["before_s"] / report["after_s"]
+    return report.round(4)
+
+
+def fetch_report(database: Engine, repeat: int = 3) -> DataFrame:
+    """Time the queries that declare a result schema, read with read_sql and with
+    fetch_columns(). Each time is the best of repeat runs.
+
+    Args:
+        database (Engine): Database connection.
+        repeat (int, optional): The runs of each reader. Defaults to 3.
+
+    Returns:
+        DataFrame: A dataframe with the columns query, rows, read_sql_s, fetch_s
+        and speedup.
+    """
+    schemas = {query.value: schema for query, schema in QUERY_RESULT_SCHEMAS.items()}
+    schemas["category_revenue_ranking"] = CATEGORY_RANKING_SCHEMA
+
+    rows = []
+    for query_name, schema in schemas.items():
+        query = read_query(query_name)
+        timings = {}
+        for reader, read in [
+            ("read_sql_s", lambda: read_sql(query, database)),
+            ("fetch_s", lambda: fetch_columns(database, query, schema)),
+        ]:
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                result = read()
+                best = min(best, time.perf_counter() - start)
+            timings[reader] = best
+        rows.append(dict(query=query_name, rows=len(result), **timings))
+
+    report = DataFrame(rows)
+    report["speedup"] = report["read_sql_s"] / report["fetch_s"]
+    return report.round(4)
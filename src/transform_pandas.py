@@ -0,0 +1,492 @@
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from src.load import DERIVED_COLUMNS
+from src.config import QUERY_END_YEAR, QUERY_START_YEAR
+from src.transform import (
+    MONTH_NAMES,
+    MONTH_NAMES_ES,
+    QueryEnum,
+    QueryResult,
+    pivot_years,
+    report_query_result,
+)
+
+# The tables the queries of this backend read, as returned by extract().
+DataFrames = Dict[str, DataFrame]
+
+SECONDS_PER_DAY = 86400.0
+
+
+def sql_round(values: pd.Series, decimals: int) -> pd.Series:
+    """Round half away from zero like SQLite ROUND(), instead of the half to even
+    rounding of numpy, so both backends return the same values.
+
+    Args:
+        values (pd.Series): The values to round.
+        decimals (int): The number of decimals.
+
+    Returns:
+        pd.Series: The rounded values.
+    """
+    values = values.astype("float64")
+    # Drop the binary noise first so 2.675 rounds to 2.68 as it does in SQLite.
+    scaled = np.round(values * 10**decimals, 9)
+    return np.sign(scaled) * np.floor(np.abs(scaled) + 0.5) / 10**decimals
+
+
+def prepare(data_frames: DataFrames) -> DataFrames:
+    """Add the DERIVED_COLUMNS and the delivered_order_items fact table load()
+    builds, so every query of this backend finds them.
+
+    Args:
+        data_frames (DataFrames): The dataframes returned by extract().
+
+    Returns:
+        DataFrames: A new dictionary with the prepared dataframes.
+    """
+    data_frames = dict(data_frames)
+    for table_name, add_columns in DERIVED_COLUMNS.items():
+        if table_name in data_frames:
+            data_frames[table_name] = add_columns(data_frames[table_name])
+    if "delivered_order_items" not in data_frames:
+        data_frames["delivered_order_items"] = get_delivered_order_items(data_frames)
+    return data_frames
+
+
+def _orders(data_frames: DataFrames) -> DataFrame:
+    orders = data_frames["olist_orders"]
+    if "purchase_year" not in orders:
+        orders = DERIVED_COLUMNS["olist_orders"](orders)
+    return orders
+
+
+def _delivered(orders: DataFrame) -> DataFrame:
+    return orders[
+        (orders["order_status"] == "delivered")
+        & orders["order_delivered_customer_date"].notna()
+    ]
+
+
+def _to_object(df: DataFrame) -> DataFrame:
+    # Categorical keys come back as plain values, as they do from read_sql.
+    for column in df.columns:
+        if df[column].dtype.name == "category":
+            df[column] = df[column].astype(object)
+    return df
+
+
+def get_delivered_order_items(data_frames: DataFrames) -> DataFrame:
+    """Join the delivered orders to their items, like the delivered_order_items
+    fact table of load.FACT_TABLES. Customers, products and category translations
+    are looked up with left joins, their keys are NaN when there is no match.
+
+    Args:
+        data_frames (DataFrames): The dataframes returned by extract().
+
+    Returns:
+        DataFrame: One row per delivered order item.
+    """
+    if "delivered_order_items" in data_frames:
+        return data_frames["delivered_order_items"]
+
+    orders = data_frames["olist_orders"]
+    delivered = _delivered(orders)[["order_id", "customer_id"]]
+    items = data_frames["olist_order_items"][
+        ["order_id", "order_item_id", "product_id", "price", "freight_value"]
+    ]
+    fact = delivered.merge(items, on="order_id")
+
+    customers = data_frames["olist_customers"][["customer_id", "customer_state"]]
+    fact = fact.merge(
+        customers.assign(customer_key=customers["customer_id"]),
+        on="customer_id",
+        how="left",
+    )
+    products = data_frames["olist_products"][
+        ["product_id", "product_category_name", "product_weight_g"]
+    ]
+    fact = fact.merge(
+        products.assign(product_key=products["product_id"]),
+        on="product_id",
+        how="left",
+    )
+    translation = data_frames["product_category_name_translation"]
+    fact = fact.merge(
+        translation[["product_category_name", "product_category_name_english"]],
+        on="product_category_name",
+        how="left",
+    )
+    fact["price"] = fact["price"].astype("float64")
+    fact["freight_value"] = fact["freight_value"].astype("float64")
+    fact["product_weight_g"] = fact["product_weight_g"].astype("float64")
+    fact["revenue"] = fact["price"] + fact["freight_value"]
+    return fact
+
+
+def query_delivery_date_difference(data_frames: DataFrames) -> QueryResult:
+    """Get the average difference in days between the estimated and the real
+    delivery date, by customer state.
+
+    Args:
+        data_frames (DataFrames): The dataframes returned by extract().
+
+    Returns:
+        QueryResult: Query result with the columns State and Delivery_Difference.
+    """
+    orders = _delivered(_orders(data_frames))
+    orders = orders[["customer_id", "delivery_difference_days"]]
+    customers = data_frames["olist_customers"][["customer_id", "customer_state"]]
+    df = orders.merge(customers, on="customer_id")
+    result = (
+        df.groupby("customer_state", observed=True, dropna=False)[
+            "delivery_difference_days"
+        ]
+        .mean()
+        .pipe(sql_round, 2)
+        .rename("Delivery_Difference")
+        .rename_axis("State")
+        .reset_index()
+        .sort_values("Delivery_Difference", ascending=False, kind="stable")
+        .reset_index(drop=True)
+    )
+    return QueryResult(
+        query=QueryEnum.DELIVERY_DATE_DIFFERECE.value, result=_to_object(result)
+    )
+
+
+def query_global_ammount_order_status(data_frames: DataFrames) -> QueryResult:
+    """Get the number of orders in each status.
+
+    Args:
+        data_frames (DataFrames): The dataframes returned by extract().
+
+    Returns:
+        QueryResult: Query result with the columns order_status and Ammount.
+    """
+    status = data_frames["olist_orders"]["order_status"].astype(object)
+    result = (
+        status.value_counts(dropna=False, sort=False)
+        .sort_index()
+        .rename("Ammount")
+        .rename_axis("order_status")
+        .reset_index()
+        .sort_values("Ammount", ascending=False, kind="stable")
+        .reset_index(drop=True)
+    )
+    return QueryResult(query=QueryEnum.GLOBAL_AMMOUNT_ORDER_STATUS.value, result=result)
+
+
+def query_revenue_by_month_year(
+    data_frames: DataFrames,
+    start_year: int = QUERY_START_YEAR,
+    end_year: int = QUERY_END_YEAR,
+) -> QueryResult:
+    """Get the revenue of the orders not cancelled, by purchase month and year.
+
+    Args:
+        data_frames (DataFrames): The dataframes returned by extract().
+        start_year (int, optional): The first year. Defaults to
+        config.QUERY_START_YEAR.
+        end_year (int, optional): The last year, included. Defaults to
+        config.QUERY_END_YEAR.
+
+    Returns:
+        QueryResult: Query result with the columns month_no, month and one
+        YearNNNN column per year.
+    """
+    orders = _orders(data_frames)
+    orders = orders[
+        orders["order_status"].notna() & (orders["order_status"] != "cancelled")
+    ][["order_id", "purchase_year", "purchase_month"]]
+    items = data_frames["olist_order_items"][["order_id", "price", "freight_value"]]
+    df = orders.merge(items, on="order_id")
+    df["revenue"] = df["price"].astype("float64") + df["freight_value"].astype(
+        "float64"
+    )
+    revenue = (
+        df.groupby(["purchase_year", "purchase_month"])["revenue"]
+        .sum()
+        .rename_axis(["year", "month"])
+        .reset_index()
+    )
+    result = pivot_years(
+        revenue, MONTH_NAMES, start_year, end_year, {"revenue": ""}
+    ).fillna(0.0)
+    return QueryResult(query=QueryEnum.REVENUE_BY_MONTH_YEAR.value, result=result)
+
+
+def query_revenue_per_state(data_frames: DataFrames) -> QueryResult:
+    """Get the 10 customer states with the highest revenue.
+
+    Args:
+        data_frames (DataFrames): The dataframes returned by extract().
+
+    Returns:
+        QueryResult: Query result with the columns customer_state and Revenue.
+    """
+    fact = get_delivered_order_items(data_frames)
+    # Like the SQL, items without a customer state are left out.
+    result = (
+        fact.groupby("customer_state", observed=True)["revenue"]
+        .sum()
+        .pipe(sql_round, 2)
+        .rename("Revenue")
+        .reset_index()
+        .sort_values("Revenue", ascending=False, kind="stable")
+        .head(10)
+        .reset_index(drop=True)
+    )
+    return QueryResult(
+        query=QueryEnum.REVENUE_PER_STATE.value, result=_to_object(result)
+    )
+
+
+def get_category_revenue_ranking(data_frames: DataFrames) -> DataFrame:
+    """Rank every category by revenue, from the highest to the lowest.
+
+    Args:
+        data_frames (DataFrames): The dataframes returned by extract().
+
+    Returns:
+        DataFrame: A dataframe with the columns Category, Num_order and Revenue.
+    """
+    fact = get_delivered_order_items(data_frames)
+    fact = fact[fact["product_category_name_english"].notna()]
+    grouped = fact.groupby("product_category_name_english", observed=True)
+    ranking = DataFrame(
+        {
+            "Num_order": grouped["order_id"].nunique(),
+            "Revenue": sql_round(grouped["revenue"].sum(), 2),
+        }
+    )
+    ranking = (
+        ranking.rename_axis("Category")
+        .reset_index()
+        .sort_values("Revenue", ascending=False, kind="stable")
+        .reset_index(drop=True)
+    )
+    return _to_object(ranking)
+
+
+def query_top_k_revenue_categories(
+    data_frames: DataFrames, k: int, least: bool = False
+) -> QueryResult:
+    """Query the k categories with the highest or the lowest revenue.
+
+    Args:
+        data_frames (DataFrames): The dataframes returned by extract().
+        k (int): The number of categories.
+        least (bool, optional): Get the categories with the lowest revenue, from
+        the lowest up. Defaults to False.
+
+    Raises:
+        ValueError: If k is negative.
+
+    Returns:
+        QueryResult: Query result named top_{k}_revenue_categories, or
+        top_{k}_least_revenue_categories when least is True.
+    """
+    if k < 0:
+        raise ValueError(f"k debe ser mayor o igual a 0, se recibió {k}")
+    ranking = get_category_revenue_ranking(data_frames)
+    if least:
+        query_name = f"top_{k}_least_revenue_categories"
+        result = ranking.iloc[max(len(ranking) - k, 0) :].iloc[::-1]
+    else:
+        query_name = f"top_{k}_revenue_categories"
+        result = ranking.iloc[:k]
+    return QueryResult(query=query_name, result=result.reset_index(drop=True))
+
+
+def query_top_10_least_revenue_categories(data_frames: DataFrames) -> QueryResult:
+    """Query top 10 least revenue categories.
+
+    Args:
+        data_frames (DataFrames): The dataframes returned by extract().
+
+    Returns:
+        QueryResult: Query result with top 10 least revenue categories.
+    """
+    return query_top_k_revenue_categories(data_frames, 10, least=True)
+
+
+def query_top_10_revenue_categories(data_frames: DataFrames) -> QueryResult:
+    """Query top 10 revenue categories.
+
+    Args:
+        data_frames (DataFrames): The dataframes returned by extract().
+
+    Returns:
+        QueryResult: Query result with top 10 revenue categories.
+    """
+    return query_top_k_revenue_categories(data_frames, 10)
+
+
+def query_real_vs_estimated_delivered_time(
+    data_frames: DataFrames,
+    start_year: int = QUERY_START_YEAR,
+    end_year: int = QUERY_END_YEAR,
+) -> QueryResult:
+    """Get the average real and estimated delivery days of the delivered orders,
+    by purchase month and year.
+
+    Args:
+        data_frames (DataFrames): The dataframes returned by extract().
+        start_year (int, optional): The first year. Defaults to
+        config.QUERY_START_YEAR.
+        end_year (int, optional): The last year, included. Defaults to
+        config.QUERY_END_YEAR.
+
+    Returns:
+        QueryResult: Query result with the columns month_no, month and the
+        YearNNNN_real_time and YearNNNN_estimated_time columns of each year.
+    """
+    orders = _delivered(_orders(data_frames))
+    purchase = orders["order_purchase_epoch"]
+    times = DataFrame(
+        {
+            "purchase_year": orders["purchase_year"],
+            "purchase_month": orders["purchase_month"],
+            "real_time": (orders["order_delivered_customer_epoch"] - purchase).astype(
+                "float64"
+            ),
+            "estimated_time": (
+                orders["order_estimated_delivery_epoch"] - purchase
+            ).astype("float64"),
+        }
+    )
+    means = times.groupby(["purchase_year", "purchase_month"]).mean()
+    days = (means / SECONDS_PER_DAY).apply(sql_round, decimals=2)
+    result = pivot_years(
+        days.rename_axis(["year", "month"]).reset_index(),
+        MONTH_NAMES_ES,
+        start_year,
+        end_year,
+        {"real_time": "_real_time", "estimated_time": "_estimated_time"},
+    )
+    return QueryResult(
+        query=QueryEnum.REAL_VS_ESTIMATED_DELIVERED_TIME.value, result=result
+    )
+
+
+def query_orders_per_day_and_holidays(
+    data_frames: DataFrames, start_year: int, end_year: int
+) -> QueryResult:
+    """Get the number of orders per purchase day between two years, flagging the
+    public holidays extract() got.
+
+    Args:
+        data_frames (DataFrames): The dataframes returned by extract().
+        start_year (int): The first year.
+        end_year (int): The last year, included.
+
+    Returns:
+        QueryResult: Query result with the columns date (epoch milliseconds),
+        order_count and holiday.
+    """
+    orders = _orders(data_frames)
+    in_range = orders["purchase_year"].between(int(start_year), int(end_year))
+    counts = orders.loc[in_range.fillna(False), "purchase_date"].value_counts(
+        sort=False
+    )
+    result = DataFrame(
+        {
+            "date": pd.to_datetime(counts.index).astype(np.int64) // 10**6,
+            "order_count": counts.to_numpy(),
+        }
+    )
+    result = result.sort_values("date").reset_index(drop=True)
+
+    holidays = pd.to_datetime(data_frames["public_holidays"]["date"])
+    result["holiday"] = result["date"].isin(
+        holidays.dt.normalize().astype(np.int64) // 10**6
+    )
+    return QueryResult(query="orders_per_day_and_holidays", result=result)
+
+
+def query_orders_per_day_and_holidays_2017(data_frames: DataFrames) -> QueryResult:
+    """Get the number of orders per day of 2017, flagging the public holidays.
+
+    Args:
+        data_frames (DataFrames): The dataframes returned by extract().
+
+    Returns:
+        QueryResult: Query result with the columns date (epoch milliseconds),
+        order_count and holiday.
+    """
+    result = query_orders_per_day_and_holidays(data_frames, 2017, 2017).result
+    return QueryResult(
+        query=QueryEnum.ORDERS_PER_DAY_AND_HOLIDAYS_2017.value, result=result
+    )
+
+
+def query_freight_value_weight_relationship(data_frames: DataFrames) -> QueryResult:
+    """Get the total weight and freight value of each delivered order.
+
+    Args:
+        data_frames (DataFrames): The dataframes returned by extract().
+
+    Returns:
+        QueryResult: Query result with the columns total_weight and
+        freight_value.
+    """
+    fact = get_delivered_order_items(data_frames)
+    fact = fact[fact["product_key"].notna()]
+    grouped = fact.groupby("order_id", sort=True)
+    result = DataFrame(
+        {
+            "total_weight": sql_round(grouped["product_weight_g"].sum(min_count=1), 2),
+            "freight_value": sql_round(grouped["freight_value"].sum(), 2),
+        }
+    ).reset_index(drop=True)
+    return QueryResult(
+        query=QueryEnum.GET_FREIGHT_VALUE_WEIGHT_RELATIONSHIP.value, result=result
+    )
+
+
+def get_all_queries() -> List[Callable[[DataFrames], QueryResult]]:
+    """Get all queries of the in-memory backend, in transform.get_all_queries()
+    order.
+
+    Returns:
+        List[Callable[[DataFrames], QueryResult]]: A list of all queries.
+    """
+    return [
+        query_delivery_date_difference,
+        query_global_ammount_order_status,
+        query_revenue_by_month_year,
+        query_revenue_per_state,
+        query_top_10_least_revenue_categories,
+        query_top_10_revenue_categories,
+        query_real_vs_estimated_delivered_time,
+        query_orders_per_day_and_holidays_2017,
+        query_freight_value_weight_relationship,
+    ]
+
+
+def run_queries(data_frames: DataFrames) -> Dict[str, DataFrame]:
+    """Compute every query straight from the dataframes returned by extract(),
+    with vectorized pandas joins and groupbys instead of a database round-trip.
+
+    Args:
+        data_frames (DataFrames): The dataframes returned by extract().
+
+    Returns:
+        Dict[str, DataFrame]: A dictionary with keys as the query file names and
+        values the result of the query as a dataframe.
+    """
+    data_frames = prepare(data_frames)
+    results = {}
+    for query in get_all_queries():
+        query_name = query.__name__.replace("query_", "")
+        print(f"\nEjecutando consulta: {query_name}")
+        start = time.perf_counter()
+        query_result = query(data_frames)
+        report_query_result(query_name, query_result, time.perf_counter() - start)
+        results[query_result.query] = query_result.result
+    return results
@@ -1,5 +1,17 @@
-from src.config import DATASET_ROOT_PATH, PUBLIC_HOLIDAYS_URL, get_csv_to_table_mapping
-from src.extract import extract, get_public_holidays
+import socket
+import time
+
+import numpy as np
+import pytest
+
+from src.config import (
+    DATASET_ROOT_PATH,
+    PUBLIC_HOLIDAYS_URL,
+    get_csv_to_table_mapping,
+    get_table_schemas,
+)
+from src.extract import extract, get_public_holidays, memory_report, read_table
+from src.holidays import PublicHolidaysClient
 
 
 def test_get_public_holidays():
@@ -10,6 +22,43 @@ def test_get_public_holidays():
     assert public_holidays["date"].dtype == "datetime64[ns]"
 
 
+def test_public_holidays_client(tmp_path, monkeypatch):
+    """Test that the public holidays client fetches year ranges and reuses its
+    disk cache without network round-trips."""
+    client = PublicHolidaysClient(PUBLIC_HOLIDAYS_URL, cache_dir=str(tmp_path))
+    public_holidays = client.get_range(2017, 2018)
+    assert public_holidays["date"].dt.year.unique().tolist() == [2017, 2018]
+    assert public_holidays.shape[1] == 7
+
+    cached_client = PublicHolidaysClient(PUBLIC_HOLIDAYS_URL, cache_dir=str(tmp_path))
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("The cached years must not be requested again")
+
+    monkeypatch.setattr(cached_client.session, "get", no_network)
+    assert cached_client.get_range(2017, 2018).equals(public_holidays)
+
+
+def test_public_holidays_client_times_out(tmp_path):
+    """Test that a request to an API that never answers fails after the read
+    timeout instead of blocking."""
+    with socket.socket() as server:
+        # Connections are accepted by the backlog but never answered.
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        host, port = server.getsockname()
+        client = PublicHolidaysClient(
+            f"http://{host}:{port}",
+            cache_dir=str(tmp_path),
+            timeout=(1, 0.2),
+            retries=0,
+        )
+        start = time.perf_counter()
+        with pytest.raises(SystemExit):
+            client.get("2017")
+        assert time.perf_counter() - start < 5
+
+
 def test_extract():
     """Test the extract function."""
     csv_folder = DATASET_ROOT_PATH
@@ -17,7 +66,9 @@ def test_extract():
     public_holidays_url = PUBLIC_HOLIDAYS_URL
     dataframes = extract(csv_folder, csv_table_mapping, public_holidays_url)
     assert len(dataframes) == len(csv_table_mapping) + 1
-    assert dataframes["public_holidays"].shape == (14, 7)
+    # The holidays of every year the queries read.
+    holiday_years = dataframes["public_holidays"]["date"].dt.year.unique().tolist()
+    assert holiday_years == [2016, 2017, 2018]
     assert dataframes["olist_customers"].shape == (99441, 5)
     assert dataframes["olist_geolocation"].shape == (1000163, 5)
     assert dataframes["olist_order_items"].shape == (112650, 7)
@@ -27,3 +78,64 @@ def test_extract():
     assert dataframes["olist_products"].shape == (32951, 9)
     assert dataframes["olist_sellers"].shape == (3095, 4)
     assert dataframes["product_category_name_translation"].shape == (71, 2)
+
+
+def test_read_table_applies_schema():
+    """Test that read_table parses the csv files with the declared dtypes."""
+    table_schemas = get_table_schemas()
+    orders = read_table(
+        f"{DATASET_ROOT_PATH}/olist_orders_dataset.csv", "olist_orders", table_schemas
+    )
+    assert orders.shape == (99441, 8)
+    assert orders["order_status"].dtype == "category"
+    assert orders["order_purchase_timestamp"].dtype == "datetime64[ns]"
+    geolocation = read_table(
+        f"{DATASET_ROOT_PATH}/olist_geolocation_dataset.csv",
+        "olist_geolocation",
+        table_schemas,
+    )
+    assert geolocation["geolocation_lat"].dtype == "float32"
+    assert geolocation["geolocation_state"].dtype == "category"
+
+
+def test_memory_report():
+    """Test that the table schemas reduce the memory used by the dataframes."""
+    report = memory_report(DATASET_ROOT_PATH, get_csv_to_table_mapping())
+    assert len(report) == len(get_csv_to_table_mapping()) + 1
+    total = report[report["table"] == "TOTAL"].iloc[0]
+    assert total["after_mb"] < total["before_mb"]
+
+
+def test_extract_concurrently():
+    """Test that the concurrent extraction returns the same dataframes."""
+    csv_table_mapping = get_csv_to_table_mapping()
+    sequential = extract(DATASET_ROOT_PATH, csv_table_mapping, PUBLIC_HOLIDAYS_URL)
+    concurrent = extract(
+        DATASET_ROOT_PATH, csv_table_mapping, PUBLIC_HOLIDAYS_URL, max_workers=4
+    )
+    assert list(concurrent.keys()) == list(sequential.keys())
+    for table_name, df in sequential.items():
+        assert concurrent[table_name].equals(df)
+
+
+def test_extract_cache(tmp_path):
+    """Test that the tables read from the extract cache match the csv files."""
+    csv_table_mapping = get_csv_to_table_mapping()
+    cache_dir = str(tmp_path / "extract")
+    uncached = extract(DATASET_ROOT_PATH, csv_table_mapping, PUBLIC_HOLIDAYS_URL)
+    cold = extract(
+        DATASET_ROOT_PATH, csv_table_mapping, PUBLIC_HOLIDAYS_URL, cache_dir=cache_dir
+    )
+    warm = extract(
+        DATASET_ROOT_PATH, csv_table_mapping, PUBLIC_HOLIDAYS_URL, cache_dir=cache_dir
+    )
+    for table_name, df in uncached.items():
+        assert cold[table_name].equals(df)
+        assert warm[table_name].equals(df)
+        assert (warm[table_name].dtypes == df.dtypes).all()
+
+    # The numeric columns of a warm read are the mapped files, not copies.
+    values = warm["olist_geolocation"]["geolocation_lat"].to_numpy()
+    while not isinstance(values, np.memmap) and values.base is not None:
+        values = values.base
+    assert isinstance(values, np.memmap)
@@ -0,0 +1,476 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+
+from src.config import get_engine
+from src.extract import read_table_chunks
+from src.load import ROLLUP_TABLES, create_indexes, drop_indexes, load, stream_load
+from src.partitions import prune_partitions
+from src.snapshot import create_memory_database, restore_snapshot, save_snapshot
+
+
+def sample_dataframes() -> dict:
+    """Build a small set of dataframes with the dtypes produced by extract()."""
+    orders = pd.DataFrame(
+        {
+            "order_id": ["a", "b", "c"],
+            "order_status": pd.Categorical(["delivered", "canceled", None]),
+            "order_purchase_timestamp": pd.to_datetime(
+                ["2017-10-02 10:56:33", None, "2018-01-01 00:00:00"]
+            ),
+            "freight_value": np.array([1.5, np.nan, 3.25], dtype="float32"),
+            "order_item_id": np.array([1, 2, 3], dtype="int16"),
+        }
+    )
+    return {"orders": orders}
+
+
+def test_bulk_load_matches_to_sql():
+    """Test that the bulk load stores the same values as DataFrame.to_sql."""
+    data_frames = sample_dataframes()
+    bulk_engine = create_engine("sqlite://")
+    to_sql_engine = create_engine("sqlite://")
+    stats = load(data_frames, bulk_engine)
+    load(data_frames, to_sql_engine, method="to_sql")
+
+    assert stats["orders"].rows == 3
+    bulk = pd.read_sql("SELECT * FROM orders", bulk_engine)
+    to_sql = pd.read_sql("SELECT * FROM orders", to_sql_engine)
+    assert "index" not in bulk.columns
+    assert bulk.equals(to_sql.drop(columns=["index"]))
+
+
+def test_bulk_load_restores_pragmas(tmp_path):
+    """Test that the load-time pragmas are restored after the load."""
+    database = create_engine(f"sqlite:///{tmp_path / 'olist.db'}")
+    with database.connect() as connection:
+        before = connection.exec_driver_sql("PRAGMA journal_mode").scalar()
+    load(sample_dataframes(), database)
+    with database.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == before
+
+
+def test_stream_load_matches_load(tmp_path):
+    """Test that streaming a csv file in chunks loads the same table as load()."""
+    orders = sample_dataframes()["orders"]
+    orders = pd.concat([orders] * 1000, ignore_index=True)
+    csv_path = tmp_path / "orders.csv"
+    orders.to_csv(csv_path, index=False)
+    table_schemas = {
+        "orders": dict(
+            dtype={"order_status": "category", "freight_value": "float32"},
+            parse_dates=["order_purchase_timestamp"],
+        )
+    }
+
+    streamed_engine = create_engine("sqlite://")
+    stats = stream_load(
+        {
+            "orders": read_table_chunks(
+                str(csv_path), "orders", table_schemas, chunksize=700
+            )
+        },
+        streamed_engine,
+    )
+    loaded_engine = create_engine("sqlite://")
+    load({"orders": orders}, loaded_engine)
+
+    assert stats["orders"].rows == len(orders)
+    streamed = pd.read_sql("SELECT * FROM orders", streamed_engine)
+    loaded = pd.read_sql("SELECT * FROM orders", loaded_engine)
+    assert streamed.equals(loaded)
+
+
+def test_create_indexes():
+    """Test that the declared keys and indexes are created and validated."""
+    database = create_engine("sqlite://")
+    load(sample_dataframes(), database)
+    table_indexes = {
+        "orders": dict(primary_key=["order_id"], indexes=[["order_status"]])
+    }
+    create_indexes(database, ["orders"], table_indexes)
+    indexes = pd.read_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'orders'",
+        database,
+    )["name"].tolist()
+    assert indexes == ["pk_orders", "ix_orders_order_status"]
+
+    with pytest.raises(ValueError):
+        create_indexes(database, ["orders"], {"orders": dict(indexes=[["missing"]])})
+
+
+def test_load_adds_order_calendar_columns():
+    """Test that olist_orders gets its derived date columns as typed values."""
+    orders = pd.DataFrame(
+        {
+            "order_id": ["a", "b"],
+            "customer_id": ["c", "d"],
+            "order_status": ["delivered", "shipped"],
+            "order_purchase_timestamp": pd.to_datetime(
+                ["2017-10-02 10:56:33", "2018-01-01 23:00:00"]
+            ),
+            "order_delivered_customer_date": pd.to_datetime(
+                ["2017-10-10 21:25:13", None]
+            ),
+            "order_estimated_delivery_date": pd.to_datetime(
+                ["2017-10-18 00:00:00", "2018-01-20 00:00:00"]
+            ),
+        }
+    )
+    database = create_engine("sqlite://")
+    load({"olist_orders": orders}, database)
+    actual = pd.read_sql(
+        """SELECT typeof(purchase_year) AS year_type, purchase_year, purchase_month,
+        purchase_date, delivery_difference_days, order_purchase_epoch
+        FROM olist_orders""",
+        database,
+    )
+    assert actual["year_type"].tolist() == ["integer", "integer"]
+    assert actual["purchase_year"].tolist() == [2017, 2018]
+    assert actual["purchase_month"].tolist() == [10, 1]
+    assert actual["purchase_date"].tolist() == ["2017-10-02", "2018-01-01"]
+    assert actual["delivery_difference_days"].tolist()[0] == -8
+    assert pd.isna(actual["delivery_difference_days"].tolist()[1])
+    assert actual["order_purchase_epoch"].tolist()[0] == 1506941793
+
+
+def test_incremental_load_upserts_by_primary_key():
+    """Test that the incremental load inserts new rows, updates changed ones and
+    raises the order purchase high-water mark."""
+    orders = pd.DataFrame(
+        {
+            "order_id": ["a", "b"],
+            "customer_id": ["c", "d"],
+            "order_status": ["shipped", "delivered"],
+            "order_purchase_timestamp": pd.to_datetime(
+                ["2017-10-02 10:56:33", "2017-10-03 11:00:00"]
+            ),
+            "order_delivered_customer_date": pd.to_datetime([None, None]),
+            "order_estimated_delivery_date": pd.to_datetime(
+                ["2017-10-18 00:00:00", "2017-10-19 00:00:00"]
+            ),
+        }
+    )
+    database = create_engine("sqlite://")
+    load({"olist_orders": orders}, database)
+
+    delta = orders.copy()
+    delta.loc[0, "order_status"] = "delivered"
+    delta.loc[1, "order_id"] = "e"
+    delta.loc[1, "order_purchase_timestamp"] = pd.Timestamp("2018-01-01 00:00:00")
+    stats = load({"olist_orders": delta}, database, method="incremental")
+
+    actual = pd.read_sql(
+        "SELECT order_id, order_status FROM olist_orders ORDER BY order_id", database
+    )
+    assert stats["olist_orders"].rows == 2
+    assert actual["order_id"].tolist() == ["a", "b", "e"]
+    assert actual["order_status"].tolist() == ["delivered", "delivered", "delivered"]
+    watermark = pd.read_sql("SELECT value FROM load_watermarks", database)
+    assert watermark["value"].tolist() == ["2018-01-01 00:00:00.000000"]
+
+
+def order_dataframes() -> dict:
+    """Build small orders, items, customers and products tables, with lookups that
+    have no match."""
+    orders = pd.DataFrame(
+        {
+            "order_id": ["a", "b", "c"],
+            "customer_id": ["x", "y", "missing"],
+            "order_status": ["delivered", "canceled", "delivered"],
+            "order_purchase_timestamp": pd.to_datetime(["2017-01-01"] * 3),
+            "order_delivered_customer_date": pd.to_datetime(["2017-01-05"] * 3),
+            "order_estimated_delivery_date": pd.to_datetime(["2017-01-10"] * 3),
+        }
+    )
+    data_frames = {
+        "olist_orders": orders,
+        "olist_order_items": pd.DataFrame(
+            {
+                "order_id": ["a", "a", "b", "c"],
+                "order_item_id": [1, 2, 1, 1],
+                "product_id": ["p", "q", "p", "missing"],
+                "price": [10.0, 20.0, 30.0, 40.0],
+                "freight_value": [1.0, 2.0, 3.0, 4.0],
+            }
+        ),
+        "olist_customers": pd.DataFrame(
+            {"customer_id": ["x", "y"], "customer_state": ["SP", "RJ"]}
+        ),
+        "olist_products": pd.DataFrame(
+            {
+                "product_id": ["p", "q"],
+                "product_category_name": ["pet", None],
+                "product_weight_g": [100.0, 200.0],
+            }
+        ),
+        "product_category_name_translation": pd.DataFrame(
+            {
+                "product_category_name": ["pet"],
+                "product_category_name_english": ["pet_shop"],
+            }
+        ),
+    }
+    return data_frames
+
+
+def test_load_builds_delivered_order_items():
+    """Test that the fact table keeps the delivered items only, and that it
+    answers like the join of the loaded tables."""
+    data_frames = order_dataframes()
+    database = create_engine("sqlite://")
+    stats = load(data_frames, database)
+    assert stats["delivered_order_items"].rows == 3
+
+    revenue_per_state = pd.read_sql(
+        "SELECT customer_state, SUM(revenue) AS revenue FROM delivered_order_items "
+        "WHERE customer_id IS NOT NULL GROUP BY customer_state",
+        database,
+    )
+    assert revenue_per_state.to_dict("records") == [
+        {"customer_state": "SP", "revenue": 33.0}
+    ]
+    categories = pd.read_sql(
+        "SELECT product_category_name_english, SUM(revenue) AS revenue "
+        "FROM delivered_order_items WHERE product_category_name_english IS NOT NULL "
+        "GROUP BY product_category_name_english",
+        database,
+    )
+    assert categories.to_dict("records") == [
+        {"product_category_name_english": "pet_shop", "revenue": 11.0}
+    ]
+
+
+def test_incremental_load_refreshes_only_the_changed_rollup_days():
+    """Test that an incremental load recomputes the purchase days it wrote to, and
+    that the rollups end up equal to the ones of a full load."""
+    data_frames = order_dataframes()
+    orders = data_frames["olist_orders"]
+    orders["order_purchase_timestamp"] = pd.to_datetime(
+        ["2017-01-01", "2017-01-02", "2017-01-03"]
+    )
+    database = create_engine("sqlite://")
+    load(data_frames, database, method="incremental")
+
+    new_order = orders.iloc[[0]].assign(
+        order_id="d", order_purchase_timestamp=pd.to_datetime(["2017-01-04"])
+    )
+    delta = {
+        "olist_orders": pd.concat(
+            [orders[orders["order_id"] == "b"].assign(order_status="delivered"),
+             new_order]
+        ),
+        "olist_order_items": pd.DataFrame(
+            {
+                "order_id": ["d"],
+                "order_item_id": [1],
+                "product_id": ["p"],
+                "price": [5.0],
+                "freight_value": [0.5],
+            }
+        ),
+    }
+    stats = load(delta, database, method="incremental")
+    # Day 2017-01-02 changed status and 2017-01-04 is new, one row each.
+    assert stats["daily_order_rollup"].rows == 2
+    assert stats["daily_item_rollup"].rows == 2
+
+    merged = dict(
+        data_frames,
+        olist_orders=pd.concat(
+            [orders[orders["order_id"] != "b"], delta["olist_orders"]]
+        ),
+        olist_order_items=pd.concat(
+            [data_frames["olist_order_items"], delta["olist_order_items"]]
+        ),
+    )
+    expected_database = create_engine("sqlite://")
+    load(merged, expected_database)
+    for rollup_table in ROLLUP_TABLES:
+        query = f"SELECT * FROM {rollup_table} ORDER BY 1, 2, 3, 4, 5, 6"
+        actual = pd.read_sql(query, database)
+        expected = pd.read_sql(query, expected_database)
+        pd.testing.assert_frame_equal(
+            actual.sort_values(list(actual.columns), ignore_index=True),
+            expected.sort_values(list(expected.columns), ignore_index=True),
+        )
+
+
+def test_incremental_load_of_every_table_refreshes_only_the_changed_days():
+    """Test that loading every table again, as the pipeline does, recomputes only
+    the days of the new orders while the lookup tables did not change, and
+    rebuilds the rollups once a lookup table changed."""
+    data_frames = order_dataframes()
+    database = create_engine("sqlite://")
+    load(data_frames, database, method="incremental")
+
+    data_frames["olist_orders"] = pd.concat(
+        [
+            data_frames["olist_orders"],
+            data_frames["olist_orders"]
+            .iloc[[0]]
+            .assign(
+                order_id="d", order_purchase_timestamp=pd.to_datetime(["2017-02-01"])
+            ),
+        ],
+        ignore_index=True,
+    )
+    data_frames["olist_order_items"] = pd.concat(
+        [
+            data_frames["olist_order_items"],
+            data_frames["olist_order_items"].iloc[[0]].assign(order_id="d"),
+        ],
+        ignore_index=True,
+    )
+    stats = load(data_frames, database, method="incremental")
+    assert stats["olist_customers"].rows == 0
+    assert stats["daily_order_rollup"].rows == 1
+    assert stats["daily_item_rollup"].rows == 1
+
+    data_frames["olist_customers"] = data_frames["olist_customers"].assign(
+        customer_state=["SP", "MG"]
+    )
+    stats = load(data_frames, database, method="incremental")
+    assert stats["olist_customers"].rows == 1
+    assert "delivered_order_items" in stats
+
+    expected_database = create_engine("sqlite://")
+    load(data_frames, expected_database)
+    for rollup_table in ROLLUP_TABLES:
+        query = f"SELECT * FROM {rollup_table}"
+        actual = pd.read_sql(query, database)
+        expected = pd.read_sql(query, expected_database)
+        pd.testing.assert_frame_equal(
+            actual.sort_values(list(actual.columns), ignore_index=True),
+            expected.sort_values(list(expected.columns), ignore_index=True),
+        )
+
+
+def test_load_partitions_orders_by_purchase_year(tmp_path):
+    """Test that the partitioned tables are read through the views, that the old
+    years are frozen and that year-scoped queries only read their partitions."""
+    data_frames = order_dataframes()
+    data_frames["olist_orders"]["order_purchase_timestamp"] = pd.to_datetime(
+        ["2016-10-01", "2017-01-01", "2017-02-01"]
+    )
+    path = str(tmp_path / "olist.db")
+    partitions_dir = str(tmp_path / "partitions")
+    database = get_engine(path)
+    load(data_frames, database, partitions_dir=partitions_dir)
+
+    reader = get_engine(path, read_only=True)
+    with reader.connect() as connection:
+        schemas = [
+            row[1]
+            for row in connection.exec_driver_sql("PRAGMA database_list").fetchall()
+        ]
+        assert schemas == ["main", "temp", "p2016", "p2017"]
+        assert connection.exec_driver_sql(
+            "SELECT COUNT(*) FROM olist_order_items"
+        ).scalar() == 4
+        assert connection.exec_driver_sql(
+            "SELECT COUNT(*) FROM p2016.olist_order_items"
+        ).scalar() == 2
+
+    query = prune_partitions(
+        reader, text("SELECT COUNT(*) FROM olist_orders"), 2017, 2017
+    )
+    assert "p2017" in query.text and "p2016" not in query.text
+    with reader.connect() as connection:
+        assert connection.execute(query).scalar() == 2
+
+    # The statistics skip the frozen partitions, attached read only.
+    drop_indexes(database, ["olist_customers"])
+    create_indexes(database, ["olist_customers"])
+    create_indexes(database, ["olist_customers"], analyze=False)
+    with reader.connect() as connection:
+        assert connection.exec_driver_sql(
+            "SELECT COUNT(*) FROM p2016.sqlite_stat1"
+        ).scalar()
+
+    # Only the engines of get_engine() attach the partitions.
+    other_engine = create_engine(f"sqlite:///{path}")
+    with other_engine.connect() as connection:
+        assert [
+            row[1]
+            for row in connection.exec_driver_sql("PRAGMA database_list").fetchall()
+        ] == ["main"]
+    other_engine.dispose()
+
+    # 2016 is frozen: its partition can't be written, nor loaded with other rows.
+    reader.dispose()
+    with pytest.raises(Exception):
+        with database.begin() as connection:
+            connection.exec_driver_sql("DELETE FROM p2016.olist_orders")
+    load(data_frames, database)
+    data_frames["olist_orders"]["order_purchase_timestamp"] = pd.to_datetime(
+        ["2016-10-01", "2016-11-01", "2017-02-01"]
+    )
+    with pytest.raises(ValueError):
+        load(data_frames, database)
+
+
+def test_incremental_load_of_partitions_keeps_frozen_rows_and_triggers(tmp_path):
+    """Test that incremental loads of a partitioned database still refresh the
+    rollups by day, and that an update of a row of a frozen year is rejected."""
+    data_frames = order_dataframes()
+    orders = data_frames["olist_orders"]
+    orders["order_purchase_timestamp"] = pd.to_datetime(
+        ["2016-10-01", "2017-01-01", "2017-02-01"]
+    )
+    database = get_engine(str(tmp_path / "olist.db"))
+    load(data_frames, database, partitions_dir=str(tmp_path / "partitions"))
+
+    new_order = orders.iloc[[2]].assign(order_id="d")
+    stats = load({"olist_orders": new_order}, database, method="incremental")
+    assert stats["daily_order_rollup"].rows == 1
+    assert "p2017.olist_orders" in stats
+
+    # Same count, other content: the update would be lost with the partition.
+    updated_order = orders.iloc[[0]].assign(order_status="canceled")
+    with pytest.raises(ValueError):
+        load({"olist_orders": updated_order}, database, method="incremental")
+
+
+def test_snapshot_round_trip(tmp_path):
+    """Test that an in-memory database is persisted and restored unchanged."""
+    database = create_memory_database()
+    load(sample_dataframes(), database)
+    path = str(tmp_path / "olist.db")
+    save_snapshot(database, path)
+    assert [p.name for p in tmp_path.iterdir()] == ["olist.db"]
+
+    restored = restore_snapshot(path)
+    query = "SELECT * FROM orders ORDER BY order_id"
+    assert pd.read_sql(query, restored).equals(pd.read_sql(query, database))
+
+    # Saving again writes over the file, seen by the readers still connected.
+    reader = get_engine(path, read_only=True)
+    assert len(pd.read_sql(query, reader)) == 3
+    with database.begin() as connection:
+        connection.exec_driver_sql("DELETE FROM orders WHERE order_id = 'a'")
+    save_snapshot(database, path)
+    assert len(pd.read_sql(query, reader)) == 2
+    assert len(pd.read_sql(query, restore_snapshot(path))) == 2
+    reader.dispose()
+
+    with pytest.raises(FileNotFoundError):
+        restore_snapshot(str(tmp_path / "missing.db"))
+
+
+def test_get_engine_sets_connection_pragmas(tmp_path):
+    """Test that writers use WAL and readers cannot write."""
+    path = str(tmp_path / "olist.db")
+    writer = get_engine(path)
+    load(sample_dataframes(), writer)
+    with writer.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert connection.exec_driver_sql("PRAGMA temp_store").scalar() == 2
+
+    reader = get_engine(path, read_only=True)
+    with reader.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA query_only").scalar() == 1
+        assert connection.exec_driver_sql("SELECT COUNT(*) FROM orders").scalar() == 3
+        with pytest.raises(Exception):
+            connection.exec_driver_sql("DELETE FROM orders")
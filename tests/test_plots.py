@@ -0,0 +1,64 @@
+import os
+
+import pandas as pd
+import pytest
+
+matplotlib = pytest.importorskip("matplotlib")
+pytest.importorskip("plotly")
+pytest.importorskip("seaborn")
+
+import matplotlib.pyplot as plt  # noqa: E402
+
+from src.plots import (  # noqa: E402
+    plot_delivery_date_difference,
+    plot_global_amount_order_status,
+    plot_revenue_per_state,
+    render_plot,
+)
+
+
+def test_render_plot_writes_the_charts(tmp_path):
+    """Test that render_plot saves matplotlib charts and writes plotly charts into
+    the output folder with the Agg backend, from the columns of the query
+    results."""
+    output_dir = str(tmp_path / "charts")
+    order_status = pd.DataFrame(
+        {"order_status": ["delivered", "canceled"], "Ammount": [3, 1]}
+    )
+    path, seconds = render_plot(
+        plot_global_amount_order_status, order_status, (), output_dir
+    )
+    assert matplotlib.get_backend().lower() == "agg"
+    assert path == os.path.join(output_dir, "global_amount_order_status.png")
+    assert os.path.getsize(path) > 0
+    assert seconds >= 0
+
+    delivery_difference = pd.DataFrame(
+        {"State": ["SP", "RJ"], "Delivery_Difference": [10.5, 8.0]}
+    )
+    path, _ = render_plot(
+        plot_delivery_date_difference, delivery_difference, (), output_dir
+    )
+    assert os.path.getsize(path) > 0
+
+    revenue = pd.DataFrame({"customer_state": ["SP", "RJ"], "Revenue": [100.0, 50.0]})
+    path, _ = render_plot(plot_revenue_per_state, revenue, (), output_dir)
+    assert path == os.path.join(output_dir, "revenue_per_state.html")
+    with open(path) as f:
+        assert "plotly" in f.read()
+
+
+def test_plots_show_by_default(tmp_path, monkeypatch):
+    """Test that a plot called without an output folder shows the chart and writes
+    no file."""
+    shown = []
+    monkeypatch.setattr(plt, "show", lambda: shown.append(True))
+    monkeypatch.chdir(tmp_path)
+    matplotlib.use("Agg")
+    order_status = pd.DataFrame(
+        {"order_status": ["delivered", "canceled"], "Ammount": [3, 1]}
+    )
+    assert plot_global_amount_order_status(order_status) is None
+    assert shown == [True]
+    assert list(tmp_path.iterdir()) == []
+    plt.close("all")
@@ -0,0 +1,134 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from src.checkpoints import CheckpointStore
+from src.scheduler import Task, TaskTiming, critical_path, run_tasks
+
+
+def test_run_tasks_starts_each_task_when_its_inputs_finished():
+    """Test that a task runs as soon as its own inputs finished, concurrently with
+    slower unrelated tasks, and that main thread tasks stay on the main thread."""
+    fast_done = threading.Event()
+
+    def slow():
+        # Only finishes once the plot of the fast branch ran.
+        assert fast_done.wait(5)
+        return 1
+
+    def plot(value):
+        assert threading.current_thread() is threading.main_thread()
+        fast_done.set()
+        return value * 10
+
+    tasks = [
+        Task("slow", slow),
+        Task("fast", lambda: 2),
+        Task("plot", plot, ("fast",), main_thread=True),
+        Task("sum", lambda a, b: a + b, ("slow", "plot")),
+    ]
+    results, timings = run_tasks(tasks, max_workers=2)
+
+    assert results == {"slow": 1, "fast": 2, "plot": 20, "sum": 21}
+    assert timings["plot"].end <= timings["slow"].end
+    assert timings["sum"].start >= timings["slow"].end
+
+
+def test_run_tasks_rejects_invalid_graphs_and_raises_task_errors():
+    """Test that cycles and unknown inputs are rejected before anything runs, and
+    that a failing task stops the run."""
+    with pytest.raises(ValueError):
+        run_tasks([Task("a", lambda b: b, ("b",)), Task("b", lambda a: a, ("a",))])
+    with pytest.raises(ValueError):
+        run_tasks([Task("a", lambda b: b, ("missing",))])
+
+    ran = []
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        run_tasks([Task("fail", fail), Task("after", ran.append, ("fail",))])
+    assert ran == []
+
+
+def test_critical_path_follows_the_longest_chain():
+    """Test that the critical path is the chain with the longest total time."""
+    tasks = [
+        Task("extract_small", None),
+        Task("extract_big", None),
+        Task("load", None, ("extract_small", "extract_big")),
+        Task("query", None, ("load",)),
+        Task("other_query", None, ("extract_small",)),
+    ]
+    timings = {
+        "extract_small": TaskTiming(0.0, 1.0),
+        "extract_big": TaskTiming(0.0, 3.0),
+        "load": TaskTiming(3.0, 4.0),
+        "query": TaskTiming(4.0, 4.5),
+        "other_query": TaskTiming(1.0, 4.2),
+    }
+    assert critical_path(tasks, timings) == ["extract_big", "load", "query"]
+
+
+def test_run_tasks_resumes_from_checkpoints(tmp_path):
+    """Test that a second run resumes the tasks whose inputs did not change, reads
+    back their outputs only when needed, and that force and skip select tasks."""
+    calls = []
+    database = {"orders": 3}
+
+    def build_tasks(csv_key="v1"):
+        def step(name, function):
+            def run(*inputs):
+                calls.append(name)
+                return function(*inputs)
+
+            return run
+
+        def load(rows):
+            database["orders"] = rows
+            return dict(database)
+
+        return [
+            Task("extract", step("extract", lambda: 3), key=csv_key),
+            Task(
+                "load",
+                step("load", load),
+                ("extract",),
+                key="load",
+                restore=lambda: dict(database),
+            ),
+            Task(
+                "query",
+                step("query", lambda tables: pd.DataFrame({"n": [tables["orders"]]})),
+                ("load",),
+                key="query",
+                persist=True,
+            ),
+            Task("plot", step("plot", lambda df: None), ("query",), key="plot"),
+        ]
+
+    checkpoints = CheckpointStore(str(tmp_path))
+    run_tasks(build_tasks(), checkpoints=checkpoints)
+    assert calls == ["extract", "load", "query", "plot"]
+
+    calls.clear()
+    results, _ = run_tasks(build_tasks(), checkpoints=CheckpointStore(str(tmp_path)))
+    assert calls == []
+    assert results["query"].equals(pd.DataFrame({"n": [3]}))
+    assert "extract" not in results
+
+    # A changed database reloads it, from an extract computed again.
+    database["orders"] = 0
+    calls.clear()
+    run_tasks(build_tasks(), checkpoints=checkpoints)
+    assert calls == ["extract", "load"]
+
+    calls.clear()
+    run_tasks(build_tasks(), checkpoints=checkpoints, force=["query"], skip=["plot"])
+    assert calls == ["query"]
+
+    calls.clear()
+    run_tasks(build_tasks(csv_key="v2"), checkpoints=checkpoints)
+    assert calls == ["extract", "load"]
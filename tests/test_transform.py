@@ -1,10 +1,18 @@
 import pandas as pd
+import pytest
 from pytest import fixture
-from src.config import QUERY_RESULTS_ROOT_PATH, DATASET_ROOT_PATH, PUBLIC_HOLIDAYS_URL
-from sqlalchemy import create_engine
+from src.config import (
+    QUERY_RESULTS_ROOT_PATH,
+    DATASET_ROOT_PATH,
+    PUBLIC_HOLIDAYS_URL,
+)
 from sqlalchemy.engine.base import Engine
 import json
 import math
+import os
+import subprocess
+import sys
+from pathlib import Path
 from src.transform import (
     query_delivery_date_difference,
     query_global_ammount_order_status,
@@ -17,9 +25,22 @@ from src.transform import (
     query_freight_value_weight_relationship,
 )
 from src.load import load
+from src.query_cache import configure_query_cache
 from src.extract import extract
-from src.config import get_csv_to_table_mapping
-from src.transform import QueryResult
+from src.config import get_csv_to_table_mapping, get_engine
+from src import transform_pandas
+from src.transform import (
+    QueryEnum,
+    QueryResult,
+    QUERY_RESULT_SCHEMAS,
+    check_required_tables,
+    fetch_columns,
+    get_table_names,
+    query_orders_per_day_and_holidays,
+    query_top_k_revenue_categories,
+    read_query,
+    run_queries,
+)
 
 TOLERANCE = 0.1
 
@@ -40,15 +61,25 @@ def float_vectors_are_close(a: list, b: list, tolerance: float = TOLERANCE) -> b
     return all([math.isclose(a[i], b[i], abs_tol=tolerance) for i in range(len(a))])
 
 
-@fixture(scope="session", autouse=True)
-def database() -> Engine:
-    """Initialize the database for testing."""
-    engine = create_engine("sqlite://")
+@fixture(scope="session")
+def data_frames(tmp_path_factory) -> dict:
+    """Extract the dataframes for testing."""
     csv_folder = DATASET_ROOT_PATH
     public_holidays_url = PUBLIC_HOLIDAYS_URL
     csv_table_mapping = get_csv_to_table_mapping()
-    csv_dataframes = extract(csv_folder, csv_table_mapping, public_holidays_url)
-    load(data_frames=csv_dataframes, database=engine)
+    return extract(
+        csv_folder,
+        csv_table_mapping,
+        public_holidays_url,
+        cache_dir=str(tmp_path_factory.mktemp("extract")),
+    )
+
+
+@fixture(scope="session", autouse=True)
+def database(data_frames: dict) -> Engine:
+    """Initialize the database for testing."""
+    engine = get_engine(None)
+    load(data_frames=data_frames, database=engine)
     return engine
 
 
@@ -206,3 +237,274 @@ def test_query_get_freight_value_weight_relationship(database: Engine):
     actual: QueryResult = query_freight_value_weight_relationship(database)
     expected = read_query_result(query_name)
     assert pandas_to_json_object(actual.result) == expected
+
+
+def test_run_queries_concurrently(database: Engine, tmp_path):
+    file_database = get_engine(str(tmp_path / "olist.db"))
+    source, target = database.raw_connection(), file_database.raw_connection()
+    source.connection.backup(target.connection)
+    target.close()
+
+    reader = get_engine(str(tmp_path / "olist.db"), read_only=True)
+    sequential = run_queries(reader)
+    configure_query_cache()
+    concurrent = run_queries(reader, max_workers=4)
+    assert list(concurrent.keys()) == [query.value for query in QueryEnum]
+    assert list(concurrent.keys()) == list(sequential.keys())
+    for query_name, result in sequential.items():
+        assert concurrent[query_name].equals(result)
+
+
+def test_schema_catalog_is_invalidated_by_load(tmp_path):
+    """The catalog is read once and refreshed after load() changes the tables."""
+    file_database = get_engine(str(tmp_path / "olist.db"))
+    customers = pd.DataFrame({"customer_id": ["c"], "customer_state": ["SP"]})
+    load({"olist_customers": customers}, file_database, method="to_sql")
+
+    table_names = get_table_names(file_database)
+    assert "olist_customers" in table_names
+    assert get_table_names(file_database) is table_names
+    try:
+        check_required_tables(file_database, QueryEnum.DELIVERY_DATE_DIFFERECE)
+    except ValueError as e:
+        assert "olist_orders" in str(e)
+    else:
+        raise AssertionError("Missing tables were not detected")
+
+    load({"olist_sellers": pd.DataFrame({"seller_id": ["s"]})}, file_database)
+    assert "olist_sellers" in get_table_names(file_database)
+
+    # Tables created outside of load() are found on a miss.
+    with file_database.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE olist_orders (order_id TEXT)")
+    check_required_tables(file_database, QueryEnum.DELIVERY_DATE_DIFFERECE)
+
+
+def test_query_cache_hits_until_load(tmp_path):
+    """Repeated queries are served from the cache until load() changes a table."""
+    file_database = get_engine(str(tmp_path / "olist.db"))
+    customers = pd.DataFrame({"customer_id": ["c"], "customer_state": ["SP"]})
+    orders = pd.DataFrame(
+        {
+            "order_id": ["a", "b"],
+            "customer_id": ["c", "c"],
+            "order_status": ["delivered", "canceled"],
+            "order_purchase_timestamp": pd.to_datetime(["2017-01-01", "2017-02-01"]),
+            "order_delivered_customer_date": pd.to_datetime(["2017-01-05", None]),
+            "order_estimated_delivery_date": pd.to_datetime(
+                ["2017-01-10", "2017-02-10"]
+            ),
+        }
+    )
+    load({"olist_customers": customers, "olist_orders": orders}, file_database)
+    query_cache = configure_query_cache(max_entries=1, spill=True, spill_dir=tmp_path)
+
+    first = query_global_ammount_order_status(file_database)
+    second = query_global_ammount_order_status(file_database)
+    assert query_cache.misses == 1 and query_cache.hits == 1
+    assert second.result.equals(first.result)
+
+    # Evicted results are spilled to disk and still hit.
+    query_delivery_date_difference(file_database)
+    assert list(tmp_path.glob("*.pkl"))
+    query_global_ammount_order_status(file_database)
+    assert query_cache.hits == 2
+
+    load({"olist_orders": orders.head(1)}, file_database)
+    third = query_global_ammount_order_status(file_database)
+    assert query_cache.misses == 3
+    assert third.result["Ammount"].sum() == 1
+    configure_query_cache()
+
+
+def test_query_cache_sees_loads_of_other_processes(tmp_path):
+    """A reader engine misses the query cache after another process loaded the
+    database file, although nothing was loaded in its own process."""
+    database_path = str(tmp_path / "olist.db")
+    orders = pd.DataFrame(
+        {
+            "order_id": ["a", "b"],
+            "customer_id": ["c", "c"],
+            "order_status": ["delivered", "canceled"],
+            "order_purchase_timestamp": pd.to_datetime(["2017-01-01", "2017-02-01"]),
+            "order_delivered_customer_date": pd.to_datetime(["2017-01-05", None]),
+            "order_estimated_delivery_date": pd.to_datetime(
+                ["2017-01-10", "2017-02-10"]
+            ),
+        }
+    )
+    customers = pd.DataFrame({"customer_id": ["c"], "customer_state": ["SP"]})
+    loader = get_engine(database_path)
+    load({"olist_customers": customers, "olist_orders": orders}, loader)
+    reader = get_engine(database_path)
+    query_cache = configure_query_cache()
+    assert query_global_ammount_order_status(reader).result["Ammount"].sum() == 2
+    assert query_global_ammount_order_status(reader).result["Ammount"].sum() == 2
+    assert query_cache.misses == 1
+
+    # Leaving WAL mode for the load needs the only connection to the file.
+    loader.dispose()
+    reader.dispose()
+    orders.head(1).to_pickle(tmp_path / "orders.pkl")
+    writer = (
+        "import pandas as pd\n"
+        "from src.config import get_engine\n"
+        "from src.load import load\n"
+        f"orders = pd.read_pickle({str(tmp_path / 'orders.pkl')!r})\n"
+        f"load({{'olist_orders': orders}}, get_engine({database_path!r}))\n"
+    )
+    subprocess.run(
+        [sys.executable, "-c", writer],
+        cwd=Path(__file__).parent.parent,
+        check=True,
+    )
+    assert query_global_ammount_order_status(reader).result["Ammount"].sum() == 1
+    assert query_cache.misses == 2
+    configure_query_cache()
+
+
+def test_top_k_revenue_categories_share_one_ranking(database: Engine):
+    """Top and bottom categories of any size are slices of one cached ranking."""
+    query_cache = configure_query_cache()
+    top_10 = query_top_10_revenue_categories(database).result
+    least_10 = query_top_10_least_revenue_categories(database).result
+    assert query_cache.misses == 1
+
+    top_3 = query_top_k_revenue_categories(database, 3)
+    assert top_3.query == "top_3_revenue_categories"
+    assert top_3.result.equals(top_10.head(3))
+    least_3 = query_top_k_revenue_categories(database, 3, least=True).result
+    assert least_3.equals(least_10.head(3))
+    assert least_3["Revenue"].is_monotonic_increasing
+    assert query_cache.misses == 1
+
+    with pytest.raises(ValueError):
+        query_top_k_revenue_categories(database, -1)
+
+
+def test_pandas_backend_matches_query_results(data_frames: dict):
+    """The in-memory backend computes every query result without a database."""
+    results = transform_pandas.run_queries(data_frames)
+    assert list(results.keys()) == [query.value for query in QueryEnum]
+
+    for query_name, result in results.items():
+        if not os.path.exists(f"{QUERY_RESULTS_ROOT_PATH}/{query_name}.json"):
+            continue
+        actual = pandas_to_json_object(result)
+        expected = read_query_result(query_name)
+        assert len(actual) == len(expected), query_name
+        assert set(actual[0].keys()) == set(expected[0].keys()), query_name
+        for column in expected[0].keys():
+            actual_values = [obj[column] for obj in actual]
+            expected_values = [obj[column] for obj in expected]
+            if any(isinstance(value, float) for value in expected_values):
+                assert float_vectors_are_close(
+                    [value or 0.0 for value in actual_values],
+                    [value or 0.0 for value in expected_values],
+                ), (query_name, column)
+            else:
+                assert actual_values == expected_values, (query_name, column)
+
+
+def test_revenue_per_state_backends_agree_on_missing_customers():
+    """Both backends leave out the revenue of orders without a customer state,
+    whether the customer is missing or has no state."""
+    orders = pd.DataFrame(
+        {
+            "order_id": ["a", "b", "c"],
+            "customer_id": ["known", "orphan", "stateless"],
+            "order_status": ["delivered"] * 3,
+            "order_purchase_timestamp": pd.to_datetime(["2017-01-01"] * 3),
+            "order_delivered_customer_date": pd.to_datetime(["2017-01-05"] * 3),
+            "order_estimated_delivery_date": pd.to_datetime(["2017-01-10"] * 3),
+        }
+    )
+    data_frames = {
+        "olist_customers": pd.DataFrame(
+            {"customer_id": ["known", "stateless"], "customer_state": ["SP", None]}
+        ),
+        "olist_orders": orders,
+        "olist_order_items": pd.DataFrame(
+            {
+                "order_id": ["a", "b", "c"],
+                "order_item_id": [1, 1, 1],
+                "product_id": ["p", "p", "p"],
+                "price": [10.0, 20.0, 30.0],
+                "freight_value": [1.0, 2.0, 3.0],
+            }
+        ),
+        "olist_products": pd.DataFrame(
+            {
+                "product_id": ["p"],
+                "product_category_name": ["beleza"],
+                "product_weight_g": [100.0],
+            }
+        ),
+        "product_category_name_translation": pd.DataFrame(
+            {
+                "product_category_name": ["beleza"],
+                "product_category_name_english": ["beauty"],
+            }
+        ),
+    }
+    engine = get_engine(None)
+    load(data_frames, engine)
+    expected = pandas_to_json_object(query_revenue_per_state(engine).result)
+    actual = pandas_to_json_object(
+        transform_pandas.query_revenue_per_state(data_frames).result
+    )
+    assert actual == expected == [{"customer_state": "SP", "Revenue": 11.0}]
+
+
+def test_fetch_columns_matches_read_sql(database: Engine):
+    """The NumPy column fetcher returns what read_sql returns, dtypes included."""
+    query_enum = QueryEnum.GET_FREIGHT_VALUE_WEIGHT_RELATIONSHIP
+    query = read_query(query_enum.value)
+    expected = pd.read_sql(query, database)
+    actual = fetch_columns(database, query, QUERY_RESULT_SCHEMAS[query_enum], 100)
+    assert actual.equals(expected)
+
+    with pytest.raises(ValueError):
+        fetch_columns(database, query, {"total_weight": "float64"})
+
+
+def test_orders_per_day_flags_holidays_in_sql(database: Engine, monkeypatch):
+    """Holidays are joined from the loaded table, without an HTTP request, and the
+    year range only selects the purchase days of those years."""
+    import requests
+
+    def no_request(*args, **kwargs):
+        raise AssertionError("the query must not request the public holidays")
+
+    monkeypatch.setattr(requests, "get", no_request)
+    result = query_orders_per_day_and_holidays(database, 2017, 2017).result
+    assert result["holiday"].dtype == bool
+    assert result["holiday"].any()
+
+    years = pd.to_datetime(result["date"], unit="ms").dt.year
+    assert set(years) == {2017}
+    all_years = query_orders_per_day_and_holidays(database, 2016, 2018).result
+    assert len(all_years) > len(result)
+    # The holidays of the other years are loaded and flagged too.
+    holiday_years = pd.to_datetime(all_years["date"], unit="ms")[all_years["holiday"]]
+    assert 2018 in set(holiday_years.dt.year)
+
+
+def test_month_year_pivots_follow_the_year_range(database: Engine):
+    """The pivoted YearNNNN columns are generated from the bound year range."""
+    default = query_revenue_by_month_year(database).result
+    revenue = query_revenue_by_month_year(database, 2017, 2019).result
+    assert list(revenue.columns) == [
+        "month_no", "month", "Year2017", "Year2018", "Year2019"
+    ]  # fmt: skip
+    assert revenue["Year2017"].equals(default["Year2017"])
+    assert (revenue["Year2019"] == 0.0).all()
+
+    times = query_real_vs_estimated_delivered_time(database, 2018, 2019).result
+    assert list(times.columns[2:]) == [
+        "Year2018_real_time",
+        "Year2019_real_time",
+        "Year2018_estimated_time",
+        "Year2019_estimated_time",
+    ]
+    assert times["Year2019_real_time"].isna().all()